@@ -24,6 +24,13 @@ def pytest_addoption(parser):
         default=False,
         help="Enable GPU tests",
     )
+    parser.addoption(
+        "--bench",
+        action="store_true",
+        dest="bench",
+        default=False,
+        help="Enable benchmarks",
+    )
     parser.addoption(
         "-T",
         action="append",
@@ -127,6 +134,10 @@ def pytest_runtest_setup(item):
     if gpu and not item.config.option.gpu:
         pytest.skip("GPU tests are not enabled. Use --gpu to enable them.")
 
+    bench = any(mark for mark in item.iter_markers(name="bench"))
+    if bench and not item.config.option.bench:
+        pytest.skip("Benchmarks are not enabled. Use --bench to enable them.")
+
     item._ctxms = [fn(*args) for fn, args in _context_managers]
     for cm in item._ctxms:
         cm.__enter__()
@@ -10,6 +10,7 @@ from ..utils import intern
 from .data import (
     ABSENT,
     ANYTHING,
+    SHAPE,
     TYPE,
     VALUE,
     AbstractADT,
@@ -486,6 +487,29 @@ def broaden(self, d: TrackDict, **kwargs):  # noqa: D417
     return {k: k.broaden(v, self, **kwargs) for k, v in d.items()}
 
 
+@abstract_clone.variant
+def broaden_dims(self, x: AbstractArray, *, dims):  # noqa: D417
+    """Broaden some dimensions in the shapes of arrays to ANYTHING.
+
+    Arguments:
+        x: The abstract data to clone.
+        dims: The indices of the dimensions to broaden. Negative indices
+            count from the last dimension. Dimensions that an array does
+            not have are ignored.
+
+    """
+    shp = x.xshape()
+    if shp is not ANYTHING:
+        n = len(shp)
+        shp = tuple(
+            ANYTHING if i in dims or i - n in dims else d
+            for i, d in enumerate(shp)
+        )
+    return (yield AbstractArray)(
+        self(x.element, dims=dims), {**self(x.values, dims=dims), SHAPE: shp}
+    )
+
+
 ###############
 # Sensitivity #
 ###############
@@ -763,6 +787,7 @@ __all__ = [
     "abstract_check",
     "abstract_clone",
     "broaden",
+    "broaden_dims",
     "build_value",
     "collapse_options",
     "concretize_abstract",
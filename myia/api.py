@@ -1,20 +1,185 @@
 """User-friendly interfaces to Myia machinery."""
 
 import inspect
+import itertools
+import multiprocessing
 import os
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 
-from .abstract import ABSENT, find_aliases, from_value
-from .compile.backends import Backend, load_backend
+import numpy as np
+
+from .abstract import (
+    ABSENT,
+    broaden_dims,
+    find_aliases,
+    from_value,
+    ndarray_aliasable,
+)
+from .compile.backends import Backend, load_backend, parse_default
 from .compile.utils import BackendValue
-from .pipeline import standard_pipeline
+from .ir import Graph, manage
+from .pipeline import (
+    CompilationCache,
+    deserialize,
+    serialize,
+    standard_pipeline,
+    steps,
+)
+from .pipeline.cache import cache_fields
+from .pipeline.pipeline import _nameof
+from .profile import CompileProfiler
 from .simplify_types import to_canonical
 from .utils import (
     MultiTrace,
     MyiaInputTypeError,
+    MyiaShapeError,
     MyiaTypeError,
     keyword_decorator,
     resolve_tracers,
 )
+from .vmap import unbatch_abstract
+
+#######################
+# Argument signatures #
+#######################
+
+
+# Number of concrete argspecs remembered to count the recompilations avoided
+# by dynamic_dims
+_max_dynamic_seen = 1024
+
+
+_scalar_types = {
+    bool,
+    int,
+    float,
+    type(None),
+    np.int8,
+    np.int16,
+    np.int32,
+    np.int64,
+    np.uint8,
+    np.uint16,
+    np.uint32,
+    np.uint64,
+    np.float16,
+    np.float32,
+    np.float64,
+}
+
+
+def _signature(x, ids):
+    """Compute a cheap, hashable key for the abstract type of x.
+
+    Two values with the same signature are guaranteed to have the same
+    broadened abstract type, but the converse is not true. None is returned
+    for values that cannot be handled cheaply.
+
+    Arguments:
+        x: The value to compute a signature for.
+        ids: A dict used to number arrays in order of appearance, so that
+            aliasing is reflected in the signature, or None if aliasing is
+            not tracked.
+
+    """
+    t = type(x)
+    if t in _scalar_types:
+        return t
+    elif t is np.ndarray:
+        if ids is None:
+            return (t, x.dtype, x.shape)
+        else:
+            return (t, x.dtype, x.shape, ids.setdefault(id(x), len(ids)))
+    elif t is tuple or t is list:
+        sig = [t]
+        for elem in x:
+            s = _signature(elem, ids)
+            if s is None:
+                return None
+            sig.append(s)
+        return tuple(sig)
+    elif t is dict:
+        sig = [t]
+        for k, v in x.items():
+            s = _signature(v, ids)
+            if s is None or type(k) is not str:
+                return None
+            sig.append((k, s))
+        return tuple(sig)
+    elif t is str:
+        return (t, x)
+    elif hasattr(t, "__dataclass_fields__"):
+        sig = [t]
+        for name in t.__dataclass_fields__:
+            s = _signature(getattr(x, name), ids)
+            if s is None:
+                return None
+            sig.append(s)
+        return tuple(sig)
+    else:
+        return None
+
+
+###########################
+# Parallel precompilation #
+###########################
+
+
+# Jobs for the workers of MyiaFunction.precompile, which inherit them when
+# they are forked. Each call to precompile registers its jobs under its own
+# key, so that calls from several threads do not clobber each other.
+_precompile_jobs = {}
+_precompile_keys = itertools.count()
+
+
+def _precompile_job(key, i):
+    """Run the front half of the pipeline for a job, in a worker process.
+
+    Returns the serialized validated graph, or None if the compilation or
+    the serialization failed.
+    """
+    pip, inputs = _precompile_jobs[key][i]
+    try:
+        results = pip(**inputs)
+        return serialize({k: results[k] for k in cache_fields if k in results})
+    except Exception:
+        return None
+
+
+########################
+# Memory of a pipeline #
+########################
+
+
+# Rough number of bytes retained for each node of a graph, including the
+# inferred types and the code generated for it by the backend.
+_BYTES_PER_NODE = 1000
+
+
+def _approx_size(results):
+    """Approximate the memory retained by the results of a pipeline.
+
+    The estimate counts the nodes in the graph managers that the results
+    reference, plus the data of the array constants in these graphs.
+    """
+    managers = {}
+    graph = results.get("graph", None)
+    if isinstance(graph, Graph) and graph._manager is not None:
+        managers[id(graph._manager)] = graph._manager
+    resources = results.get("resources", None)
+    for attr in ("infer_manager", "opt_manager"):
+        mng = getattr(resources, attr, None)
+        if mng is not None:
+            managers[id(mng)] = mng
+    size = 0
+    for mng in managers.values():
+        size += len(mng.all_nodes) * _BYTES_PER_NODE
+        for node in mng.all_nodes:
+            if node.is_constant(np.ndarray):
+                size += node.value.nbytes
+    return size
+
 
 #################
 # Top-level API #
@@ -32,6 +197,22 @@ class MyiaFunction:
         fn: The root function to compile.
         specialize_values: Set of arguments for which we should specialize the
             function based on their values (list of argument names).
+        cache: A CompilationCache to persist validated graphs across
+            processes, or None.
+        dynamic_dims: Map from argument names to the dimensions of the
+            arrays in these arguments that should not be specialized on.
+        max_specializations: Maximum number of specializations to keep, or
+            None. The least recently used ones are evicted first.
+        max_specialization_bytes: Maximum approximate memory to retain for
+            the specializations, or None.
+        keep_resources: Whether to keep all the results of the pipeline
+            for each specialization, or only the output function.
+        stats: Counters for the hits, misses and evictions of the
+            specializations, and the number of recompilations that were
+            avoided thanks to dynamic_dims.
+        batched: Set of arguments that have a leading batch axis (list of
+            argument names). The function is compiled for a single example
+            and then rewritten to process the whole batch in one call.
 
     """
 
@@ -46,6 +227,13 @@ class MyiaFunction:
         use_universe=False,
         tracer=ABSENT,
         pipeline=standard_pipeline,
+        cache=None,
+        dynamic_dims={},
+        max_specializations=None,
+        max_specialization_bytes=None,
+        keep_resources=True,
+        batched=[],
+        opt_level=1,
     ):
         """Initialize a MyiaFunction."""
         # Change this once relay becomes the default backend.
@@ -53,19 +241,59 @@ class MyiaFunction:
             raise RuntimeError(  # pragma: no cover
                 "Universe is only supported for python and relay backend."
             )
+        if batched and use_universe:
+            raise RuntimeError("Batching does not support use_universe.")
         self.fn = fn
         self.alias_tracker = alias_tracker
         self.specialize_values = set(specialize_values)
-        self.pip = pipeline.configure(
-            {
-                "universal": use_universe,
-                "backend.name": backend,
-                "backend.options": backend_options,
-                "return_backend": return_backend,
-            }
-        )
-        self._cache = {}
+        self.config = {
+            "universal": use_universe,
+            "backend.name": backend,
+            "backend.options": backend_options,
+            "return_backend": return_backend,
+            "opt_level": opt_level,
+        }
+        self.pip = pipeline.configure(self.config)
+        self.batched = set(batched)
+        if self.batched:
+            unknown = self.batched - set(inspect.getfullargspec(fn).args)
+            if unknown:
+                raise RuntimeError(
+                    f"Batched arguments {sorted(unknown)} are not named"
+                    f" arguments of {fn}."
+                )
+            if steps.step_opt not in self.pip.steps:
+                raise RuntimeError("Batching requires step_opt in pipeline.")
+            self.pip = self.pip.insert_after(steps.step_opt, steps.step_batch)
+        if isinstance(cache, str):
+            cache = CompilationCache(cache)
+        self.cache = cache
+        unknown = set(dynamic_dims) - set(inspect.getfullargspec(fn).args)
+        if unknown:
+            raise RuntimeError(
+                f"Dynamic dims for {sorted(unknown)}, which are not named"
+                f" arguments of {fn}."
+            )
+        self.dynamic_dims = {
+            name: frozenset(dims) for name, dims in dynamic_dims.items()
+        }
+        self.max_specializations = max_specializations
+        self.max_specialization_bytes = max_specialization_bytes
+        self.keep_resources = keep_resources
+        self.stats = {
+            "hits": 0,
+            "misses": 0,
+            "evictions": 0,
+            "recompilations_avoided": 0,
+        }
+        self._cache = OrderedDict()
+        self._sizes = {}
+        self._nbytes = 0
+        self._dynamic_seen = OrderedDict()
+        self._fast = {}
+        self._specialized = None
         self.latest = None
+        self._latest_spec = None
         if tracer is ABSENT:
             mt = os.environ.get("MYIATRACER")
             if mt:
@@ -82,6 +310,34 @@ class MyiaFunction:
         Returns a Pipeline. If the argument types were seen before, returns a
         cached version.
         """
+        return self._specialize(args)[1]
+
+    def _specialize(self, args):
+        """Specialize on the types of the given arguments.
+
+        Returns the argspec along with the results of the Pipeline.
+        """
+        argspec, aid_to_paths = self._argspec(args)
+        if argspec in self._cache:
+            self.stats["hits"] += 1
+            self._cache.move_to_end(argspec)
+        else:
+            self.stats["misses"] += 1
+            if self.tracer:
+                self.tracer.__enter__()
+            results = self._run_pipeline(
+                argspec, (self.alias_tracker, aid_to_paths)
+            )
+            if self.tracer:
+                self.tracer.__exit__(None, None, None)
+            self._insert(argspec, results)
+        return argspec, self._cache[argspec]
+
+    def _argspec(self, args):
+        """Compute the argspec for the given arguments.
+
+        Returns the argspec and the paths of the aliased arguments.
+        """
         argnames = inspect.getfullargspec(self.fn).args
         n1 = len(argnames)
         n2 = len(args)
@@ -99,32 +355,320 @@ class MyiaFunction:
             )
             for arg, name in zip(args, argnames)
         )
+        if self.dynamic_dims:
+            concrete_argspec = argspec
+            argspec = tuple(
+                broaden_dims(arg_t, dims=self.dynamic_dims[name])
+                if name in self.dynamic_dims
+                else arg_t
+                for arg_t, name in zip(argspec, argnames)
+            )
+            if concrete_argspec in self._dynamic_seen:
+                self._dynamic_seen.move_to_end(concrete_argspec)
+            else:
+                if argspec in self._cache:
+                    self.stats["recompilations_avoided"] += 1
+                self._dynamic_seen[concrete_argspec] = True
+                if len(self._dynamic_seen) > _max_dynamic_seen:
+                    self._dynamic_seen.popitem(last=False)
+        return argspec, aid_to_paths
 
-        if argspec not in self._cache:
-            if self.tracer:
-                self.tracer.__enter__()
-            self._cache[argspec] = self.pip(
-                input=self.fn,
-                argspec=argspec,
-                aliasspec=(self.alias_tracker, aid_to_paths),
+    def _insert(self, argspec, results):
+        """Add a specialization, evicting old ones if there are too many."""
+        if not self.keep_resources:
+            # The compiled output only retains about as much as the final
+            # graph, not the inference and optimization data.
+            size = _approx_size({"graph": results.get("graph", None)})
+            results = {"output": results["output"]}
+        else:
+            size = _approx_size(results)
+        self._cache[argspec] = results
+        self._sizes[argspec] = size
+        self._nbytes += size
+        # The new specialization is never evicted, even if it is too large.
+        while len(self._cache) > 1 and (
+            (
+                self.max_specializations is not None
+                and len(self._cache) > self.max_specializations
             )
-            if self.tracer:
-                self.tracer.__exit__(None, None, None)
-        return self._cache[argspec]
+            or (
+                self.max_specialization_bytes is not None
+                and self._nbytes > self.max_specialization_bytes
+            )
+        ):
+            self._evict()
+
+    def _evict(self):
+        """Evict the least recently used specialization."""
+        argspec, _ = self._cache.popitem(last=False)
+        self._nbytes -= self._sizes.pop(argspec)
+        self._fast = {
+            key: entry
+            for key, entry in self._fast.items()
+            if entry[0] != argspec
+        }
+        if self._latest_spec == argspec:
+            self.latest = None
+            self._latest_spec = None
+        self.stats["evictions"] += 1
+
+    def cache_info(self):
+        """Return information about the cached specializations.
+
+        Returns:
+            A dict with the number of specializations ("entries"), their
+            approximate memory in bytes ("bytes"), as well as the counters
+            in the stats attribute.
+
+        """
+        return {
+            "entries": len(self._cache),
+            "bytes": self._nbytes,
+            **self.stats,
+        }
+
+    def _pipeline_inputs(self, argspec, aliasspec):
+        """Return the inputs of the pipeline for the given argspec.
+
+        If some arguments are batched, the pipeline gets the argspec for a
+        single example, along with the batch information for step_batch.
+        """
+        inputs = {"input": self.fn, "argspec": argspec, "aliasspec": aliasspec}
+        if not self.batched:
+            return inputs
+        argnames = inspect.getfullargspec(self.fn).args
+        batched = tuple(name in self.batched for name in argnames)
+        new_argspec = []
+        size = None
+        for arg_t, name, b in zip(argspec, argnames, batched):
+            if b:
+                arg_t, arg_size = unbatch_abstract(arg_t)
+                if size is not None and arg_size != size:
+                    raise MyiaShapeError(
+                        f"All batched arguments must have the same leading"
+                        f" dimension, but {name} has {arg_size} instead"
+                        f" of {size}"
+                    )
+                size = arg_size
+            new_argspec.append(arg_t)
+        return {
+            **inputs,
+            "argspec": tuple(new_argspec),
+            "batch": (batched, size),
+        }
+
+    def _run_pipeline(self, argspec, aliasspec):
+        """Run the pipeline, going through the persistent cache if there is one.
+
+        On a cache hit, only the steps after step_validate are executed.
+        """
+        inputs = self._pipeline_inputs(argspec, aliasspec)
+        if self.cache is None or steps.step_validate not in self.pip.steps:
+            return self.pip(**inputs)
+
+        key = self._cache_key(argspec, aliasspec)
+        if key is not None:
+            results = self.cache.load(key)
+            if results is not None:
+                return self._run_backend_steps(results, aliasspec)
+
+        pip = self.pip.insert_after(steps.step_validate, steps.step_cache_store)
+        return pip(**inputs, cache=self.cache, cache_key=key)
+
+    def _cache_key(self, argspec, aliasspec):
+        """Compute the key for argspec in the persistent cache."""
+        backr = self.pip.resources.keywords["backend"].keywords
+        if backr.get("name") is None:
+            backend, backend_options = parse_default()
+        else:
+            backend, backend_options = backr["name"], backr.get("options")
+        config = {
+            **self.config,
+            "backend.name": backend,
+            "backend.options": backend_options,
+            "steps": [_nameof(step, None) for step in self.pip],
+            "batched": sorted(self.batched),
+        }
+        return self.cache.key(self.fn, (argspec, aliasspec[1]), config)
+
+    def _run_backend_steps(self, results, aliasspec):
+        """Run the steps after step_validate on a validated graph."""
+        idx = self.pip.steps.index(steps.step_validate) + 1
+        return self.pip.with_steps(*self.pip[idx:])(
+            **results, aliasspec=aliasspec
+        )
+
+    def precompile(self, argspecs, workers=None):
+        """Compile the specializations for several argument lists at once.
+
+        The steps up to step_validate are run in a pool of worker processes,
+        each with its own pipeline resources. The validated graphs are sent
+        back serialized and compiled by the backend in this process, since
+        the backends' executables cannot be serialized. The pool requires the
+        "fork" start method; without it, or if the pipeline has no
+        step_validate, the specializations are compiled sequentially.
+
+        Each specialization is compiled once, even if there are more
+        argspecs than max_specializations allows: the ones that are evicted
+        by later argspecs are still returned, but they are not kept in the
+        specialization cache.
+
+        Arguments:
+            argspecs: A list of tuples of example arguments. Only their
+                types, and their values for specialize_values, matter.
+            workers: The number of worker processes, or None to use the
+                number of CPUs.
+
+        Returns:
+            The list of compiled functions for each entry of argspecs.
+
+        """
+        specs = [self._argspec(args) for args in argspecs]
+        outputs = {}
+        todo = {}
+        for argspec, aid_to_paths in specs:
+            if argspec in self._cache:
+                outputs[argspec] = self._cache[argspec]["output"]
+            else:
+                todo.setdefault(argspec, (self.alias_tracker, aid_to_paths))
+
+        if self.cache is not None and steps.step_validate in self.pip.steps:
+            for argspec, aliasspec in list(todo.items()):
+                key = self._cache_key(argspec, aliasspec)
+                results = None if key is None else self.cache.load(key)
+                if results is not None:
+                    self.stats["misses"] += 1
+                    results = self._run_backend_steps(results, aliasspec)
+                    self._insert(argspec, results)
+                    outputs[argspec] = results["output"]
+                    del todo[argspec]
+
+        if (
+            len(todo) > 1
+            and workers != 1
+            and steps.step_validate in self.pip.steps
+            and "fork" in multiprocessing.get_all_start_methods()
+        ):
+            idx = self.pip.steps.index(steps.step_validate) + 1
+            front = self.pip.with_steps(*self.pip[:idx])
+            jobs_key = next(_precompile_keys)
+            _precompile_jobs[jobs_key] = [
+                (front, self._pipeline_inputs(argspec, aliasspec))
+                for argspec, aliasspec in todo.items()
+            ]
+            try:
+                with ProcessPoolExecutor(
+                    max_workers=workers,
+                    mp_context=multiprocessing.get_context("fork"),
+                ) as pool:
+                    datas = list(
+                        pool.map(
+                            _precompile_job,
+                            itertools.repeat(jobs_key),
+                            range(len(todo)),
+                        )
+                    )
+            finally:
+                del _precompile_jobs[jobs_key]
+
+            for (argspec, aliasspec), data in zip(list(todo.items()), datas):
+                if data is None:
+                    # Compile it below, to raise the error in this process
+                    continue
+                results = deserialize(data)
+                manage(results["graph"])
+                if self.cache is not None:
+                    key = self._cache_key(argspec, aliasspec)
+                    if key is not None:
+                        self.cache.store(key, results)
+                self.stats["misses"] += 1
+                results = self._run_backend_steps(results, aliasspec)
+                self._insert(argspec, results)
+                outputs[argspec] = results["output"]
+
+        for argspec, aid_to_paths in specs:
+            if argspec not in outputs:
+                self.stats["misses"] += 1
+                results = self._run_pipeline(
+                    argspec, (self.alias_tracker, aid_to_paths)
+                )
+                self._insert(argspec, results)
+                outputs[argspec] = results["output"]
+        return [outputs[argspec] for argspec, _ in specs]
 
     def compile(self, args):
         """Returns a function specialized for the given args."""
-        self.latest = self.specialize(args)["output"]
+        self._latest_spec, results = self._specialize(args)
+        self.latest = results["output"]
         return self.latest
 
+    def _dispatch_key(self, args):
+        """Compute a cheap dispatch key for the given args.
+
+        Arguments that have the same signature are guaranteed to map to the
+        same specialization, so the key can be used to find the compiled
+        function without computing the argspec.
+
+        Returns:
+            A hashable key, or None if some argument is not supported, in
+            which case the full argspec must be computed.
+
+        """
+        if self._specialized is None:
+            argnames = inspect.getfullargspec(self.fn).args
+            self._specialized = tuple(
+                name in self.specialize_values for name in argnames
+            )
+        if len(args) != len(self._specialized):
+            return None
+        if self.alias_tracker is None:
+            ids = None
+        elif self.alias_tracker is ndarray_aliasable:
+            ids = {}
+        else:
+            return None
+        key = []
+        for arg, specialized in zip(args, self._specialized):
+            sig = _signature(arg, ids)
+            if sig is None:
+                return None
+            if specialized:
+                if type(arg) not in _scalar_types:
+                    return None
+                sig = (sig, arg)
+            key.append(sig)
+        return tuple(key)
+
     def __call__(self, *args):
         """Call the function on the given args."""
-        if self.latest:
-            try:
-                return self.latest(*args)
-            except MyiaInputTypeError:
-                pass
-        return self.compile(args)(*args)
+        key = self._dispatch_key(args)
+        if key is None:
+            if self.latest:
+                try:
+                    res = self.latest(*args)
+                except MyiaInputTypeError:
+                    pass
+                else:
+                    self._hit(self._latest_spec)
+                    return res
+            return self.compile(args)(*args)
+        entry = self._fast.get(key, None)
+        if entry is None:
+            fn = self.compile(args)
+            self._fast[key] = (self._latest_spec, fn)
+        else:
+            argspec, fn = entry
+            self._hit(argspec)
+        return fn(*args)
+
+    def _hit(self, argspec):
+        """Record a call to the specialization for argspec."""
+        self.stats["hits"] += 1
+        if (
+            self.max_specializations is not None
+            or self.max_specialization_bytes is not None
+        ):
+            self._cache.move_to_end(argspec)
 
     def to_device(self, v, *, broaden=True, vm_t=None, orig_t=None):
         """Move value to the function's accelerator hardware."""
@@ -150,6 +694,14 @@ def myia(
     alias_tracker=None,
     use_universe=False,
     pipeline=standard_pipeline,
+    cache=None,
+    dynamic_dims={},
+    max_specializations=None,
+    max_specialization_bytes=None,
+    keep_resources=True,
+    profile=False,
+    batched=[],
+    opt_level=1,
 ):
     """Create a function using Myia's runtime.
 
@@ -175,6 +727,41 @@ def myia(
             (see :func:`myia.abstract.find_aliases`)
         use_universe: Enable use of sequential code (experimental)
         pipeline: Pipeline to use
+        cache: A CompilationCache, or the path to a directory to use as one.
+            Validated graphs are saved there and reused in other processes,
+            which then only need to run the backend compilation.
+        dynamic_dims: Map from argument names to lists of dimensions that
+            may vary between calls, e.g. ``{"x": [0]}`` for a batch axis.
+            These dimensions are left unknown during inference, so that
+            one compiled function serves all of their sizes.
+        max_specializations: Maximum number of specializations to keep in
+            memory. The least recently used ones are evicted first.
+        max_specialization_bytes: Maximum approximate memory retained by
+            the specializations.
+        keep_resources: If False, only keep the compiled function for each
+            specialization instead of all the results of the pipeline
+            (graphs, inference data, etc.)
+        profile: If True, profile the compilation of each specialization
+            with a :class:`myia.profile.CompileProfiler` and print the
+            reports. They are available in the function's tracer attribute.
+        batched: Names of the arguments that have a leading batch axis. The
+            function is written for a single example, and is rewritten to
+            process all the examples of the batch in a single call::
+
+                @myia(batched=["x"])
+                def predict(W, x):
+                    return tanh(x @ W)
+
+                predict(W, xs)  # xs has shape (batch_size, *x.shape)
+
+            The batched arguments must be arrays, and every array in the
+            output gets a leading batch axis, as well as scalars, which
+            become arrays of shape (batch_size,).
+        opt_level: How hard to optimize. Level 2 also runs the
+            optimizations that incorporate calls, tuple_getitem and
+            env_getitem into the called graphs, which can make the code
+            faster at the cost of compile time. They duplicate graphs, within
+            the limits of the IncorporationBudget, which level 3 lifts.
 
     """
     return MyiaFunction(
@@ -186,6 +773,14 @@ def myia(
         alias_tracker=alias_tracker,
         use_universe=use_universe,
         pipeline=pipeline,
+        cache=cache,
+        dynamic_dims=dynamic_dims,
+        max_specializations=max_specializations,
+        max_specialization_bytes=max_specialization_bytes,
+        keep_resources=keep_resources,
+        tracer=CompileProfiler(print_results=True) if profile else ABSENT,
+        batched=batched,
+        opt_level=opt_level,
     )
 
 
@@ -233,6 +233,20 @@ class Backend:
         """Convert an intermediate value to a backend value."""
         raise NotImplementedError("to_backend_value")
 
+    def from_backend_converter(self, t):
+        """Return a function that converts backend values of type t.
+
+        Backends may override this to do the dispatch on t only once.
+        """
+        return lambda v: self.from_backend_value(v, t)
+
+    def to_backend_converter(self, t):
+        """Return a function that converts intermediate values of type t.
+
+        Backends may override this to do the dispatch on t only once.
+        """
+        return lambda v: self.to_backend_value(v, t)
+
     def supports_prim_group(self, prim_group: PrimGroup):
         """Return True if given primitive group is supported.
 
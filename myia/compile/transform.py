@@ -1,5 +1,7 @@
 """Transforms a graph into lower-level code."""
 
+from collections import defaultdict
+
 from .. import xtype
 from ..abstract import AbstractHandle, AbstractTuple, to_abstract
 from ..ir import Apply, Constant, Graph, toposort
@@ -156,13 +158,26 @@ class CompileGraph:
     Outputs:
         uinstrs: list of instructions for the graph (unlinked)
 
+    Attributes:
+        release_values: Whether to emit `clear` instructions that drop the
+            stack's reference to each value after its last use, so that
+            large intermediate values can be freed before the function
+            returns.
+        fuse: Whether to group the linear nodes between two cuts into a
+            single portion, so that `lin_convert` can compile them into one
+            `external` instruction. Otherwise, each linear node is its own
+            portion.
+
     """
 
-    def __init__(self, lin_convert, cut_list, backend):
+    release_values = True
+
+    def __init__(self, lin_convert, cut_list, backend, fuse=False):
         """Create a CompileGraph with the specified linear backend."""
         self.lin_convert = lin_convert
         self.cut_list = cut_list
         self.backend = backend
+        self.fuse = fuse
 
     def _reset(self):
         """Set/clear shared values."""
@@ -171,6 +186,8 @@ class CompileGraph:
         self.slots = {}
         self.instrs = []
         self.env_keys = []
+        self._split_idx = -1
+        self.last_use = {}
 
     def _is_cut(self, node):
         if node.is_apply():
@@ -182,14 +199,24 @@ class CompileGraph:
         return False
 
     def split(self, graph):
-        """Split a graph into portions."""
+        """Split a graph into portions.
+
+        Cut nodes are returned as they are and linear nodes are returned in
+        lists. If `fuse` is set, each list holds all the linear nodes found
+        in toposort order between two cut nodes.
+        """
         splits = []
+        segment = None
 
         for node in toposort(graph.return_):
             if self._is_cut(node):
                 splits.append(node)
+                segment = None
             elif not (node.is_constant() or node.is_parameter()):
-                splits.append([node])
+                if segment is None or not self.fuse:
+                    segment = []
+                    splits.append(segment)
+                segment.append(node)
 
         return splits
 
@@ -216,6 +243,7 @@ class CompileGraph:
         """
         assert node not in self.slots
         self.slots[node] = self.height
+        self.last_use[node] = self._split_idx
         self.height += 1
 
     def ref(self, node):
@@ -233,6 +261,7 @@ class CompileGraph:
                 v = self.backend.to_backend_value(node.value, node.abstract)
                 self.add_instr("push", v)
             self.push(node)
+        self.last_use[node] = self._split_idx
         return self.slots[node] - self.height
 
     def dup(self, node):
@@ -246,6 +275,36 @@ class CompileGraph:
         """Simulate the effect of a return from a call on the stack."""
         self.height -= nargs
 
+    def mark_release(self):
+        """Mark the place where the values last used so far can be dropped.
+
+        The marker is replaced by a `clear` instruction, or removed, by
+        `insert_releases`.
+        """
+        self.add_instr("_release", self._split_idx, self.height)
+
+    def insert_releases(self):
+        """Replace the release markers by `clear` instructions.
+
+        Each value is cleared at the first marker after its last use. The
+        value returned by the graph is never cleared, since the function
+        returns right after its last use.
+        """
+        dead = defaultdict(list)
+        for node, idx in self.last_use.items():
+            dead[idx].append(node)
+
+        instrs = []
+        for instr in self.instrs:
+            if instr[0] != "_release":
+                instrs.append(instr)
+            elif self.release_values:
+                _, idx, height = instr
+                refs = [self.slots[node] - height for node in dead[idx]]
+                if refs:
+                    instrs.append(("clear", *refs))
+        self.instrs = instrs
+
     def run(self, graph):
         """Convert the graph into a list of instructions."""
         self._reset()
@@ -256,8 +315,11 @@ class CompileGraph:
             self.push(p)
 
         param_height = self.height
+        # Unused parameters can be dropped right away
+        self.mark_release()
 
-        for split in splits:
+        for idx, split in enumerate(splits):
+            self._split_idx = idx
             if isinstance(split, list):
                 run, inputs, outputs = self.lin_convert(split)
                 # prime the arguments because self.ref() can invalidate
@@ -393,6 +455,10 @@ class CompileGraph:
 
                 self.push(split)
 
+            self.mark_release()
+
+        self.insert_releases()
+
         need_stack = self.max_height - param_height
         if need_stack > 0:
             self.instrs.insert(0, ("pad_stack", need_stack))
@@ -413,14 +479,16 @@ class CompileGraphs:
 
     """
 
-    def __init__(self, lin_convert, cut_list, backend):
+    def __init__(self, lin_convert, cut_list, backend, fuse=False):
         """Create a compiler.
 
         This use the specified implementation for linear parts and a
         list of excluded ops that will be covered by the built-in VM.
+        If `fuse` is set, the linear parts are given to `lin_convert`
+        whole instead of one node at a time.
 
         """
-        self.transform = CompileGraph(lin_convert, cut_list, backend)
+        self.transform = CompileGraph(lin_convert, cut_list, backend, fuse)
         self._reset()
 
     def _reset(self):
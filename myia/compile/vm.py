@@ -16,21 +16,26 @@ class struct_partial:
         return f"partial({self.fn}, {self.args})"
 
 
-class FinalVM:
-    """Run a sequence of instructions.
+class VMFrame:
+    """Execution state for one evaluation of the code of a FinalVM.
 
-    These instructions can represent multiple graphs with arbitrary
-    recursion between them.
+    Each call to a FinalVM uses its own frame, so that the same FinalVM can
+    be evaluated concurrently, e.g. from multiple threads. The instructions
+    are implemented as methods of the frame.
     """
 
-    def __init__(self, code, backend):
-        """Create a VM with the specified instructions."""
-        self.code = tuple(code)
-        self.stack = [None]  # The value stack
+    def __init__(self, backend, args):
+        """Initialize a VMFrame for the given arguments."""
+        self.backend = backend
+        self.stack = [None] * len(args)  # The value stack
         self.retp = [-1]  # The call stack
         self.pc = 0  # program counter (next instruction)
         self.sp = 0  # stack pointer (for the value stack)
-        self.backend = backend
+
+        # Calling convention is to push arguments from last to first
+        # because it makes partial application easier.
+        for a in reversed(args):
+            self._push(a)
 
     def _push(self, v):
         """Push a value to the stack."""
@@ -85,37 +90,6 @@ class FinalVM:
         assert isinstance(jmp, int)
         self.pc = jmp
 
-    def __call__(self, *args):
-        """Shortcut to eval()."""
-        return self.eval(args)
-
-    def eval(self, args):
-        """Evaluate the code for this vm with the passed-in arguments."""
-        # reset the runtime to initial values
-        self.stack = [None] * len(args)  # The value stack
-        self.retp = [-1]  # The call stack
-        self.pc = 0  # program counter (next instruction)
-        self.sp = 0  # stack pointer (for the value stack)
-
-        # Calling convention is to push arguments from last to first
-        # because it makes partial application easier.
-        for a in reversed(args):
-            self._push(a)
-
-        # Main runtime loop
-        while self.pc >= 0:
-            instr = self.code[self.pc]
-            impl = getattr(self, f"inst_{instr[0]}", None)
-            if impl is None:
-                raise AssertionError(f"Unknown instruction {instr[0]}")
-            self.pc += 1
-            impl(*instr[1:])
-
-        # When we reach here there should be a single value on the
-        # value stack and it is the return value for the evaluation.
-        assert self.sp == 1, self.sp
-        return self.stack[0]
-
     def inst_call(self, jmp):
         """Call.
 
@@ -332,6 +306,20 @@ class FinalVM:
         """
         self._push(self._ref(rpos))
 
+    def inst_clear(self, *refs):
+        """Drop the references to values that will not be used anymore.
+
+        The stack positions are set to None, so that the values can be
+        freed. This does not change the stack height.
+
+        Arguments:
+            refs: stack references
+
+        """
+        stack = self.stack
+        for rpos in refs:
+            stack[self.sp + rpos] = None
+
     def inst_pad_stack(self, sz):
         """Pad stack.
 
@@ -347,6 +335,32 @@ class FinalVM:
         if need > 0:
             self.stack.extend([None] * need)
 
+    def _fused_dups(self, next_pc, refs):
+        """Execute a sequence of dup instructions.
+
+        Arguments:
+            next_pc: position of the instruction after the sequence
+            refs: stack reference for each dup
+
+        """
+        stack = self.stack
+        for rpos in refs:
+            stack[self.sp] = stack[self.sp + rpos]
+            self.sp += 1
+        self.pc = next_pc
+
+    def _fused_dups_call(self, next_pc, refs, jmp):
+        """Execute a sequence of dup instructions followed by a call.
+
+        Arguments:
+            next_pc: position of the instruction after the call
+            refs: stack reference for each dup
+            jmp: stack reference to a callable (code position or partial).
+
+        """
+        self._fused_dups(next_pc, refs)
+        self.inst_call(jmp)
+
     def inst_external(self, fn, args):
         """Call external function.
 
@@ -368,4 +382,81 @@ class FinalVM:
             self._push(o)
 
 
-__all__ = ["FinalVM"]
+class FinalVM:
+    """Run a sequence of instructions.
+
+    These instructions can represent multiple graphs with arbitrary
+    recursion between them.
+
+    The instructions are decoded once, when the VM is created, into a list
+    of (handler, arguments) pairs that has one entry per instruction, so
+    that code positions are preserved. Runs of `dup` instructions, and
+    runs of `dup` followed by a `call`, are fused into a single handler
+    placed at the position of the first instruction of the run.
+
+    The VM itself holds no execution state: each evaluation runs in a new
+    VMFrame, so a FinalVM can be called from multiple threads at once.
+    """
+
+    def __init__(self, code, backend):
+        """Create a VM with the specified instructions."""
+        self.code = tuple(code)
+        self.backend = backend
+        self.threaded = self._decode(self.code)
+
+    def _decode(self, code):
+        """Decode the instructions into a list of (handler, args) pairs."""
+        threaded = []
+        for instr in code:
+            impl = getattr(VMFrame, f"inst_{instr[0]}", None)
+            if impl is None:
+                impl = self._make_unknown(instr[0])
+            threaded.append((impl, instr[1:]))
+
+        i = 0
+        while i < len(code):
+            j = i
+            while j < len(code) and code[j][0] == "dup":
+                j += 1
+            if j < len(code) and j > i and code[j][0] == "call":
+                refs = tuple(instr[1] for instr in code[i:j])
+                args = (j + 1, refs, code[j][1])
+                threaded[i] = (VMFrame._fused_dups_call, args)
+                i = j + 1
+            elif j > i + 1:
+                refs = tuple(instr[1] for instr in code[i:j])
+                threaded[i] = (VMFrame._fused_dups, (j, refs))
+                i = j
+            else:
+                i = max(j, i + 1)
+        return threaded
+
+    @staticmethod
+    def _make_unknown(name):
+        def unknown(frame, *args):
+            raise AssertionError(f"Unknown instruction {name}")
+
+        return unknown
+
+    def __call__(self, *args):
+        """Shortcut to eval()."""
+        return self.eval(args)
+
+    def eval(self, args):
+        """Evaluate the code for this vm with the passed-in arguments."""
+        frame = VMFrame(self.backend, args)
+
+        # Main runtime loop
+        threaded = self.threaded
+        while frame.pc >= 0:
+            impl, instr_args = threaded[frame.pc]
+            frame.pc += 1
+            impl(frame, *instr_args)
+
+        # When we reach here there should be a single value on the
+        # value stack and it is the return value for the evaluation.
+        assert frame.sp == 1, frame.sp
+        return frame.stack[0]
+
+
+__all__ = ["FinalVM", "VMFrame"]
@@ -120,6 +120,22 @@ class NamedDebugInfo(DebugInfo):
             # this line in the code.
             self.trace = traceback.extract_stack()[:-1]
 
+    @classmethod
+    def in_context(cls, context, obj=None, **kwargs):
+        """Create a NamedDebugInfo as if context was the current context.
+
+        Arguments:
+            context: A DebugInherit returned by `current_info`, or None.
+            obj: The object the debug info is for.
+            kwargs: Attributes of the debug info.
+
+        """
+        _about.push(context)
+        try:
+            return cls(obj, **kwargs)
+        finally:
+            _about.pop()
+
     @property
     def obj(self):
         """Return the object that this DebugInfo is about."""
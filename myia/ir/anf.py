@@ -13,7 +13,7 @@ returning a nested function creates a closure.
 from copy import copy
 from typing import Any, Dict, Iterable, List, Union
 
-from ..info import About, NamedDebugInfo
+from ..info import About, DebugInherit, NamedDebugInfo, current_info
 from ..operations import Primitive, primitives as primops
 from ..utils import Named, list_str, repr_
 from ..utils.unify import Unification, expandlist, noseq
@@ -479,12 +479,26 @@ class ANFNode:
             attribute, creating a doubly linked graph structure. Note that this
             container is updated automatically; do not manipulate it manually.
         debug: An object with debug information about this node e.g. a
-            human-readable name and the Python source code.
+            human-readable name and the Python source code. It is created
+            the first time it is accessed, from the debug context in which
+            the node was created.
         annotation: Python type annotation for this node,
             if type annotation is available. Examples: int, List[str]
 
     """
 
+    # Nodes are by far the most numerous objects created by the compiler,
+    # so they have no __dict__.
+    __slots__ = (
+        "inputs",
+        "value",
+        "graph",
+        "abstract",
+        "annotation",
+        "_debug",
+        "__weakref__",
+    )
+
     def __init__(
         self, inputs: Iterable["ANFNode"], value: Any, graph: Graph
     ) -> None:
@@ -492,9 +506,28 @@ class ANFNode:
         self.inputs = list(inputs)
         self.value = value
         self.graph = graph
-        self.debug = NamedDebugInfo(self)
         self.abstract = None
         self.annotation = None
+        # Until the debug info is needed, only the current debug context is
+        # kept. The trace must be saved right away, though.
+        ctx = current_info()
+        if ctx is not None and getattr(ctx, "save_trace", False):
+            self._debug = NamedDebugInfo(self)
+        else:
+            self._debug = ctx
+
+    @property
+    def debug(self):
+        """Return the node's NamedDebugInfo, creating it if needed."""
+        dbg = self._debug
+        if dbg is None or isinstance(dbg, DebugInherit):
+            dbg = self._debug = NamedDebugInfo.in_context(dbg, self)
+        return dbg
+
+    @debug.setter
+    def debug(self, debug):
+        """Set the node's debug info."""
+        self._debug = debug
 
     @property
     def shape(self):
@@ -551,6 +584,8 @@ class Apply(ANFNode):
 
     """
 
+    __slots__ = ()
+
     def __init__(self, inputs: List[ANFNode], graph: "Graph") -> None:
         """Construct an application."""
         super().__init__(inputs, APPLY, graph)
@@ -588,6 +623,8 @@ class Parameter(ANFNode):
 
     """
 
+    __slots__ = ()
+
     def __init__(self, graph: Graph) -> None:
         """Construct the parameter."""
         super().__init__([], PARAMETER, graph)
@@ -614,6 +651,8 @@ class Constant(ANFNode):
 
     """
 
+    __slots__ = ()
+
     def __init__(self, value: Any) -> None:
         """Construct a literal."""
         super().__init__([], value, None)
@@ -650,6 +689,8 @@ class Special(ANFNode):
 
     """
 
+    __slots__ = ("special",)
+
     def __init__(self, special: Any, graph: Graph) -> None:
         """Initialize a special node."""
         super().__init__([], SPECIAL, graph)
@@ -669,6 +710,8 @@ class Special(ANFNode):
 class VarNode(Special):
     """Graph node that represents a variable."""
 
+    __slots__ = ()
+
     @property
     def __var__(self):
         return self.special
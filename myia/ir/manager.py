@@ -3,7 +3,7 @@
 from collections import Counter, defaultdict
 
 from ..graph_utils import EXCLUDE, FOLLOW, dfs
-from ..utils import Events, OrderedSet, Partializable, WorkSet, untested
+from ..utils import Events, OrderedSet, Partializable, WorkSet
 from .anf import ANFNode
 from .utils import succ_deeper
 
@@ -610,16 +610,37 @@ class GraphManager(Partializable):
         """Garbage-collect disconnected graphs.
 
         Normally this is done incrementally through reference counting, but
-        because of circular references, some graphs might remain.
+        because of circular references, some graphs might remain. These
+        graphs and their nodes are dropped, and the statistics are updated
+        through the usual events, without resetting the manager.
+
+        A graph is kept if it is reachable from a root, or if a graph that is
+        kept uses its nodes as free variables. If a dead graph uses nodes of
+        a graph that is no longer managed, or if the statistics of the dead
+        graphs are out of sync with their edges, the manager is reset
+        instead.
         """
-        reach = OrderedSet(self.roots)
-        for root in self.roots:
-            reach.update(self.graphs_reachable[root])
-        # TODO: Ideally the two lines below should be replaced by the commented
-        # out line, but it causes an error in
-        # tests/test_grad.py::test_recursive_closure
-        # # self._drop_all(self.graphs - reach, drop_nodes=True)
-        if reach != self.graphs:
+        work = WorkSet(self.roots)
+        for g in work:
+            work.queue_all(self.graphs_used[g])
+            work.queue_all(self.graph_dependencies_direct[g])
+        dead = self.graphs - work.done
+        if not dead:
+            return
+        if any(
+            fv.graph not in self.graphs
+            for g in dead
+            for fv in self.free_variables_direct[g]
+        ):
+            # A graph that was dropped earlier still has nodes used by a dead
+            # graph, so the statistics cannot be updated edge by edge.
+            self.reset()
+            return
+        try:
+            self._drop_all(dead, drop_nodes=True)
+        except KeyError:
+            # The counters of the dead graphs did not match their edges.
+            # Reset recomputes everything, including what was dropped so far.
             self.reset()
 
     def reset(self):
@@ -745,9 +766,7 @@ class GraphManager(Partializable):
 
     def _drop_all(self, dropped, drop_nodes=True):
         if drop_nodes:
-            with untested():
-                for g in dropped:
-                    self._maybe_drop_nodes(OrderedSet([g.return_]))
+            self._drop_graph_nodes(dropped)
 
         for g in dropped:
             self.events.drop_graph(g)
@@ -757,6 +776,32 @@ class GraphManager(Partializable):
                 assert g._manager is self
                 g._manager = None
 
+    def _drop_graph_nodes(self, graphs):
+        """Drop all the nodes that belong to the given graphs.
+
+        These nodes must only be used by each other, e.g. because the graphs
+        call each other but are not reachable. The nodes of other graphs and
+        the constants that were only used by them are also dropped.
+        """
+        dead = OrderedSet()
+        for g in graphs:
+            dead.update(self.nodes[g])
+
+        # Free variable totals would otherwise be updated for each edge
+        self.events.invalidate_nesting()
+
+        others = OrderedSet()
+        for node in dead:
+            self._process_inputs(node, -1)
+            others.update(inp for inp in node.inputs if inp not in dead)
+
+        for node in dead:
+            self.uses.pop(node, None)
+            self.all_nodes.remove(node)
+            self.events.drop_node(node)
+
+        self._maybe_drop_nodes(others)
+
     def _process_edge(self, node, key, inp, direction):
         """Add/remove an edge between two nodes.
 
@@ -10,6 +10,7 @@ from functools import reduce
 from itertools import count
 from typing import Optional
 from warnings import warn
+from weakref import WeakSet
 
 from ovld import ovld
 
@@ -206,11 +207,15 @@ def type_fixer(finder, monomorphizer=None):
 _count = count(1)
 
 
+# Constants whose abstract must be kept as is by monomorphization
+_forced_abstract = WeakSet()
+
+
 def _const(v, t):
     ct = Constant(v)
     ct.abstract = t
     if t is not None:
-        ct.force_abstract = True
+        _forced_abstract.add(ct)
     return ct
 
 
@@ -710,7 +715,7 @@ class Monomorphizer:
             old_ref = _normalize_context(old_ref)
             if old_ref is None:
                 assert node.abstract is not None
-            elif getattr(old_ref.node, "force_abstract", False):
+            elif old_ref.node in _forced_abstract:
                 assert old_ref.node.abstract is not None
                 node.abstract = old_ref.node.abstract
             elif old_ref in self.engine.cache.cache:
@@ -6,6 +6,26 @@ from ..operations import max_pool2d_grad, zeros_like
 from . import primitives as P
 
 
+def max_pool2d_out_size(
+    size, kernel_size, stride, padding, dilation, ceil_mode
+):
+    """Return the size of max_pool2d's output along one axis.
+
+    This follows the formula of torch.nn.MaxPool2d. In ceil mode, the last
+    window may go past the end of the input, but it must start inside the
+    input or its left padding. The backends use this function too, so that
+    they agree with the inferred shape.
+    """
+    span = size + 2 * padding - dilation * (kernel_size - 1) - 1
+    if ceil_mode:
+        out = -(-span // stride) + 1
+        if (out - 1) * stride >= size + padding:
+            out -= 1
+    else:
+        out = span // stride + 1
+    return out
+
+
 @standard_prim(P.max_pool2d)
 async def infer_max_pool2d(
     self,
@@ -19,9 +39,6 @@ async def infer_max_pool2d(
 ):
     """Infer the return type of primitive `max_pool2d`."""
     # TODO: _shape_type should not allow float to be converted to uint
-    # TODO: support ceil_mode == True
-
-    assert ceil_mode.xvalue() is False
 
     h_in, w_in = input.xshape()[2:]
 
@@ -41,20 +58,19 @@ async def infer_max_pool2d(
         self.require_constant(e, argnum=f'"4:dilation[{edx}]"')
         for edx, e in enumerate(dilation.elements)
     )
+    ceil_mode = self.require_constant(ceil_mode, argnum='"5:ceil_mode"')
 
     N = input.xshape()[0]
     C_out = input.xshape()[1]
 
     # Based on formulae in shape section of:
     # https://pytorch.org/docs/stable/nn.html#torch.nn.MaxPool2d
-    H_out = (
-        (h_in + 2 * padding[0] - dilation[0] * (kernel_size[0] - 1) - 1)
-        // stride[0]
-    ) + 1
-    W_out = (
-        (w_in + 2 * padding[1] - dilation[1] * (kernel_size[1] - 1) - 1)
-        // stride[1]
-    ) + 1
+    H_out = max_pool2d_out_size(
+        h_in, kernel_size[0], stride[0], padding[0], dilation[0], ceil_mode
+    )
+    W_out = max_pool2d_out_size(
+        w_in, kernel_size[1], stride[1], padding[1], dilation[1], ceil_mode
+    )
 
     out_shape = (N, C_out, int(H_out), int(W_out))
 
@@ -30,14 +30,8 @@ from . import primitives as P
 def pyimpl_take_grad_inp(nb_indices, indices, values):
     """Implement `take_grad_inp`."""
     row_size = values.shape[-1]
-    broadcastable_indices = indices.reshape(tuple(indices.shape) + (1,))
     output = np.zeros((nb_indices, row_size), dtype=values.dtype)
-    for i in range(nb_indices):
-        output[i] = (
-            ((broadcastable_indices == i) * values)
-            .reshape((-1, row_size))
-            .sum(axis=0)
-        )
+    np.add.at(output, indices.reshape(-1), values.reshape((-1, row_size)))
     return output
 
 
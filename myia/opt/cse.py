@@ -1,7 +1,12 @@
-"""Common subexpression elimination."""
+"""Common subexpression elimination.
+
+CSE is incremental: each GraphManager gets a hash-consing table that maps the
+structure of a node to the node that represents it. The table is updated from
+the manager's events, so that each CSE pass only examines the nodes that were
+added, or whose inputs changed, since the previous pass.
+"""
 
 
-from collections import defaultdict
 from dataclasses import dataclass
 
 from ..graph_utils import toposort
@@ -9,68 +14,134 @@ from ..ir import succ_incoming
 from ..utils import tracer
 
 
-def group_nodes(root, manager):
-    """Group together all nodes that could be merged.
+def cse_key(node):
+    """Return a key such that nodes with the same key can be merged.
 
-    Some nodes in some groups may end up being unmergeable.
+    Two applications can be merged if they are in the same graph and have
+    the same inputs, and two constants can be merged if they have the same
+    value and type. Returns None for nodes that should never be merged.
     """
-    hashes = {}
-    groups = defaultdict(list)
-    manager.add_graph(root)
+    if node.is_apply():
+        return (node.graph, *node.inputs)
+    elif node.is_constant():
+        key = (type(node.value), node.value, node.abstract)
+        try:
+            hash(key)
+        except TypeError:
+            return None
+        return key
+    else:
+        return None
+
+
+class CSEIndex:
+    """Hash-consing table for the nodes of a GraphManager.
+
+    The index listens to the manager's events. New nodes and nodes whose
+    inputs changed are put in a dirty set, which is processed by the next
+    call to run. When the manager is reset, the index is rebuilt from
+    scratch on the next call to run.
+
+    Attributes:
+        events: The manager events that the index is registered on, or
+            None if the index must be rebuilt.
+        table: Map from a key (see cse_key) to the node that represents it.
+        keys: Map from each node in table to its key.
+        dirty: The nodes to examine in the next pass, in insertion order.
 
-    for g in manager.graphs:
-        for node in toposort(g.return_, succ_incoming):
-            if node in hashes:
-                continue
-
-            if node.is_constant():
-                h = hash((node.value, node.abstract))
-            elif node.is_apply():
-                h = hash(tuple(hashes[inp] for inp in node.inputs))
-            elif node.is_parameter():
-                h = hash(node)
-            else:  # pragma: no cover
-                raise TypeError(f"Unknown node type: {node}")
+    """
 
-            hashes[node] = h
-            groups[h, node.graph].append(node)
-    return groups
+    def __init__(self):
+        """Initialize a CSEIndex."""
+        self.events = None
+        self.table = {}
+        self.keys = {}
+        self.dirty = {}
+
+    def attach(self, manager):
+        """Register on the manager's events and mark all its nodes dirty."""
+        evts = manager.events
+        evts.add_node.register(self._on_add_node)
+        evts.drop_node.register(self._on_drop_node)
+        evts.add_edge.register(self._on_change_edge)
+        evts.drop_edge.register(self._on_change_edge)
+        evts.reset.register(self._on_reset)
+        self.events = evts
+        self.table = {}
+        self.keys = {}
+        self.dirty = {}
+        for g in manager.graphs:
+            for node in toposort(g.return_, succ_incoming):
+                self.dirty[node] = None
+
+    def _forget(self, node):
+        key = self.keys.pop(node, None)
+        if key is not None and self.table.get(key, None) is node:
+            del self.table[key]
+
+    def _on_add_node(self, event, node):
+        self.dirty[node] = None
+
+    def _on_drop_node(self, event, node):
+        self.dirty.pop(node, None)
+        self._forget(node)
+
+    def _on_change_edge(self, event, node, key, inp):
+        self._forget(node)
+        self.dirty[node] = None
+
+    def _on_reset(self, event):
+        self.events = None
+
+    def run(self, manager):
+        """Merge the dirty nodes with equivalent nodes.
+
+        Returns:
+            Whether any node was merged.
+
+        """
+        if self.events is not manager.events:
+            self.attach(manager)
+        changes = False
+        table = self.table
+        while self.dirty:
+            # Merging a node dirties its users, which are examined in the
+            # next round.
+            todo, self.dirty = self.dirty, {}
+            for node in todo:
+                if node not in manager.all_nodes:
+                    continue
+                key = cse_key(node)
+                if key is None:
+                    continue
+                main = table.get(key, None)
+                if (
+                    main is None
+                    or main is node
+                    or main not in manager.all_nodes
+                    or cse_key(main) != key
+                ):
+                    self._forget(node)
+                    table[key] = node
+                    self.keys[node] = key
+                else:
+                    changes = True
+                    manager.replace(node, main)
+        return changes
 
 
 def cse(root, manager):
-    """Apply CSE on root."""
-    manager.gc()
-    groups = group_nodes(root, manager)
-    changes = False
-
-    # Note: this relies on dict keeping insertion order, so that the groups
-    # dict is basically topologically ordered.
-
-    for _, group in groups.items():
-        main, *others = group
-        for other in others:
-            assert main.graph is other.graph
+    """Apply CSE on root.
 
-            if main.is_constant() and other.is_constant():
-                repl = (
-                    main.abstract == other.abstract
-                    and main.value == other.value
-                )
-
-            elif main.is_apply() and other.is_apply():
-                # The inputs to both should have been merged beforehand
-                # because groups is topologically sorted
-                in1 = main.inputs
-                in2 = other.inputs
-                repl = len(in1) == len(in2) and all(
-                    i1 is i2 for i1, i2 in zip(in1, in2)
-                )
-
-            if repl:
-                changes = True
-                manager.replace(other, main)
-
-    return changes
+    The index is stored on the manager, which already references it through
+    its events, so that it is collected along with the manager.
+    """
+    manager.gc()
+    manager.add_graph(root)
+    index = getattr(manager, "_cse_index", None)
+    if index is None:
+        index = manager._cse_index = CSEIndex()
+    return index.run(manager)
 
 
 @dataclass
@@ -93,4 +164,4 @@ class CSE:
             return {"changes": chg and self.report_changes}
 
 
-__all__ = ["CSE", "cse"]
+__all__ = ["CSE", "CSEIndex", "cse", "cse_key"]
@@ -60,7 +60,9 @@ class ValuePropagator:
             self.add_value(p, WILDCARD, ANYTHING)
         for ct in self.manager.all_nodes:
             if ct.is_constant():
-                if isinstance(ct.value, tuple):
+                if isinstance(ct.value, tuple) or not _hashable(ct.value):
+                    # Arrays and other unhashable values can't be tracked
+                    # individually, but they are never graphs anyway.
                     self.add_value(ct, WILDCARD, ANYTHING)
                 else:
                     self.add_value(ct, ANYTHING, ct.value)
@@ -242,6 +244,14 @@ class ValuePropagator:
             self.passthrough(coll, out, need)
 
 
+def _hashable(value):
+    try:
+        hash(value)
+    except TypeError:
+        return False
+    return True
+
+
 def _split_need(need):
     if need is ANYTHING:
         here, others = None, need
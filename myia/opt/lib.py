@@ -1,13 +1,18 @@
 """Library of optimizations."""
 
+from weakref import WeakKeyDictionary
+
+import numpy as np
 from ovld import ovld
 
 from .. import operations
 from ..abstract import (
     DEAD,
+    AbstractArray,
     AbstractFunction,
     AbstractFunctionUnique,
     AbstractJTagged,
+    AbstractValue,
     abstract_check,
     abstract_clone,
     build_value,
@@ -25,7 +30,7 @@ from ..operations.macro_typeof import typeof
 from ..operations.op_gadd import gadd
 from ..operations.op_zeros_like import zeros_like
 from ..operations.utils import CompositePrimitive
-from ..utils import tracer
+from ..utils import Partializable, tracer
 from ..utils.errors import untested
 from ..utils.unify import Var, var
 from ..utils.variables import (
@@ -47,7 +52,7 @@ from ..utils.variables import (
     Ys,
     Z,
 )
-from ..xtype import Number
+from ..xtype import Number, type_to_np_dtype
 from .opt import (
     GraphTransform,
     PatternSubstitutionOptimization as psub,
@@ -451,6 +456,9 @@ def unfuse_composite(resources, node, equiv):
             ng.output = self.repl[g.output]
 
     g = equiv[G].value
+    if g.free_variables_total:
+        # Closures are left to the backend
+        return node
     xs = equiv[Xs]
     r = UnfuseRemapper(g, xs[0])
     r.run()
@@ -521,6 +529,126 @@ def simplify_array_map(resources, node, equiv):
             return True
 
 
+def _array_shape(node):
+    a = node.abstract
+    return a.xshape() if isinstance(a, AbstractArray) else None
+
+
+def _is_scalar_kernel(fn):
+    """Check whether fn can be inlined in the graph built by fuse_array_map.
+
+    That is the case of primitives, and of graphs that only call primitives
+    and have no free variables, such as the graphs fuse_array_map builds.
+    """
+    if fn.is_constant(Primitive):
+        return True
+    elif fn.is_constant_graph():
+        g = fn.value
+        return (
+            not g.free_variables_total
+            and not g.graphs_used
+            and all(
+                node.inputs[0].is_constant(Primitive)
+                for node in g.nodes
+                if node.is_apply()
+            )
+        )
+    else:
+        return False
+
+
+def _distributed_scalar(x):
+    """Return c if x is distribute(scalar_to_array(c, t), shp), else None."""
+    if x.is_apply(P.distribute) and x.inputs[1].is_apply(P.scalar_to_array):
+        c = x.inputs[1].inputs[1]
+        if (
+            c.is_constant()
+            and c.abstract is not None
+            and c.abstract.xtype() == x.abstract.element.xtype()
+        ):
+            return c
+    return None
+
+
+@pattern_replacer(P.array_map, C, Xs)
+def fuse_array_map(resources, node, equiv):
+    """Fuse array_maps whose only users are array_maps of the same shape.
+
+    The result is a single array_map on a scalar graph that computes the whole
+    chain, so that the intermediate arrays are never built. Scalars broadcast
+    with distribute(scalar_to_array(...)) become constants of that graph.
+
+    This must run after unfuse_composite, which would undo it.
+
+    Example:
+        array_map(scalar_add, array_map(scalar_mul, xs, ys), zs)
+            => array_map(lambda x, y, z: x * y + z, xs, ys, zs)
+
+    """
+    fn = equiv[C]
+    shape = _array_shape(node)
+    uses = node.graph.manager.uses
+
+    if shape is None or not _is_scalar_kernel(fn):
+        return node
+
+    # Grow the region of fused array_maps from node. An array_map that is
+    # rejected because one of its users is not in the region yet is checked
+    # again when that user is added.
+    region = {node}
+    todo = list(equiv[Xs])
+    while todo:
+        x = todo.pop()
+        if (
+            x not in region
+            and x.is_apply(P.array_map)
+            and _is_scalar_kernel(x.inputs[1])
+            and _array_shape(x) == shape
+            and all(user in region for user, _ in uses[x])
+        ):
+            region.add(x)
+            todo.extend(x.inputs[2:])
+
+    if len(region) == 1:
+        return node
+
+    ng = Graph()
+    leaves = []
+    scalars = {}
+
+    def call(fn, args, abstract):
+        if fn.is_constant(Primitive):
+            res = ng.apply(fn, *args)
+            res.abstract = abstract
+            return res
+        else:
+            clone = GraphCloner(inline=(fn.value, ng, args), total=False)
+            return clone[fn.value.output]
+
+    def scalar(x):
+        if x not in scalars:
+            ct = _distributed_scalar(x)
+            if x in region:
+                args = [scalar(y) for y in x.inputs[2:]]
+                scalars[x] = call(x.inputs[1], args, x.abstract.element)
+            elif ct is not None:
+                scalars[x] = ct
+            else:
+                p = ng.add_parameter()
+                p.abstract = x.abstract.element
+                leaves.append(x)
+                scalars[x] = p
+        return scalars[x]
+
+    ng.output = scalar(node)
+    _set_out_abstract(ng, ng.output.abstract)
+    ct = Constant(ng)
+    ct.abstract = ng.abstract
+    new_node = node.graph.apply(node.inputs[0], ct, *leaves)
+    new_node.abstract = node.abstract
+    return new_node
+
+
 #############################
 # Env-related optimizations #
 #############################
@@ -729,6 +857,81 @@ def force_constants(resources, node, equiv):
     return ct
 
 
+_foldable_types = (np.ndarray, np.generic, bool, int, float, AbstractValue)
+
+
+def _is_foldable(v):
+    if isinstance(v, tuple):
+        return all(_is_foldable(x) for x in v)
+    return isinstance(v, _foldable_types)
+
+
+class ConstantFolder(Partializable):
+    """Evaluate the array primitives whose inputs are all constants.
+
+    Applications are evaluated with the python_implementation of their
+    primitive, and folded into a constant if the resulting array has at
+    most `max_size` elements. Larger arrays are still computed at runtime,
+    so that they do not bloat the graph. `folded` counts the applications
+    that were folded.
+    """
+
+    def __init__(self, max_size=10000):
+        """Initialize a ConstantFolder."""
+        self.max_size = max_size
+        self.folded = 0
+
+    def fold(self, implementations, node):
+        """Return a constant for node, or None if it cannot be folded."""
+        a = node.abstract
+        if not isinstance(a, AbstractArray) or not node.is_apply():
+            return None
+        fn, *args = node.inputs
+        if not fn.is_constant(Primitive) or fn.value is P.return_:
+            return None
+        if not all(
+            arg.is_constant(Primitive)
+            or arg.is_constant()
+            and _is_foldable(arg.value)
+            for arg in args
+        ):
+            return None
+        shape = a.xshape()
+        if all(isinstance(d, int) for d in shape) and (
+            np.prod(shape, dtype=int) > self.max_size
+        ):
+            return None
+        try:
+            impl, *args = [
+                implementations[x.value]
+                if x.is_constant(Primitive)
+                else x.value
+                for x in node.inputs
+            ]
+            dtype = type_to_np_dtype(a.element.xtype())
+            value = np.array(impl(*args), dtype=dtype)
+        except Exception:
+            # Missing implementations or errors are left to the runtime
+            return None
+        if value.size > self.max_size or not all(
+            d == d2 for d, d2 in zip(shape, value.shape) if isinstance(d, int)
+        ):
+            return None
+        self.folded += 1
+        ct = Constant(value)
+        ct.abstract = a
+        return ct
+
+
+@pattern_replacer("just", X, interest=None)
+def fold_constants(resources, node, equiv):
+    """Replace array primitives on constants by their value."""
+    folder = getattr(resources, "constant_folder", None)
+    if folder is None:
+        return None
+    return folder.fold(resources.py_implementations, node)
+
+
 ############
 # Inlining #
 ############
@@ -917,6 +1120,62 @@ def _set_out_abstract(g, a):
     g.return_.inputs[0].abstract = AbstractFunctionUnique([a], a)
 
 
+class IncorporationBudget(Partializable):
+    """Bound the duplication of graphs by the incorporate_* optimizations.
+
+    Each of these optimizations clones the graphs it transforms. The budget
+    refuses to transform graphs that have more than `max_graph_size` nodes,
+    and stops the transforms once the number of cloned nodes exceeds
+    `max_growth` times the number of nodes in the manager when it was first
+    charged. Transforms that were already computed are free, since
+    GraphTransform memoizes them.
+    """
+
+    def __init__(self, max_graph_size=1000, max_growth=1.0):
+        """Initialize an IncorporationBudget."""
+        self.max_graph_size = max_graph_size
+        self.max_growth = max_growth
+        self.spent = WeakKeyDictionary()
+
+    def charge(self, manager, transforms):
+        """Charge the cost of a list of (transform, graph, *args) entries.
+
+        Returns:
+            Whether the transforms fit in the budget. Nothing is charged if
+            they do not.
+
+        """
+        cost = 0
+        for transform, g, *args in transforms:
+            if not transform.is_cached(g, *args):
+                size = sum(len(sg.nodes) for sg in g.scope)
+                if size > self.max_graph_size:
+                    return False
+                cost += size
+        limit, spent = self.spent.get(
+            manager, (self.max_growth * len(manager.all_nodes), 0)
+        )
+        if spent + cost > limit:
+            return False
+        self.spent[manager] = (limit, spent + cost)
+        return True
+
+
+def _within_budget(resources, node, *transforms):
+    """Check whether transforms fit in the resources' IncorporationBudget.
+
+    The budget only applies at opt_level 2, which enables all the
+    incorporate_* optimizations, and level 3 lifts the limit.
+    incorporate_call_through_switch, which also runs at level 1, does not
+    go through the budget, so that level 2 never refuses a rewrite that
+    level 1 does.
+    """
+    budget = getattr(resources, "incorporation_budget", None)
+    if budget is None or getattr(resources, "opt_level", 1) != 2:
+        return True
+    return budget.charge(node.graph.manager, transforms)
+
+
 @GraphTransform
 def getitem_transform(orig_graph, idx):
     """Map to a graph that only returns the idx-th output.
@@ -945,7 +1204,9 @@ def incorporate_getitem(resources, node, equiv):
     """
     g = equiv[G].value
     idx = equiv[C].value
-    if check_used_once(g):
+    if check_used_once(g) and _within_budget(
+        resources, node, (getitem_transform, g, idx)
+    ):
         return node.graph.apply(getitem_transform(g, idx), *equiv[Xs])
 
 
@@ -966,7 +1227,16 @@ def incorporate_getitem_through_switch(resources, node, equiv):
     idx = equiv[C].value
     xs = equiv[Xs]
 
-    if check_used_once(g1) and check_used_once(g2):
+    if (
+        check_used_once(g1)
+        and check_used_once(g2)
+        and _within_budget(
+            resources,
+            node,
+            (getitem_transform, g1, idx),
+            (getitem_transform, g2, idx),
+        )
+    ):
         g1t = getitem_transform(g1, idx)
         g2t = getitem_transform(g2, idx)
 
@@ -998,7 +1268,9 @@ def incorporate_env_getitem(resources, node, equiv):
     g = equiv[G].value
     key = equiv[C].value
     dflt = equiv[Y]
-    if check_used_once(g):
+    if check_used_once(g) and _within_budget(
+        resources, node, (env_getitem_transform, g, key, dflt)
+    ):
         return node.graph.apply(env_getitem_transform(g, key, dflt), *equiv[Xs])
 
 
@@ -1011,7 +1283,16 @@ def incorporate_env_getitem_through_switch(resources, node, equiv):
     dflt = equiv[Y]
     xs = equiv[Xs]
 
-    if check_used_once(g1) and check_used_once(g2):
+    if (
+        check_used_once(g1)
+        and check_used_once(g2)
+        and _within_budget(
+            resources,
+            node,
+            (env_getitem_transform, g1, key, dflt),
+            (env_getitem_transform, g2, key, dflt),
+        )
+    ):
         g1t = env_getitem_transform(g1, key, dflt)
         g2t = env_getitem_transform(g2, key, dflt)
 
@@ -1050,8 +1331,11 @@ def incorporate_call(resources, node, equiv):
     g = equiv[G].value
     xs = equiv[Xs]
     ys = equiv[Ys]
-    if check_used_once(g):
-        g2 = call_output_transform(g, tuple(y.abstract for y in ys))
+    abstracts = tuple(y.abstract for y in ys)
+    if check_used_once(g) and _within_budget(
+        resources, node, (call_output_transform, g, abstracts)
+    ):
+        g2 = call_output_transform(g, abstracts)
         return node.graph.apply(g2, *xs, *ys)
 
 
@@ -1071,10 +1355,11 @@ def incorporate_call_through_switch(resources, node, equiv):
     g2 = equiv[G2].value
     xs = equiv[Xs]
     ys = equiv[Ys]
+    abstracts = tuple(y.abstract for y in ys)
 
     if check_used_once(g1) and check_used_once(g2):
-        g1t = call_output_transform(g1, tuple(y.abstract for y in ys))
-        g2t = call_output_transform(g2, tuple(y.abstract for y in ys))
+        g1t = call_output_transform(g1, abstracts)
+        g2t = call_output_transform(g2, abstracts)
 
         new = ((P.switch, equiv[X], g1t, g2t), *xs, *ys)
         return sexp_to_node(new, node.graph)
@@ -7,7 +7,7 @@ from ..info import About
 from ..ir import Apply, Graph, manage, sexp_to_node
 from ..operations import Primitive
 from ..utils import OrderedSet, tracer
-from ..utils.unify import Unification, Var
+from ..utils.unify import SVar, Unification, Var
 
 
 class PatternSubstitutionOptimization:
@@ -110,6 +110,104 @@ def pattern_replacer(*pattern, interest=False):
     return deco
 
 
+_WILDCARD = object()
+
+
+# Only constants of these types are indexed, because they can only be
+# unified with constants that compare equal to them.
+_indexed_constant_types = (Primitive, bool, int, float, str, type(None))
+
+
+def _pattern_keys(node, keys):
+    """Append the keys of a pattern's nodes to keys, in preorder."""
+    if node.is_apply() and not any(inp.is_special(SVar) for inp in node.inputs):
+        keys.append(("apply", len(node.inputs)))
+        for inp in node.inputs:
+            _pattern_keys(inp, keys)
+    elif node.is_constant(_indexed_constant_types):
+        keys.append(("constant", node.value))
+    else:
+        # Variables, and applications with a variable number of arguments
+        keys.append(_WILDCARD)
+    return keys
+
+
+def _node_key(node):
+    """Return the key of a node, or None if only wildcards can match it."""
+    if node.is_apply():
+        return ("apply", len(node.inputs))
+    elif node.is_constant():
+        key = ("constant", node.value)
+        try:
+            hash(key)
+        except TypeError:
+            return None
+        return key
+    else:
+        return None
+
+
+class _TreeNode:
+    __slots__ = ("children", "opts")
+
+    def __init__(self):
+        self.children = {}
+        self.opts = []
+
+
+class DiscriminationTree:
+    """Index of PatternSubstitutionOptimizations by pattern.
+
+    Each pattern is flattened in preorder to a sequence of keys, one for each
+    node of the pattern: applications are keyed by their number of inputs,
+    constants by their value, and variables are wildcards. The sequences are
+    stored in a trie, so that all the patterns that may match a node are
+    found with a single traversal of the node's inputs, only as deep as the
+    deepest pattern.
+
+    The match is conservative: a pattern returned by `match` may still fail
+    to unify with the node, e.g. because a variable appears twice or does
+    not satisfy its filter, but a pattern that is not returned cannot.
+    """
+
+    def __init__(self):
+        """Initialize an empty DiscriminationTree."""
+        self.root = _TreeNode()
+
+    def add(self, opt):
+        """Index a PatternSubstitutionOptimization."""
+        tree = self.root
+        for key in _pattern_keys(opt.pattern, []):
+            tree = tree.children.setdefault(key, _TreeNode())
+        tree.opts.append(opt)
+
+    def match(self, node):
+        """Return the set of optimizations whose pattern may match node."""
+        results = set()
+        self._match(self.root, (node, None), results)
+        return results
+
+    def _match(self, tree, todo, results):
+        # todo is a linked list of the nodes that remain to be matched, in
+        # preorder. Patterns and nodes are only traversed as far as needed.
+        if todo is None:
+            results.update(tree.opts)
+            return
+        node, rest = todo
+        children = tree.children
+        wild = children.get(_WILDCARD, None)
+        if wild is not None:
+            self._match(wild, rest, results)
+        key = _node_key(node)
+        if key is not None:
+            child = children.get(key, None)
+            if child is not None:
+                if node.is_apply():
+                    for inp in reversed(node.inputs):
+                        rest = (inp, rest)
+                self._match(child, rest, results)
+
+
 class NodeMap:
     """Mapping of node to optimizer.
 
@@ -121,11 +219,18 @@ class NodeMap:
 
     Other than None, only primitives are currently supported as interests.
 
+    Arguments:
+        index: Whether to index the patterns of the
+            PatternSubstitutionOptimizations in a DiscriminationTree, so
+            that `get` only returns the ones whose pattern may match.
+
     """
 
-    def __init__(self):
+    def __init__(self, index=True):
         """Create a NodeMap."""
         self._d = dict()
+        self.index = DiscriminationTree() if index else None
+        self._indexed = set()
 
     def register(self, interests, opt=None):
         """Register an optimizer for some interests."""
@@ -145,6 +250,11 @@ class NodeMap:
 
         # There could be the option to return do_register also.
         do_register(opt)
+        if self.index is not None and isinstance(
+            opt, PatternSubstitutionOptimization
+        ):
+            self.index.add(opt)
+            self._indexed.add(opt)
 
     def get(self, node):
         """Get a list of optimizers that could apply for a node."""
@@ -157,15 +267,108 @@ class NodeMap:
                 res.extend(self._d.get(Graph, []))
             if node.inputs[0].is_apply():
                 res.extend(self._d.get(Apply, []))
+        if self._indexed and any(opt in self._indexed for opt in res):
+            matches = self.index.match(node)
+            res = [
+                opt for opt in res if opt not in self._indexed or opt in matches
+            ]
         return res
 
 
+class _DirtyRegion:
+    """Track the nodes and graphs of a manager that changed between passes.
+
+    The region listens to the manager's events. When the manager is reset,
+    the region is invalidated and the next pass must visit all the nodes.
+
+    Attributes:
+        events: The manager events the region is registered on, or None if
+            the region is invalid.
+        root: The graph the last pass was applied on.
+        nodes: The nodes that were added or whose inputs changed.
+        graphs: The graphs that contain these nodes, or whose constants
+            were added as inputs to a node.
+
+    """
+
+    def __init__(self):
+        self.events = None
+        self.root = None
+        self.nodes = {}
+        self.graphs = {}
+
+    def attach(self, manager, root):
+        if self.events is not manager.events:
+            evts = manager.events
+            evts.add_node.register(self._on_add_node)
+            evts.drop_node.register(self._on_drop_node)
+            evts.add_edge.register(self._on_change_edge)
+            evts.drop_edge.register(self._on_change_edge)
+            evts.reset.register(self._on_reset)
+            self.events = evts
+        self.root = root
+        self.nodes = {}
+        self.graphs = {}
+
+    def valid(self, manager, root):
+        return self.events is manager.events and self.root is root
+
+    def take(self):
+        nodes, graphs = self.nodes, self.graphs
+        self.nodes = {}
+        self.graphs = {}
+        return nodes, graphs
+
+    def _on_add_node(self, event, node):
+        self.nodes[node] = None
+        if node.graph is not None:
+            self.graphs[node.graph] = None
+
+    def _on_drop_node(self, event, node):
+        self.nodes.pop(node, None)
+
+    def _on_change_edge(self, event, node, key, inp):
+        self.nodes[node] = None
+        if node.graph is not None:
+            self.graphs[node.graph] = None
+        if inp.is_constant_graph():
+            self.graphs[inp.value] = None
+
+    def _on_reset(self, event):
+        self.events = None
+
+
 class LocalPassOptimizer:
-    """Apply a set of local optimizations in bfs order."""
+    """Apply a set of local optimizations in bfs order.
+
+    Arguments:
+        opts: The optimizations to apply.
+        name: The name of the optimizer.
+        opt_level: The optimizer does nothing if the `opt_level` of the
+            resources is lower than this.
+        incremental: If True, the optimizer remembers which nodes were
+            modified in the manager since its last pass on the same graph,
+            and only visits these nodes and their users, up to
+            `user_depth` levels. A full pass is only done on the first
+            call, when the graph changes, or after the manager is reset.
+        user_depth: How many levels of users of the modified nodes to
+            visit, which should be the depth of the deepest pattern.
+
+    """
 
-    def __init__(self, *opts, name="_local_opt"):
+    def __init__(
+        self,
+        *opts,
+        name="_local_opt",
+        opt_level=0,
+        incremental=True,
+        user_depth=2,
+    ):
         """Initialize a LocalPassOptimizer."""
         self.name = name
+        self.opt_level = opt_level
+        self.incremental = incremental
+        self.user_depth = user_depth
         self.node_map = NodeMap()
         for opt in opts:
             self.node_map.register(getattr(opt, "interest", None), opt)
@@ -177,6 +380,9 @@ class LocalPassOptimizer:
         bfs manner while avoiding parts of the graph that are dropped
         due to optimizations.
         """
+        if self.opt_level > getattr(resources, "opt_level", 1):
+            return {"changes": False}
+
         if manager is not None:
             mng = manager
             mng.add_graph(graph)
@@ -186,9 +392,43 @@ class LocalPassOptimizer:
         else:
             mng = manage(graph)
 
+        region = None
+        if self.incremental:
+            # The regions are stored on the manager, which references them
+            # through its events anyway, so that they are collected with it.
+            regions = getattr(mng, "_dirty_regions", None)
+            if regions is None:
+                regions = mng._dirty_regions = {}
+            region = regions.get(self, None)
+            if region is None:
+                region = regions[self] = _DirtyRegion()
+
+        if region is not None and region.valid(mng, graph):
+            changes, visits = self._incremental_pass(resources, mng, region)
+            tracer().emit_visits(
+                optimizer=self,
+                visits=visits,
+                nodes=len(mng.all_nodes),
+                incremental=True,
+            )
+            return {"changes": changes}
+
+        if region is not None:
+            region.attach(mng, graph)
+        changes, visits = self._full_pass(resources, mng, graph)
+        tracer().emit_visits(
+            optimizer=self,
+            visits=visits,
+            nodes=len(mng.all_nodes),
+            incremental=False,
+        )
+        return {"changes": changes}
+
+    def _full_pass(self, resources, mng, graph):
         seen = set([graph])
         todo = deque()
         changes = False
+        visits = 0
         todo.append(graph.output)
 
         while len(todo) > 0:
@@ -196,6 +436,7 @@ class LocalPassOptimizer:
             if n in seen or n not in mng.all_nodes:
                 continue
             seen.add(n)
+            visits += 1
 
             new, chg = self.apply_opt(resources, mng, n)
 
@@ -214,7 +455,34 @@ class LocalPassOptimizer:
                 seen.difference_update(uses)
                 todo.extendleft(uses)
 
-        return {"changes": changes}
+        return changes, visits
+
+    def _incremental_pass(self, resources, mng, region):
+        changes = False
+        visits = 0
+        # Each round visits the region that was modified since the previous
+        # one, starting with the modifications made by the other steps.
+        while region.nodes or region.graphs:
+            nodes, graphs = region.take()
+            todo = OrderedSet(n for n in nodes if n in mng.all_nodes)
+            for g in graphs:
+                for ct in mng.graph_constants.get(g, ()):
+                    todo.update(u for u, _ in mng.uses[ct])
+            frontier = todo
+            for _ in range(self.user_depth):
+                frontier = OrderedSet(
+                    u for n in frontier for u, _ in mng.uses[n]
+                )
+                todo.update(frontier)
+
+            for n in todo:
+                if n not in mng.all_nodes:
+                    continue
+                visits += 1
+                _, chg = self.apply_opt(resources, mng, n)
+                changes |= chg
+
+        return changes, visits
 
     def apply_opt(self, resources, mng, n):
         """Apply optimizations passes according to the node map."""
@@ -275,8 +543,13 @@ class GraphTransform:
             cache[args] = self.compute(graph, *args)
         return cache[args]
 
+    def is_cached(self, graph, *args):
+        """Check whether the transform of graph for args was computed."""
+        return graph in self.cache and args in self.cache[graph]
+
 
 __all__ = [
+    "DiscriminationTree",
     "GraphTransform",
     "LocalPassOptimizer",
     "NodeMap",
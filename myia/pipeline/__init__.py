@@ -1,5 +1,6 @@
 """Contains Myia's pipeline definitions, steps, resources, etc."""
 
+from .cache import *
 from .pipeline import *
 from .resources import *
 from .standard import *
@@ -0,0 +1,645 @@
+"""Persistent on-disk cache for the results of the compilation pipeline.
+
+The cache stores the validated graph produced by the front half of the
+pipeline (parse up to validate), so that a fresh process can skip directly to
+the backend-specific steps (compile and wrap).
+"""
+
+import copyreg
+import fcntl
+import hashlib
+import importlib
+import io
+import json
+import os
+import pickle
+import time
+import types
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import is_dataclass
+
+import numpy as np
+
+from .. import xtype
+from ..abstract import AbstractValue
+from ..info import NamedDebugInfo
+from ..ir import ANFNode, Apply, Constant, Graph, Parameter, manage
+from ..operations import Operation, Primitive
+from ..utils import Named, intern
+
+#################
+# Serialization #
+#################
+
+
+# Modules whose singletons (primitives, tracks, etc.) must keep their identity.
+_singleton_modules = [
+    "myia.abstract.data",
+    "myia.abstract.ref",
+    "myia.ir.anf",
+    "myia.operations.primitives",
+    "myia.utils.misc",
+]
+
+_singletons = None
+
+
+def _get_singletons():
+    global _singletons
+    if _singletons is None:
+        from ..abstract.data import Track
+        from ..abstract.ref import Context, Contextless
+
+        _singletons = {}
+        for modname in _singleton_modules:
+            mod = importlib.import_module(modname)
+            for name, value in vars(mod).items():
+                if isinstance(
+                    value, (Named, Track, Context, Contextless, Primitive)
+                ):
+                    _singletons.setdefault(id(value), (modname, name))
+    return _singletons
+
+
+def _all_subclasses(cls):
+    todo = [cls]
+    for c in todo:
+        todo.extend(c.__subclasses__())
+    return todo
+
+
+def _rebuild_abstract(cls, state):
+    inst = object.__new__(cls)
+    inst.__dict__.update(state)
+    return intern(inst)
+
+
+def _reduce_abstract(a):
+    # Interning data ($intern_hash, etc.) and memoized results (_broad,
+    # _concrete, etc.) are recomputed in the loading process.
+    state = {
+        k: v
+        for k, v in vars(a).items()
+        if not k.startswith(("$", "_")) or k == "_incomplete"
+    }
+    return (_rebuild_abstract, (type(a), state))
+
+
+def _rebuild_context(parent, graph, argkey):
+    from ..abstract.ref import Context
+
+    return Context(parent, graph, argkey)
+
+
+def _reduce_context(ctx):
+    return (_rebuild_context, (ctx.parent, ctx.graph, ctx.argkey))
+
+
+_node_kinds = {Apply: "apply", Parameter: "parameter", Constant: "constant"}
+_node_classes = {v: k for k, v in _node_kinds.items()}
+
+
+class _GraphPickler(pickle.Pickler):
+    """Pickler that flattens graphs into one record per graph/node.
+
+    Graphs and nodes are replaced by persistent ids and queued, so that the
+    recursion depth of the pickler does not grow with the size of the graph.
+    """
+
+    def __init__(self, file):
+        super().__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        from ..abstract.ref import Context
+
+        self.dispatch_table = copyreg.dispatch_table.copy()
+        for cls in _all_subclasses(AbstractValue):
+            self.dispatch_table[cls] = _reduce_abstract
+        self.dispatch_table[Context] = _reduce_context
+        self.singletons = _get_singletons()
+        self.ids = {}
+        self.queue = deque()
+
+    def _index(self, obj):
+        if obj not in self.ids:
+            self.ids[obj] = len(self.ids)
+            self.queue.append(obj)
+        return self.ids[obj]
+
+    def persistent_id(self, obj):
+        if id(obj) in self.singletons:
+            return ("singleton",) + self.singletons[id(obj)]
+        elif isinstance(obj, Primitive):
+            raise TypeError(f"Cannot serialize primitive {obj}")
+        elif isinstance(obj, xtype.TypeMeta):
+            if obj._params is None:
+                return ("xtype", obj.__qualname__, None)
+            base = obj.__mro__[1]
+            return ("xtype", base.__qualname__, tuple(obj._params.values()))
+        elif isinstance(obj, Graph):
+            return ("graph", self._index(obj))
+        elif isinstance(obj, ANFNode):
+            kind = _node_kinds.get(type(obj), None)
+            if kind is None:
+                raise TypeError(f"Cannot serialize node {obj}")
+            return ("node", kind, self._index(obj))
+        elif isinstance(obj, NamedDebugInfo):
+            return ("debug", obj.name)
+        else:
+            return None
+
+    def dump_all(self, obj):
+        """Dump obj, followed by the contents of all graphs and nodes."""
+        self.dump(obj)
+        while self.queue:
+            x = self.queue.popleft()
+            if isinstance(x, Graph):
+                state = {
+                    k: v
+                    for k, v in vars(x).items()
+                    if k not in ("_manager", "_user_graph", "_sig")
+                }
+            else:
+                state = {
+                    "inputs": x.inputs,
+                    "value": x.value,
+                    "graph": x.graph,
+                    "abstract": x.abstract,
+                    "annotation": x.annotation,
+                    "debug": x.debug,
+                }
+            self.dump((self.ids[x], state))
+        self.dump(None)
+
+
+class _GraphUnpickler(pickle.Unpickler):
+    """Unpickler for the output of _GraphPickler."""
+
+    def __init__(self, file):
+        super().__init__(file)
+        self.objects = {}
+
+    def persistent_load(self, pid):
+        kind, *args = pid
+        if kind == "xtype":
+            name, params = args
+            t = getattr(xtype, name)
+            return t if params is None else t[params]
+        elif kind in ("graph", "node"):
+            idx = args[-1]
+            if idx not in self.objects:
+                cls = Graph if kind == "graph" else _node_classes[args[0]]
+                self.objects[idx] = object.__new__(cls)
+            return self.objects[idx]
+        elif kind == "debug":
+            return args[0]
+        elif kind == "singleton":
+            modname, name = args
+            return getattr(importlib.import_module(modname), name)
+        else:  # pragma: no cover
+            raise pickle.UnpicklingError(f"Unknown persistent id: {pid}")
+
+    def load_all(self):
+        """Load the object saved with dump_all."""
+        rval = self.load()
+        while True:
+            record = self.load()
+            if record is None:
+                break
+            idx, state = record
+            obj = self.objects[idx]
+            debug_name = state.pop("debug")
+            if isinstance(obj, Graph):
+                obj.__dict__.update(state)
+            else:
+                for k, v in state.items():
+                    setattr(obj, k, v)
+            obj.debug = NamedDebugInfo(obj)
+            obj.debug.name = debug_name
+            if isinstance(obj, Graph):
+                obj._manager = None
+                obj._user_graph = None
+                obj._sig = None
+        return rval
+
+
+def serialize(obj):
+    """Serialize obj, which may contain graphs, to bytes."""
+    buf = io.BytesIO()
+    _GraphPickler(buf).dump_all(obj)
+    return buf.getvalue()
+
+
+def deserialize(data):
+    """Deserialize an object serialized with serialize."""
+    return _GraphUnpickler(io.BytesIO(data)).load_all()
+
+
+###############
+# Fingerprint #
+###############
+
+
+def _is_library_module(modname):
+    root = (modname or "").split(".")[0]
+    return root in ("builtins", "myia", "numpy", "math", "operator")
+
+
+class _Unidentifiable(Exception):
+    """Raised when an object cannot be identified by its contents."""
+
+
+# Immutable types whose repr gives their whole contents
+_repr_types = (
+    np.generic,
+    np.dtype,
+    np.ufunc,
+    types.BuiltinFunctionType,
+    Named,
+    range,
+    slice,
+    type(Ellipsis),
+)
+
+
+def _fingerprint(obj, h, seen):
+    def up(*parts):
+        for part in parts:
+            h.update(str(part).encode())
+            h.update(b"\0")
+
+    if isinstance(obj, (type(None), bool, int, float, complex, str, bytes)):
+        up(type(obj).__name__, repr(obj))
+        return
+
+    if id(obj) in seen:
+        up("seen", seen[id(obj)])
+        return
+    seen[id(obj)] = len(seen)
+
+    if isinstance(obj, (tuple, list)):
+        up(type(obj).__name__, len(obj))
+        for x in obj:
+            _fingerprint(x, h, seen)
+    elif isinstance(obj, (set, frozenset)):
+        # The iteration order of a set depends on the hash seed, so the
+        # elements are fingerprinted separately and sorted.
+        up(type(obj).__name__, len(obj))
+        for digest in sorted(_element_digest(x, seen) for x in obj):
+            h.update(digest)
+    elif isinstance(obj, dict):
+        up("dict", len(obj))
+        for k, v in obj.items():
+            _fingerprint(k, h, seen)
+            _fingerprint(v, h, seen)
+    elif isinstance(obj, np.ndarray):
+        up("ndarray", obj.dtype, obj.shape)
+        h.update(np.ascontiguousarray(obj).tobytes())
+    elif isinstance(obj, types.ModuleType):
+        up("module", obj.__name__)
+        if _is_library_module(obj.__name__):
+            return
+        try:
+            with open(obj.__file__, "rb") as f:
+                h.update(f.read())
+        except (AttributeError, TypeError, OSError):
+            # Modules without a source file, e.g. built-in or namespace
+            raise _Unidentifiable(obj.__name__)
+    elif isinstance(obj, (Operation, Primitive)):
+        up(type(obj).__name__, obj.name)
+    elif isinstance(obj, types.CodeType):
+        up("code", obj.co_argcount, obj.co_kwonlyargcount, obj.co_flags)
+        h.update(obj.co_code)
+        up(obj.co_names, obj.co_varnames, obj.co_freevars, obj.co_cellvars)
+        for c in obj.co_consts:
+            _fingerprint(c, h, seen)
+    elif isinstance(obj, types.FunctionType):
+        up("function", obj.__module__, obj.__qualname__)
+        if _is_library_module(obj.__module__):
+            return
+        _fingerprint(obj.__code__, h, seen)
+        _fingerprint(obj.__defaults__, h, seen)
+        _fingerprint(obj.__kwdefaults__, h, seen)
+        for cell in obj.__closure__ or ():
+            _fingerprint(cell.cell_contents, h, seen)
+        for name in sorted(_code_names(obj.__code__)):
+            if name in obj.__globals__:
+                up("global", name)
+                _fingerprint(obj.__globals__[name], h, seen)
+    elif isinstance(obj, type):
+        up("type", obj.__module__, obj.__qualname__)
+        if _is_library_module(obj.__module__):
+            return
+        for name, value in sorted(vars(obj).items()):
+            if isinstance(
+                value, (types.FunctionType, staticmethod, classmethod, property)
+            ) or (is_dataclass(obj) and name == "__dataclass_fields__"):
+                up("member", name)
+                _fingerprint(_unwrap_member(value), h, seen)
+    elif hasattr(obj, "__dataclass_fields__"):
+        up("dataclass")
+        _fingerprint(type(obj), h, seen)
+        _fingerprint(vars(obj), h, seen)
+    elif isinstance(obj, _repr_types):
+        up("object", type(obj).__module__, type(obj).__qualname__, repr(obj))
+    else:
+        # The repr of other objects may hide mutable state, so we cannot
+        # tell whether they changed between two processes.
+        raise _Unidentifiable(type(obj).__qualname__)
+
+
+def _element_digest(obj, seen):
+    h = hashlib.sha256()
+    _fingerprint(obj, h, dict(seen))
+    return h.digest()
+
+
+def _unwrap_member(value):
+    if isinstance(value, (staticmethod, classmethod)):
+        return value.__func__
+    elif isinstance(value, property):
+        return (value.fget, value.fset)
+    elif isinstance(value, dict):
+        # __dataclass_fields__
+        return tuple((k, repr(f.type)) for k, f in value.items())
+    else:
+        return value
+
+
+def _code_names(code):
+    names = set(code.co_names)
+    for c in code.co_consts:
+        if isinstance(c, types.CodeType):
+            names |= _code_names(c)
+    return names
+
+
+def fingerprint(fn):
+    """Return a stable fingerprint of a function.
+
+    The fingerprint covers the function's bytecode, constants, defaults,
+    closure and (recursively) the user-defined globals it refers to.
+    Functions, types and modules that belong to Myia or to the standard
+    libraries are identified by name only, since they are covered by
+    `myia_version`. Other modules are identified by their source file.
+
+    Returns None if fn refers to an object that cannot be identified by
+    its contents, i.e. an instance of a type that is not known to be
+    immutable.
+    """
+    h = hashlib.sha256()
+    try:
+        _fingerprint(fn, h, {})
+    except _Unidentifiable:
+        return None
+    return h.hexdigest()
+
+
+_myia_version = None
+
+
+def myia_version():
+    """Return a string that identifies the current version of Myia.
+
+    This is a digest of Myia's source files, so that any change to Myia
+    (released or not) invalidates persistent caches.
+    """
+    global _myia_version
+    if _myia_version is None:
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        h = hashlib.sha256()
+        for dirpath, dirnames, filenames in sorted(os.walk(root)):
+            dirnames.sort()
+            for filename in sorted(filenames):
+                if filename.endswith(".py"):
+                    path = os.path.join(dirpath, filename)
+                    h.update(os.path.relpath(path, root).encode())
+                    with open(path, "rb") as f:
+                        h.update(f.read())
+        _myia_version = h.hexdigest()
+    return _myia_version
+
+
+#####################
+# Compilation cache #
+#####################
+
+
+# Pipeline outputs that are saved in the cache
+cache_fields = (
+    "graph",
+    "argspec",
+    "outspec",
+    "orig_argspec",
+    "orig_outspec",
+    "simplify_types",
+)
+
+
+class CompilationCache:
+    """Persistent, size-bounded cache of validated graphs.
+
+    Entries are stored as files in a directory, along with an index that
+    records the Myia version and the size and last access time of each entry.
+    When the limits are exceeded, the least recently used entries are evicted.
+    The whole cache is invalidated if the Myia version changes.
+
+    Updates to the index and to the entries hold a lock on a file in the
+    directory, so several processes may share the same cache.
+
+    Attributes:
+        path: The directory in which to store the cache.
+        max_entries: The maximal number of entries, or None for no limit.
+        max_bytes: The maximal total size of the entries, or None for no
+            limit.
+        stats: Counters for hits, misses, stores, evictions and errors.
+
+    """
+
+    index_name = "index.json"
+    lock_name = "index.lock"
+
+    def __init__(self, path, *, max_entries=None, max_bytes=None):
+        """Initialize a CompilationCache."""
+        self.path = os.path.abspath(os.path.expanduser(path))
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.stats = {
+            "hits": 0,
+            "misses": 0,
+            "stores": 0,
+            "evictions": 0,
+            "errors": 0,
+        }
+        os.makedirs(self.path, exist_ok=True)
+
+    def _entry_path(self, key):
+        return os.path.join(self.path, f"{key}.pkl")
+
+    @contextmanager
+    def _lock(self):
+        with open(os.path.join(self.path, self.lock_name), "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _read_index(self):
+        try:
+            with open(os.path.join(self.path, self.index_name)) as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            index = None
+        if index is None or index.get("version") != myia_version():
+            index = self._reset_index()
+        return index
+
+    def _write_index(self, index):
+        tmp = os.path.join(self.path, f"{self.index_name}.{os.getpid()}")
+        with open(tmp, "w") as f:
+            json.dump(index, f)
+        os.replace(tmp, os.path.join(self.path, self.index_name))
+
+    def _reset_index(self):
+        for filename in os.listdir(self.path):
+            if filename.endswith(".pkl"):
+                os.remove(os.path.join(self.path, filename))
+        index = {"version": myia_version(), "entries": {}}
+        self._write_index(index)
+        return index
+
+    def key(self, fn, argspec, config):
+        """Compute the cache key for compiling fn on argspec.
+
+        Arguments:
+            fn: The function to compile.
+            argspec: The (broadened) abstract types of the arguments.
+            config: Any other data that influences the compilation, e.g.
+                the pipeline's configuration and the backend's options.
+
+        Returns:
+            The key as a string, or None if the key cannot be computed
+            reliably (e.g. the argspec refers to a graph, or fn refers to
+            an object that cannot be fingerprinted).
+
+        """
+        fn_fingerprint = fingerprint(fn)
+        if fn_fingerprint is None:
+            return None
+        h = hashlib.sha256()
+        h.update(fn_fingerprint.encode())
+        try:
+            h.update(_KeyPickler.dumps((argspec, config)))
+        except (pickle.PicklingError, TypeError, AttributeError):
+            return None
+        return h.hexdigest()
+
+    def load(self, key):
+        """Return the pipeline results cached for key, or None."""
+        with self._lock():
+            if key not in self._read_index()["entries"]:
+                self.stats["misses"] += 1
+                return None
+            try:
+                with open(self._entry_path(key), "rb") as f:
+                    data = f.read()
+            except OSError:
+                data = None
+        try:
+            if data is None:
+                raise OSError(f"Missing cache entry {key}")
+            results = deserialize(data)
+        except Exception:
+            self.stats["errors"] += 1
+            self.stats["misses"] += 1
+            with self._lock():
+                index = self._read_index()
+                index["entries"].pop(key, None)
+                self._write_index(index)
+            return None
+        manage(results["graph"])
+        with self._lock():
+            index = self._read_index()
+            if key in index["entries"]:
+                index["entries"][key]["atime"] = time.time()
+                self._write_index(index)
+        self.stats["hits"] += 1
+        return results
+
+    def store(self, key, results):
+        """Save the pipeline results for key.
+
+        Returns:
+            True if the results were stored, False if they could not be
+            serialized.
+
+        """
+        try:
+            data = serialize(
+                {k: results[k] for k in cache_fields if k in results}
+            )
+        except Exception:
+            self.stats["errors"] += 1
+            return False
+        with self._lock():
+            index = self._read_index()
+            tmp = f"{self._entry_path(key)}.{os.getpid()}"
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, self._entry_path(key))
+            index["entries"][key] = {"size": len(data), "atime": time.time()}
+            self._evict(index)
+            self._write_index(index)
+        self.stats["stores"] += 1
+        return True
+
+    def _evict(self, index):
+        entries = index["entries"]
+        lru = sorted(entries, key=lambda k: entries[k]["atime"])
+        total = sum(e["size"] for e in entries.values())
+        while lru and (
+            (self.max_entries is not None and len(entries) > self.max_entries)
+            or (self.max_bytes is not None and total > self.max_bytes)
+        ):
+            key = lru.pop(0)
+            total -= entries.pop(key)["size"]
+            try:
+                os.remove(self._entry_path(key))
+            except OSError:  # pragma: no cover
+                pass
+            self.stats["evictions"] += 1
+
+    def entries(self):
+        """Return a dict from each key to its size and last access time."""
+        with self._lock():
+            return dict(self._read_index()["entries"])
+
+    def clear(self):
+        """Remove all entries from the cache."""
+        with self._lock():
+            self._reset_index()
+
+
+class _KeyPickler(_GraphPickler):
+    """Pickler used to compute cache keys; rejects graphs and nodes."""
+
+    def persistent_id(self, obj):
+        if isinstance(obj, (Graph, ANFNode)):
+            raise pickle.PicklingError("Cannot make a key from a graph")
+        return super().persistent_id(obj)
+
+    @classmethod
+    def dumps(cls, obj):
+        buf = io.BytesIO()
+        cls(buf).dump(obj)
+        return buf.getvalue()
+
+
+__consolidate__ = True
+__all__ = [
+    "CompilationCache",
+    "deserialize",
+    "fingerprint",
+    "myia_version",
+    "serialize",
+]
@@ -285,6 +285,10 @@ class Incorporator(Partializable):
         return self.mono(context)
 
 
+def _identity(v):
+    return v
+
+
 class NumpyChecker:
     """Dummy backend used for debug mode."""
 
@@ -296,6 +300,14 @@ class NumpyChecker:
         """Returns v."""
         return v
 
+    def to_backend_converter(self, t):
+        """Returns the identity."""
+        return _identity
+
+    def from_backend_converter(self, t):
+        """Returns the identity."""
+        return _identity
+
 
 class BackendResource(Partializable):
     """Contains the backend."""
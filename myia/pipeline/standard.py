@@ -11,6 +11,7 @@ from ..abstract import ABSENT
 from ..ir import GraphManager
 from ..operations import primitives as P
 from ..operations.gen import lop, reverse_binop, rop
+from ..opt.lib import ConstantFolder, IncorporationBudget
 from ..public_api import item
 from ..utils import Registry
 from ..validate import AbstractValidator, MultiValidator, OperatorValidator
@@ -287,6 +288,9 @@ standard_resources = Resources.partial(
         ]
     ),
     incorporate=Incorporator.partial(),
+    incorporation_budget=IncorporationBudget.partial(),
+    opt_level=1,
+    constant_folder=ConstantFolder.partial(),
     return_backend=False,
     universal=False,
     preresolve=True,
@@ -315,6 +319,8 @@ standard_pipeline = base_pipeline.with_steps(
     steps.step_simplify_types,
     steps.step_opt,
     steps.step_opt2,
+    steps.step_fold,
+    steps.step_fuse,
     steps.step_llift,
     steps.step_validate,
     steps.step_compile,
@@ -333,6 +339,8 @@ standard_debug_pipeline = base_pipeline.with_steps(
     steps.step_simplify_types,
     steps.step_opt,
     steps.step_opt2,
+    steps.step_fold,
+    steps.step_fuse,
     steps.step_llift,
     steps.step_validate,
     steps.step_debug_export,
@@ -3,7 +3,14 @@
 The steps are listed in roughly the same order they should be called.
 """
 
-from ..abstract import AbstractTuple, find_aliases, nobottom, type_to_abstract
+from ..abstract import (
+    ANYTHING,
+    AbstractFunctionUnique,
+    AbstractTuple,
+    find_aliases,
+    nobottom,
+    type_to_abstract,
+)
 from ..compile import BackendValue
 from ..ir import Graph, clone
 from ..opt import (
@@ -15,9 +22,15 @@ from ..opt import (
     lib as optlib,
 )
 from ..parser import parse
-from ..simplify_types import from_canonical, simplify_types, to_canonical
+from ..simplify_types import (
+    make_from_canonical,
+    make_to_canonical,
+    simplify_types,
+    to_canonical,
+)
 from ..utils import InferenceError, MyiaInputTypeError, new_universe
 from ..validate import ValidationError
+from ..vmap import batch_abstract, batch_graph
 from ..xtype import UniverseType
 from .pipeline import LoopPipeline
 
@@ -260,15 +273,19 @@ step_opt = LoopPipeline(
         # Costlier optimizations
         optlib.float_tuple_getitem_through_switch,
         optlib.float_env_getitem_through_switch,
-        # We may reactivate those later, but they are slow
-        # optlib.incorporate_getitem,
-        # optlib.incorporate_env_getitem,
-        # optlib.incorporate_call,
-        # optlib.incorporate_getitem_through_switch,
-        # optlib.incorporate_env_getitem_through_switch,
-        # optlib.incorporate_call_through_switch,
         name="main2",
     ),
+    LocalPassOptimizer(
+        # These duplicate graphs, so they only run at opt_level 2 and above,
+        # within the resources' incorporation_budget.
+        optlib.incorporate_getitem,
+        optlib.incorporate_env_getitem,
+        optlib.incorporate_call,
+        optlib.incorporate_getitem_through_switch,
+        optlib.incorporate_env_getitem_through_switch,
+        name="incorporate",
+        opt_level=2,
+    ),
     LocalPassOptimizer(optlib.expand_J, name="grad"),
     CSE(report_changes=False),
     optlib.opt_jelim,
@@ -315,6 +332,106 @@ step_opt2_no_main = LoopPipeline(
 )
 
 
+_fold = LocalPassOptimizer(optlib.fold_constants, name="fold")
+
+
+def step_fold(resources, graph):
+    """Fold the array primitives whose inputs are all constants.
+
+    The primitives are evaluated with their python_implementation, within
+    the limits of the resources' constant_folder. This should be placed
+    before step_fuse, since the maps it fuses cannot be evaluated.
+
+    Inputs:
+        graph: The graph to fold.
+
+    Outputs:
+        folded: The number of applications that were folded.
+    """
+    folder = resources.constant_folder
+    before = folder.folded
+    resources.tracker.activate()
+    _fold(graph, resources=resources)
+    return {"folded": folder.folded - before}
+
+
+# Fuse chains of array_map. This must come after step_opt2, whose
+# unfuse_composite would split the fused maps again.
+step_fuse = LoopPipeline(
+    step_activate_tracker,
+    LocalPassOptimizer(optlib.fuse_array_map, name="fuse"),
+    name="step_fuse",
+)
+
+
+############
+# Batching #
+############
+
+
+_inline_all = LocalPassOptimizer(optlib.inline, name="inline_all")
+
+
+def step_batch(
+    resources,
+    graph,
+    argspec,
+    outspec,
+    orig_argspec=None,
+    orig_outspec=None,
+    batch=None,
+):
+    """Batch the graph over the leading axis of some of its arguments.
+
+    The pipeline must be run on the argument types for a single example,
+    and the types of the batched arguments are given the batch axis here.
+    This should be placed after step_opt, so that the graph only contains
+    primitives. It does nothing if batch is None.
+
+    Inputs:
+        graph: The graph to batch.
+        argspec: The argument types for a single example.
+        outspec: The output type for a single example.
+        orig_argspec: The initial argspec for a single example.
+        orig_outspec: The initial outspec for a single example.
+        batch: A (batched, size) pair, where batched is a tuple of booleans
+            telling whether each argument is batched, and size is the size
+            of the batch axis.
+
+    Outputs:
+        graph: The batched graph.
+        argspec: The batched argument types.
+        outspec: The batched output type.
+        orig_argspec: The batched initial argspec.
+        orig_outspec: The batched initial outspec.
+    """
+    if batch is None:
+        return {}
+    batched, size = batch
+    resources.tracker.activate()
+    _inline_all(graph, resources=resources)
+    batch_graph(graph, batched, size)
+    resources.live_inferrer()
+    new_outspec = graph.output.abstract
+    graph.return_.abstract = new_outspec
+    graph.return_.inputs[0].abstract = AbstractFunctionUnique(
+        [new_outspec], new_outspec
+    )
+    rval = {
+        "graph": graph,
+        "argspec": tuple(p.abstract for p in graph.parameters),
+        "outspec": new_outspec,
+    }
+    if orig_argspec is not None:
+        rval["orig_argspec"] = tuple(
+            batch_abstract(arg, size=size) if b else arg
+            for arg, b in zip(orig_argspec, batched)
+        )
+    if orig_outspec is not None:
+        rval["orig_outspec"] = batch_abstract(orig_outspec, size=size)
+    return rval
+
+
 ##################
 # Lambda lifting #
 ##################
@@ -360,6 +477,54 @@ def step_validate(resources, graph, outspec=None):
     return {"graph": graph}
 
 
+#########
+# Cache #
+#########
+
+
+def step_cache_store(
+    resources,
+    graph,
+    argspec,
+    outspec,
+    orig_argspec=None,
+    orig_outspec=None,
+    simplify_types=False,
+    cache=None,
+    cache_key=None,
+):
+    """Save the validated graph in a persistent cache.
+
+    This should be placed right after step_validate. It does nothing if no
+    cache or key are given.
+
+    Inputs:
+        graph: The validated graph.
+        argspec: The argument types.
+        outspec: The output type.
+        orig_argspec: initial argspec
+        orig_outspec: intial outspec
+        cache: A CompilationCache.
+        cache_key: The key to store the graph under.
+
+    Outputs:
+        None.
+    """
+    if cache is not None and cache_key is not None:
+        cache.store(
+            cache_key,
+            {
+                "graph": graph,
+                "argspec": argspec,
+                "outspec": outspec,
+                "orig_argspec": orig_argspec,
+                "orig_outspec": orig_outspec,
+                "simplify_types": simplify_types,
+            },
+        )
+    return {}
+
+
 ###############
 # Compilation #
 ###############
@@ -385,13 +550,49 @@ def step_compile(resources, graph, argspec, outspec):
 #####################################
 
 
-def _to_backend(arg, backend, vt):
-    if isinstance(arg, BackendValue):
-        if arg.backend is not backend:
-            raise ValueError("Value from wrong backend")  # pragma: no cover
-        return arg.value
+def _from_backend_value(arg, backend):
+    if arg.backend is not backend:
+        raise ValueError("Value from wrong backend")  # pragma: no cover
+    return arg.value
+
+
+def _make_to_backend(backend, vm_t):
+    """Make a function to convert canonical values of type vm_t.
+
+    The canonical value may contain BackendValues at any position, which
+    are unwrapped instead of being converted.
+    """
+    if isinstance(vm_t, AbstractTuple) and vm_t.elements is not ANYTHING:
+        convs = [_make_to_backend(backend, vt) for vt in vm_t.elements]
+
+        def convert(arg):
+            if isinstance(arg, BackendValue):
+                return _from_backend_value(arg, backend)
+            return tuple([conv(x) for conv, x in zip(convs, arg)])
+
     else:
-        return backend.to_backend_value(arg, vt)
+        to_backend = backend.to_backend_converter(vm_t)
+
+        def convert(arg):
+            if isinstance(arg, BackendValue):
+                return _from_backend_value(arg, backend)
+            return to_backend(arg)
+
+    return convert
+
+
+def _make_arg_converter(backend, orig_t, vm_t):
+    """Make a function to convert an argument from orig_t to vm_t."""
+    canon = make_to_canonical(orig_t)
+    to_backend = _make_to_backend(backend, vm_t)
+    return lambda arg: to_backend(canon(arg))
+
+
+def _make_out_converter(backend, orig_t, vm_t):
+    """Make a function to convert the output from vm_t to orig_t."""
+    from_backend = backend.from_backend_converter(vm_t)
+    canon = make_from_canonical(orig_t)
+    return lambda res: canon(from_backend(res))
 
 
 def step_wrap(
@@ -407,7 +608,9 @@ def step_wrap(
 ):
     """Pipeline step to export a callable.
 
-    Convert args to vm format, and output from vm format.
+    Convert args to vm format, and output from vm format. The conversion
+    functions are specialized on the argument and output types once, here,
+    so that calling the wrapped function does not dispatch on types.
 
     Inputs:
         graph: The graph to wrap into a callable.
@@ -434,19 +637,24 @@ def step_wrap(
         vm_unv_in_t, vm_arg_t = vm_arg_t[-1], vm_arg_t[:-1]
         _, vm_out_t = vm_out_t.elements[0], vm_out_t.elements[1]
 
+    backend = resources.backend.backend
+    alias_tracker, orig_aid_to_paths = aliasspec or (None, None)
+    nargs = len(orig_arg_t)
+    convert_args = [
+        _make_arg_converter(backend, ot, vt)
+        for ot, vt in zip(orig_arg_t, vm_arg_t)
+    ]
+    if not resources.return_backend:
+        convert_out = _make_out_converter(backend, orig_out_t, vm_out_t)
+
     def wrapped(*args):
-        if aliasspec:
-            alias_tracker, orig_aid_to_paths = aliasspec
+        if alias_tracker is not None:
             _, aid_to_paths = find_aliases(args, alias_tracker)
             if aid_to_paths != orig_aid_to_paths:
                 raise MyiaInputTypeError("Incompatible aliasing pattern.")
-        backend = resources.backend.backend
-        if len(args) != len(orig_arg_t):
+        if len(args) != nargs:
             raise MyiaInputTypeError("Wrong number of arguments.")
-        args = tuple(
-            _to_backend(to_canonical(arg, ot), backend, vt)
-            for arg, ot, vt in zip(args, orig_arg_t, vm_arg_t)
-        )
+        args = [convert(arg) for convert, arg in zip(convert_args, args)]
         if resources.universal:
             backend_universe = backend.to_backend_value(
                 to_canonical(new_universe, argspec[-1]), vm_unv_in_t
@@ -465,8 +673,7 @@ def step_wrap(
             else:
                 res = BackendValue(res, orig_out_t, vm_out_t, backend)
         else:
-            res = backend.from_backend_value(res, vm_out_t)
-            res = from_canonical(res, orig_out_t)
+            res = convert_out(res)
         return res
 
     return {"output": wrapped}
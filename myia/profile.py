@@ -0,0 +1,276 @@
+"""Profiling of the compilation pipeline.
+
+A CompileProfiler is a TraceListener that records, for each block traced by
+the pipeline (steps, iterations of a LoopPipeline, inference, etc.), its wall
+time, the number of graphs and nodes in its graph's manager when it ends, and
+the memory it allocated. It also counts how many times each rule of each
+optimizer succeeded, and how many nodes each optimizer visited. One report
+is produced per specialization::
+
+    @myia(profile=True)
+    def f(x, y):
+        ...
+
+    f(1, 2)
+    f.tracer.reports[0].print()
+
+It can also be enabled with ``MYIATRACER=myia.profile.CompileProfiler``.
+"""
+
+import json
+import os
+import tracemalloc
+from collections import Counter
+from time import perf_counter
+
+from .ir import Graph
+from .utils import TraceListener
+
+
+def _name(x):
+    if hasattr(x, "name"):
+        return x.name
+    return getattr(x, "__qualname__", str(x))
+
+
+def _graph_counts(graph=None, **kwargs):
+    """Return the number of graphs and nodes in graph's manager."""
+    if not isinstance(graph, Graph) or graph._manager is None:
+        return None, None
+    mng = graph._manager
+    return len(mng.graphs), len(mng.all_nodes)
+
+
+class CompileReport:
+    """Profile of the compilation of one specialization.
+
+    Attributes:
+        name: The name of the compiled function.
+        argspec: The types of the arguments, as a string.
+        blocks: A list of dicts, one for each traced block in the order in
+            which they were entered, with the following keys:
+
+            * path: The names of the enclosing blocks and of this one,
+              separated by "/".
+            * depth: The number of enclosing blocks.
+            * time: The wall time in seconds.
+            * graphs, nodes: The number of graphs and nodes in the manager
+              of the graph at the end of the block, or None.
+            * memory: The memory allocated by the block, in bytes.
+            * memory_peak: The peak memory allocated during the block,
+              relative to its start, in bytes.
+
+            The memory fields are None if memory is not traced. memory_peak
+            is None on Python versions before 3.9.
+        rules: A Counter from "<optimizer>/<rule>" to the number of times
+            the rule succeeded.
+        visits: A dict from the name of each LocalPassOptimizer to a dict
+            with the number of passes it did, the number of nodes it
+            visited and the sum of the number of nodes in the manager at
+            each pass, which can be compared to the visits.
+
+    """
+
+    def __init__(self, name=None, argspec=None):
+        """Initialize a CompileReport."""
+        self.name = name
+        self.argspec = argspec
+        self.blocks = []
+        self.rules = Counter()
+        self.visits = {}
+
+    def as_dict(self):
+        """Return the report as a dict that can be serialized to JSON."""
+        return {
+            "name": self.name,
+            "argspec": self.argspec,
+            "blocks": self.blocks,
+            "rules": dict(self.rules.most_common()),
+            "visits": self.visits,
+        }
+
+    def to_json(self, **kwargs):
+        """Return the report in JSON format."""
+        return json.dumps(self.as_dict(), **kwargs)
+
+    def format(self):
+        """Return the report as a text table."""
+        lines = [
+            f"{self.name} {self.argspec}",
+            f"{'block':40}{'time':>12}{'graphs':>8}{'nodes':>8}"
+            f"{'memory':>12}{'peak':>12}",
+        ]
+
+        def fmt(x, width):
+            return f"{'-' if x is None else x:>{width}}"
+
+        def kb(x):
+            return None if x is None else f"{x // 1024}KB"
+
+        for block in self.blocks:
+            name = "  " * block["depth"] + block["path"].split("/")[-1]
+            lines.append(
+                f"{name:40}{block['time'] * 1000:10.2f}ms"
+                + fmt(block["graphs"], 8)
+                + fmt(block["nodes"], 8)
+                + fmt(kb(block["memory"]), 12)
+                + fmt(kb(block["memory_peak"]), 12)
+            )
+        if self.rules:
+            lines.append("")
+            lines.append(f"{'rule':52}{'successes':>12}")
+            for rule, n in self.rules.most_common():
+                lines.append(f"{rule:52}{n:12}")
+        if self.visits:
+            lines.append("")
+            lines.append(
+                f"{'optimizer':28}{'passes':>8}{'visits':>12}{'nodes':>12}"
+                f"{'ratio':>8}"
+            )
+            for opt, v in self.visits.items():
+                ratio = v["visits"] / v["nodes"] if v["nodes"] else 0
+                lines.append(
+                    f"{opt:28}{v['passes']:8}{v['visits']:12}"
+                    f"{v['nodes']:12}{ratio:8.2f}"
+                )
+        return "\n".join(lines)
+
+    def print(self):
+        """Print the report as a text table."""
+        print(self.format())
+
+
+class _Block:
+    __slots__ = ("record", "start", "memory", "peak")
+
+    def __init__(self, record, start, memory):
+        self.record = record
+        self.start = start
+        self.memory = memory
+        self.peak = memory
+
+
+class CompileProfiler(TraceListener):
+    """Profile the compilation pipeline.
+
+    Each time the profiler is entered, e.g. for each specialization of a
+    MyiaFunction that uses it as its tracer, a new CompileReport is added
+    to the reports list.
+
+    Arguments:
+        memory: Whether to measure memory with tracemalloc. This slows down
+            the compilation significantly.
+        print_results: Whether to print each report when it is complete.
+        directory: A directory in which to write each report in JSON
+            format, or None.
+
+    """
+
+    def __init__(self, memory=True, print_results=False, directory=None):
+        """Initialize a CompileProfiler."""
+        super().__init__()
+        self.memory = memory
+        self.print_results = print_results
+        self.directory = directory
+        self.reports = []
+        self._blocks = []
+        self._started_tracemalloc = False
+
+    def install(self, tracer):
+        """Install the listeners on the tracer."""
+        super().install(tracer)
+        tracer.on("opt/success", self._on_opt_success)
+        tracer.on("visits", self._on_visits)
+
+    def _poll_memory(self):
+        """Return the current memory and update the peaks of open blocks."""
+        if not self.memory:
+            return None
+        current, peak = tracemalloc.get_traced_memory()
+        if hasattr(tracemalloc, "reset_peak"):
+            tracemalloc.reset_peak()
+            for block in self._blocks:
+                block.peak = max(block.peak, peak)
+        return current
+
+    def on_enter(self, _stack=None, profile=True, **kwargs):
+        """Executed when a block is entered."""
+        if not profile or any(
+            not part.kwargs.get("profile", True) for part in _stack
+        ):
+            return
+        report = self.reports[-1]
+        if report.name is None and "input" in kwargs:
+            report.name = _name(kwargs["input"])
+            report.argspec = str(kwargs.get("argspec", None))
+        record = {
+            "path": "/".join(part.name for part in _stack),
+            "depth": len(_stack) - 1,
+            "time": None,
+            "graphs": None,
+            "nodes": None,
+            "memory": None,
+            "memory_peak": None,
+        }
+        report.blocks.append(record)
+        memory = self._poll_memory()
+        self._blocks.append(_Block(record, perf_counter(), memory))
+
+    def on_exit(self, _stack=None, profile=True, **kwargs):
+        """Executed when a block is exited."""
+        if not profile or any(
+            not part.kwargs.get("profile", True) for part in _stack
+        ):
+            return
+        end = perf_counter()
+        memory = self._poll_memory()
+        block = self._blocks.pop()
+        record = block.record
+        record["time"] = end - block.start
+        record["graphs"], record["nodes"] = _graph_counts(**kwargs)
+        if memory is not None:
+            record["memory"] = memory - block.memory
+            if hasattr(tracemalloc, "reset_peak"):
+                record["memory_peak"] = block.peak - block.memory
+
+    def _on_opt_success(self, _stack=None, opt=None, **kwargs):
+        optimizer = _stack[-2].name if len(_stack) > 1 else None
+        self.reports[-1].rules[f"{optimizer}/{_name(opt)}"] += 1
+
+    def _on_visits(self, optimizer=None, visits=0, nodes=0, **kwargs):
+        record = self.reports[-1].visits.setdefault(
+            _name(optimizer), {"passes": 0, "visits": 0, "nodes": 0}
+        )
+        record["passes"] += 1
+        record["visits"] += visits
+        record["nodes"] += nodes
+
+    def __enter__(self):
+        self.reports.append(CompileReport())
+        self._blocks = []
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracemalloc = True
+        return super().__enter__()
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        try:
+            super().__exit__(exc_type, exc_value, exc_traceback)
+        finally:
+            if self._started_tracemalloc:
+                tracemalloc.stop()
+                self._started_tracemalloc = False
+
+    def post(self):
+        """Print or save the latest report."""
+        report = self.reports[-1]
+        if self.print_results:
+            report.print()
+        if self.directory is not None:
+            os.makedirs(self.directory, exist_ok=True)
+            filename = f"{report.name}-{len(self.reports)}.json"
+            with open(os.path.join(self.directory, filename), "w") as f:
+                f.write(report.to_json(indent=2))
+
+
+__all__ = ["CompileProfiler", "CompileReport"]
@@ -1,5 +1,6 @@
 """Clean up Class types."""
 
+import operator
 import weakref
 from itertools import count
 
@@ -274,6 +275,15 @@ def simplify_types(root, manager):
 ########################
 
 
+def _shape_matches(shape, expected):
+    """Check that shape matches expected, where ANYTHING matches any size."""
+    if expected is ANYTHING:
+        return True
+    return len(shape) == len(expected) and all(
+        e is ANYTHING or s == e for s, e in zip(shape, expected)
+    )
+
+
 @ovld.dispatch(type_error=MyiaInputTypeError)
 def to_canonical(self, arg, orig_t, coerce=False):
     """Check and convert an argument to the canonical representation.
@@ -361,7 +371,7 @@ def to_canonical(self, arg, orig_t: AbstractArray, coerce):
             f"Expected array of type {et}, but got {arg_dtype}."
         )
     shp = orig_t.xshape()
-    if shp is not ANYTHING and arg.shape != shp:
+    if not _shape_matches(arg.shape, shp):
         raise MyiaInputTypeError(
             f"Expected array with shape {shp}, but got {arg.shape}."
         )
@@ -496,9 +506,220 @@ def from_canonical(self, arg, orig_t: AbstractType):
     return arg
 
 
+##########################
+# Specialized converters #
+##########################
+
+
+def _identity(x):
+    return x
+
+
+@ovld
+def make_to_canonical(self, orig_t: object):
+    """Make a function that converts arguments of type orig_t.
+
+    The returned function is equivalent to ``to_canonical(arg, orig_t)``,
+    but the dispatch on orig_t is done once, when the function is made,
+    rather than on every call. Types for which there is no specialized
+    version use to_canonical directly. As with to_canonical, BackendValues
+    are accepted in place of any value and returned as they are.
+    """
+    return lambda arg: to_canonical(arg, orig_t)
+
+
+@ovld  # noqa: F811
+def make_to_canonical(self, orig_t: AbstractTuple):
+    if orig_t.elements is ANYTHING:
+        return self[object](orig_t)
+    convs = [self(o) for o in orig_t.elements]
+    n = len(convs)
+
+    def convert(arg):
+        if not isinstance(arg, tuple):
+            if isinstance(arg, BackendValue):
+                return to_canonical(arg, orig_t)
+            raise MyiaInputTypeError(f"Expected tuple, not {arg}")
+        if len(arg) != n:
+            raise MyiaInputTypeError(f"Expected {n} elements")
+        return tuple([conv(x) for conv, x in zip(convs, arg)])
+
+    return convert
+
+
+@ovld  # noqa: F811
+def make_to_canonical(self, orig_t: AbstractDict):
+    keys = tuple(orig_t.entries.keys())
+    keyset = set(keys)
+    convs = [self(o) for o in orig_t.entries.values()]
+
+    def convert(arg):
+        if not isinstance(arg, dict):
+            if isinstance(arg, BackendValue):
+                return to_canonical(arg, orig_t)
+            raise MyiaInputTypeError(f"Expected dict, not {arg}")
+        if len(arg) != len(keys):
+            raise MyiaInputTypeError(
+                "Dictionary input doesn't have the expected size"
+            )
+        if arg.keys() != keyset:
+            raise MyiaInputTypeError("Mismatched keys for input dictionary.")
+        return tuple([conv(arg[k]) for conv, k in zip(convs, keys)])
+
+    return convert
+
+
+@ovld  # noqa: F811
+def make_to_canonical(self, orig_t: AbstractClassBase):
+    if orig_t.tag in (Empty, Cons):
+        return self[object](orig_t)
+    tag = orig_t.tag
+    attrs = tuple(orig_t.attributes.keys())
+    convs = [self(o) for o in orig_t.attributes.values()]
+
+    def convert(arg):
+        if not isinstance(arg, tag):
+            if isinstance(arg, BackendValue):
+                return to_canonical(arg, orig_t)
+            raise MyiaInputTypeError(f"Expected {tag.__qualname__}")
+        return tuple([conv(getattr(arg, a)) for conv, a in zip(convs, attrs)])
+
+    return convert
+
+
+@ovld  # noqa: F811
+def make_to_canonical(self, orig_t: AbstractArray):
+    if not isinstance(orig_t.element, AbstractScalar):
+        return self[object](orig_t)
+    et = orig_t.element.xtype()
+    to_numpy = orig_t.xtype().to_numpy
+    shp = orig_t.xshape()
+    if shp is ANYTHING or ANYTHING in shp:
+        matches = _shape_matches
+    else:
+        matches = operator.eq
+    dtypes = {}
+
+    def convert(arg):
+        if isinstance(arg, BackendValue):
+            return to_canonical(arg, orig_t)
+        arg = to_numpy(arg)
+        dtype = arg.dtype
+        if dtype not in dtypes:
+            dtypes[dtype] = xtype.np_dtype_to_type(str(dtype))
+        if dtypes[dtype] != et:
+            raise MyiaInputTypeError(
+                f"Expected array of type {et}, but got {dtypes[dtype]}."
+            )
+        if not matches(arg.shape, shp):
+            raise MyiaInputTypeError(
+                f"Expected array with shape {shp}, but got {arg.shape}."
+            )
+        return arg
+
+    return convert
+
+
+@ovld  # noqa: F811
+def make_to_canonical(self, orig_t: AbstractScalar):
+    if (
+        orig_t.values[VALUE] is not ANYTHING
+        or orig_t.xtype() is ANYTHING
+        or issubclass(orig_t.xtype(), xtype.String)
+    ):
+        return self[object](orig_t)
+    # When the expected type has no value, whether an argument matches only
+    # depends on its Python type, so we only check each type once.
+    accepted = {}
+
+    def convert(arg):
+        t = type(arg)
+        if t is BackendValue:
+            return to_canonical(arg, orig_t)
+        if t not in accepted:
+            accepted[t] = typecheck(orig_t, from_value(arg))
+        if not accepted[t]:
+            raise MyiaInputTypeError(
+                f"Scalar has wrong type: expected {orig_t}, got {arg}"
+            )
+        return arg
+
+    return convert
+
+
+@ovld
+def make_from_canonical(self, orig_t: object):
+    """Make a function that converts results of type orig_t.
+
+    The returned function is equivalent to ``from_canonical(res, orig_t)``,
+    with the dispatch on orig_t done once. Conversions that do nothing are
+    represented by an identity function, which the callers may elide.
+    """
+    return lambda res: from_canonical(res, orig_t)
+
+
+@ovld  # noqa: F811
+def make_from_canonical(self, orig_t: AbstractTuple):
+    if orig_t.elements is ANYTHING:
+        return self[object](orig_t)
+    convs = [self(o) for o in orig_t.elements]
+    if all(conv is _identity for conv in convs):
+        return tuple
+
+    def convert(res):
+        return tuple([conv(x) for conv, x in zip(convs, res)])
+
+    return convert
+
+
+@ovld  # noqa: F811
+def make_from_canonical(self, orig_t: AbstractDict):
+    keys = tuple(orig_t.entries.keys())
+    convs = [self(o) for o in orig_t.entries.values()]
+
+    def convert(res):
+        return dict(zip(keys, [conv(x) for conv, x in zip(convs, res)]))
+
+    return convert
+
+
+@ovld  # noqa: F811
+def make_from_canonical(self, orig_t: AbstractClassBase):
+    if orig_t.tag in (Empty, Cons):
+        return self[object](orig_t)
+    constructor = orig_t.constructor
+    convs = [self(o) for o in orig_t.attributes.values()]
+
+    def convert(res):
+        return constructor(*[conv(x) for conv, x in zip(convs, res)])
+
+    return convert
+
+
+@ovld  # noqa: F811
+def make_from_canonical(self, orig_t: AbstractArray):
+    if orig_t.xtype() is NDArray:
+        return _identity
+    return orig_t.xtype().from_numpy
+
+
+@ovld  # noqa: F811
+def make_from_canonical(self, orig_t: (AbstractRandomState, AbstractHandle)):
+    return _identity
+
+
+@ovld  # noqa: F811
+def make_from_canonical(self, orig_t: AbstractScalar):
+    if orig_t.xtype() == xtype.String:
+        return self[object](orig_t)
+    return _identity
+
+
 __consolidate__ = True
 __all__ = [
     "from_canonical",
+    "make_from_canonical",
+    "make_to_canonical",
     "simplify_types",
     "str_to_tag",
     "to_canonical",
@@ -0,0 +1,468 @@
+"""Batch a typed graph over a leading axis of some of its arguments.
+
+The batching transform rewrites a specialized graph that computes the result
+for a single example into a graph that computes the results for a whole batch
+of examples at once. Some of the parameters of the graph (the batched ones)
+are given an extra leading axis of a fixed size, and every operation that
+depends on them is replaced by an operation on the whole batch:
+
+    array_map(f, x, y)        => array_map(f, x', broadcast(y))
+    scalar_add(a, b)          => array_map(scalar_add, a', broadcast(b))
+    reshape(x, (n, m))        => reshape(x', (B, n, m))
+    dot(x, w)                 => reshape(dot(reshape(x', (B * n, k)), w),
+                                         (B, n, m))
+    ...
+
+Here x' is the batched version of x, which has shape (B, *x.shape), and
+broadcast(y) repeats an unbatched value along a new leading axis. Batched
+scalars are represented as arrays of shape (B,). Operations that do not
+depend on a batched value are left untouched.
+
+The transform only applies to the root graph, so calls to other graphs must
+be inlined first, and values that depend on the batched parameters may not
+be used in closures, e.g. in the branches of a conditional.
+"""
+
+from ovld import ovld
+
+from . import xtype
+from .abstract import (
+    ANYTHING,
+    SHAPE,
+    TYPE,
+    VALUE,
+    AbstractArray,
+    AbstractScalar,
+    AbstractTuple,
+    abstract_clone,
+)
+from .graph_utils import toposort
+from .ir import Constant, freevars_boundary, succ_incoming
+from .operations import primitives as P
+from .utils import MyiaShapeError, MyiaTypeError
+
+_elementwise = {
+    P.bool_and,
+    P.bool_eq,
+    P.bool_not,
+    P.bool_or,
+    P.scalar_abs,
+    P.scalar_add,
+    P.scalar_bit_and,
+    P.scalar_bit_lshift,
+    P.scalar_bit_not,
+    P.scalar_bit_or,
+    P.scalar_bit_rshift,
+    P.scalar_bit_xor,
+    P.scalar_cos,
+    P.scalar_div,
+    P.scalar_eq,
+    P.scalar_exp,
+    P.scalar_floor,
+    P.scalar_ge,
+    P.scalar_gt,
+    P.scalar_le,
+    P.scalar_log,
+    P.scalar_lt,
+    P.scalar_max,
+    P.scalar_mod,
+    P.scalar_mul,
+    P.scalar_ne,
+    P.scalar_pow,
+    P.scalar_sign,
+    P.scalar_sin,
+    P.scalar_sub,
+    P.scalar_tan,
+    P.scalar_tanh,
+    P.scalar_trunc,
+    P.scalar_uadd,
+    P.scalar_usub,
+}
+
+
+###################
+# Abstract values #
+###################
+
+
+@abstract_clone.variant
+def batch_abstract(self, x: AbstractArray, *, size):
+    """Add a leading axis of the given size to arrays and scalars.
+
+    Numeric and boolean scalars become arrays of shape (size,). Other
+    scalars cannot be batched.
+    """
+    return (yield AbstractArray)(
+        x.element, {**x.values, SHAPE: (size, *x.xshape())}
+    )
+
+
+@ovld  # noqa: F811
+def batch_abstract(self, x: AbstractScalar, *, size):
+    if not issubclass(x.xtype(), (xtype.Number, xtype.Bool)):
+        raise MyiaTypeError(f"Cannot batch a value of type {x}")
+    return AbstractArray(
+        AbstractScalar({VALUE: ANYTHING, TYPE: x.xtype()}),
+        {SHAPE: (size,), TYPE: xtype.NDArray},
+    )
+
+
+def unbatch_abstract(x):
+    """Remove the leading axis of an array.
+
+    Returns:
+        The type of the array without its leading axis, and the size of
+        that axis.
+
+    """
+    if not isinstance(x, AbstractArray):
+        raise MyiaTypeError(f"Only arrays can be batched, not {x}")
+    shp = x.xshape()
+    if shp is ANYTHING or len(shp) == 0 or shp[0] is ANYTHING:
+        raise MyiaShapeError(
+            f"Batched arrays must have a known leading dimension, not {shp}"
+        )
+    return AbstractArray(x.element, {**x.values, SHAPE: shp[1:]}), shp[0]
+
+
+def _structure(a, batched):
+    """Return which parts of a value of type a are batched.
+
+    The result is a bool for leaves and a tuple of structures for tuples.
+    """
+    if isinstance(a, AbstractTuple):
+        return tuple(_structure(elem, batched) for elem in a.elements)
+    else:
+        return batched
+
+
+def _known_shape(a):
+    shp = a.xshape()
+    if shp is ANYTHING or ANYTHING in shp:
+        raise MyiaShapeError(f"vmap needs known shapes, not {shp}")
+    return shp
+
+
+def _any_batched(struct):
+    if isinstance(struct, tuple):
+        return any(_any_batched(s) for s in struct)
+    return struct
+
+
+############
+# Batching #
+############
+
+
+class _Batcher:
+    """Rewrite the nodes of a graph to operate on batches.
+
+    Attributes:
+        graph: The graph to batch.
+        size: The size of the batch axis.
+        repl: Map from each node that depends on a batched parameter to a
+            (new_node, structure) pair.
+
+    """
+
+    def __init__(self, graph, size):
+        self.graph = graph
+        self.size = size
+        self.repl = {}
+
+    def new(self, node):
+        """Return the node that replaces node."""
+        return self.repl[node][0] if node in self.repl else node
+
+    def structure(self, node):
+        """Return which parts of node's value are batched."""
+        return self.repl[node][1] if node in self.repl else False
+
+    def apply(self, *inputs):
+        return self.graph.apply(*inputs)
+
+    def shape(self, node):
+        """Return the shape of node's value for a single example."""
+        return _known_shape(node.abstract)
+
+    def const(self, node):
+        """Return the value of a constant input."""
+        if not node.is_constant():
+            raise MyiaTypeError(f"vmap needs a constant, not {node}")
+        return node.value
+
+    def broadcast(self, new, a, struct):
+        """Return a fully batched version of new.
+
+        Arguments:
+            new: The node to broadcast.
+            a: The type of new for a single example.
+            struct: Which parts of new are already batched.
+
+        """
+        if struct is True:
+            return new
+        elif isinstance(a, AbstractTuple):
+            if struct is False:
+                struct = _structure(a, False)
+            elems = [
+                self.broadcast(
+                    self.apply(P.tuple_getitem, new, i), elem, struct[i]
+                )
+                for i, elem in enumerate(a.elements)
+            ]
+            return self.apply(P.make_tuple, *elems)
+        elif isinstance(a, AbstractArray):
+            shp = _known_shape(a)
+            new = self.apply(P.reshape, new, (1, *shp))
+            return self.apply(P.distribute, new, (self.size, *shp))
+        elif isinstance(a, AbstractScalar) and issubclass(
+            a.xtype(), (xtype.Number, xtype.Bool)
+        ):
+            typ = AbstractArray(
+                AbstractScalar({VALUE: ANYTHING, TYPE: a.xtype()}),
+                {SHAPE: (), TYPE: xtype.NDArray},
+            )
+            new = self.apply(P.scalar_to_array, new, typ)
+            return self.apply(P.distribute, new, (self.size,))
+        else:
+            raise MyiaTypeError(f"vmap cannot batch a value of type {a}")
+
+    def full(self, node):
+        """Return the fully batched version of node."""
+        return self.broadcast(
+            self.new(node), node.abstract, self.structure(node)
+        )
+
+    def check_uses(self, node):
+        """Check that node is only used in the graph being batched."""
+        for user, _ in self.graph.manager.uses[node]:
+            if user.graph is not self.graph:
+                raise MyiaTypeError(
+                    f"vmap cannot batch a value that is used in a closure"
+                    f" ({node} is used in {user.graph})"
+                )
+
+    def run(self, batched):
+        """Batch the graph.
+
+        Arguments:
+            batched: A sequence of booleans, one for each parameter of the
+                graph, telling whether it is batched or not.
+
+        Returns:
+            The fully batched version of the graph's output.
+
+        """
+        g = self.graph
+        params = [p for p, b in zip(g.parameters, batched) if b]
+        for p in params:
+            self.check_uses(p)
+            self.repl[p] = (p, _structure(p.abstract, True))
+
+        for node in toposort(g.output, succ_incoming, freevars_boundary(g)):
+            if not node.is_apply() or node.graph is not g:
+                continue
+            args = node.inputs[1:]
+            if not any(_any_batched(self.structure(arg)) for arg in args):
+                continue
+            self.check_uses(node)
+            fn = node.inputs[0]
+            if fn.is_constant() and fn.value in _elementwise:
+                rule = _batch_elementwise
+            elif fn.is_constant() and fn.value in _rules:
+                rule = _rules[fn.value]
+            else:
+                raise MyiaTypeError(f"vmap cannot batch {node}")
+            self.repl[node] = rule(self, node, *args)
+
+        output = self.full(g.output)
+        # The rules need the types of the parameters for a single example,
+        # so they are only updated at the end.
+        for p in params:
+            p.abstract = batch_abstract(p.abstract, size=self.size)
+        return output
+
+
+_rules = {}
+
+
+def _rule(*prims):
+    def deco(fn):
+        for prim in prims:
+            _rules[prim] = fn
+        return fn
+
+    return deco
+
+
+def _batch_elementwise(self, node, *args):
+    fn = node.inputs[0]
+    return (self.apply(P.array_map, fn, *map(self.full, args)), True)
+
+
+@_rule(P.array_map)
+def _batch_array_map(self, node, fn, *arrays):
+    return (self.apply(P.array_map, fn, *map(self.full, arrays)), True)
+
+
+@_rule(P.array_reduce)
+def _batch_array_reduce(self, node, fn, array, shp):
+    shp = self.const(shp)
+    delta = len(self.shape(array)) - len(shp)
+    new = self.apply(
+        P.array_reduce, fn, self.new(array), (self.size, *((1,) * delta), *shp),
+    )
+    if delta:
+        new = self.apply(P.reshape, new, (self.size, *shp))
+    return (new, True)
+
+
+@_rule(P.distribute)
+def _batch_distribute(self, node, array, shp):
+    shp = self.const(shp)
+    orig = self.shape(array)
+    new = self.new(array)
+    delta = len(shp) - len(orig)
+    if delta:
+        new = self.apply(P.reshape, new, (self.size, *((1,) * delta), *orig))
+    return (self.apply(P.distribute, new, (self.size, *shp)), True)
+
+
+@_rule(P.reshape)
+def _batch_reshape(self, node, array, shp):
+    shp = self.const(shp)
+    return (self.apply(P.reshape, self.new(array), (self.size, *shp)), True)
+
+
+@_rule(P.transpose)
+def _batch_transpose(self, node, array, perm):
+    perm = (0, *(p + 1 for p in self.const(perm)))
+    return (self.apply(P.transpose, self.new(array), perm), True)
+
+
+@_rule(P.dot)
+def _batch_dot(self, node, a, b):
+    B = self.size
+    n, k = self.shape(a)
+    _, m = self.shape(b)
+    if not self.structure(b):
+        # (B, n, k) x (k, m): fold the batch axis into the rows of a.
+        new = self.apply(P.reshape, self.new(a), (B * n, k))
+        new = self.apply(P.dot, new, b)
+        new = self.apply(P.reshape, new, (B, n, m))
+    elif not self.structure(a):
+        # (n, k) x (B, k, m): fold the batch axis into the columns of b.
+        new = self.apply(P.transpose, self.new(b), (1, 0, 2))
+        new = self.apply(P.reshape, new, (k, B * m))
+        new = self.apply(P.dot, a, new)
+        new = self.apply(P.reshape, new, (n, B, m))
+        new = self.apply(P.transpose, new, (1, 0, 2))
+    else:
+        # (B, n, k) x (B, k, m): multiply and sum over k.
+        x = self.apply(P.reshape, self.new(a), (B, n, k, 1))
+        x = self.apply(P.distribute, x, (B, n, k, m))
+        y = self.apply(P.reshape, self.new(b), (B, 1, k, m))
+        y = self.apply(P.distribute, y, (B, n, k, m))
+        new = self.apply(P.array_map, P.scalar_mul, x, y)
+        new = self.apply(P.array_reduce, P.scalar_add, new, (B, n, 1, m))
+        new = self.apply(P.reshape, new, (B, n, m))
+    return (new, True)
+
+
+@_rule(P.array_getitem)
+def _batch_array_getitem(self, node, array, begin, end, strides):
+    new = self.apply(
+        P.array_getitem,
+        self.new(array),
+        (0, *self.const(begin)),
+        (self.size, *self.const(end)),
+        (1, *self.const(strides)),
+    )
+    return (new, True)
+
+
+@_rule(P.concat)
+def _batch_concat(self, node, arrays, dim):
+    dim = self.const(dim)
+    if dim < 0:
+        dim += len(self.shape(node))
+    return (self.apply(P.concat, self.full(arrays), dim + 1), True)
+
+
+@_rule(P.array_cast)
+def _batch_array_cast(self, node, array, typ):
+    return (self.apply(P.array_cast, self.new(array), typ), True)
+
+
+@_rule(P.scalar_cast)
+def _batch_scalar_cast(self, node, scalar, typ):
+    return (self.apply(P.array_cast, self.new(scalar), typ), True)
+
+
+@_rule(P.array_to_scalar, P.scalar_to_array)
+def _batch_identity(self, node, x, *rest):
+    # A batched scalar and a batched array of shape () are both
+    # represented by an array of shape (B,).
+    return (self.new(x), True)
+
+
+@_rule(P.shape)
+def _batch_shape(self, node, array):
+    ct = Constant(self.shape(array))
+    ct.abstract = node.abstract
+    return (ct, False)
+
+
+@_rule(P.make_tuple)
+def _batch_make_tuple(self, node, *elems):
+    new = self.apply(P.make_tuple, *map(self.new, elems))
+    return (new, tuple(map(self.structure, elems)))
+
+
+@_rule(P.tuple_getitem)
+def _batch_tuple_getitem(self, node, tup, idx):
+    idx = self.const(idx)
+    new = self.apply(P.tuple_getitem, self.new(tup), idx)
+    return (new, self.structure(tup)[idx])
+
+
+@_rule(P.switch)
+def _batch_switch(self, node, cond, tb, fb):
+    if self.structure(cond):
+        raise MyiaTypeError(
+            "vmap cannot batch a condition that depends on batched values"
+        )
+    if self.structure(tb) == self.structure(fb):
+        new = self.apply(P.switch, cond, self.new(tb), self.new(fb))
+        return (new, self.structure(tb))
+    new = self.apply(P.switch, cond, self.full(tb), self.full(fb))
+    return (new, _structure(node.abstract, True))
+
+
+def batch_graph(graph, batched, size):
+    """Batch a graph over a leading axis of some of its parameters.
+
+    The graph must be typed, and calls to other graphs that take batched
+    values must have been inlined. The abstract types of the batched
+    parameters are updated, but the new nodes are left untyped, so live
+    inference must be run afterwards.
+
+    Arguments:
+        graph: The graph to batch. It must have a manager.
+        batched: A sequence of booleans, one for each parameter of the
+            graph, telling whether it has a leading batch axis.
+        size: The size of the batch axis.
+
+    Returns:
+        The new output node, which has already been set as the output of
+        the graph. All the arrays it contains have a leading batch axis.
+
+    """
+    new_output = _Batcher(graph, size).run(batched)
+    graph.manager.set_edge(graph.return_, 1, new_output)
+    graph.return_.abstract = None
+    return new_output
+
+
+__all__ = ["batch_abstract", "batch_graph", "unbatch_abstract"]
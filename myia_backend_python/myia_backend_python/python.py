@@ -13,17 +13,122 @@ from myia.compile.transform import convert_grad, get_prim_graph
 from myia.debug.label import NodeLabeler
 from myia.graph_utils import toposort
 from myia.ir import Graph, manage
-from myia.lib import ANYTHING, AbstractArray, AbstractHandle, AbstractTuple
+from myia.lib import (
+    ANYTHING,
+    AbstractArray,
+    AbstractHandle,
+    AbstractScalar,
+    AbstractTuple,
+)
 from myia.operations import Primitive, primitives as P
-from myia.xtype import Tuple, type_to_np_dtype
+from myia.xtype import Bool, Float, Nil, Number, Tuple, type_to_np_dtype
+
+
+def _elementwise_template(fn, xtype):
+    """Return the ELEMENTWISE_MAP template for fn on values of xtype.
+
+    Return None if there is none, or if it would not compute the same
+    values as the scalar primitive.
+    """
+    if fn is P.scalar_div and not issubclass(xtype, Float):
+        return None
+    return ELEMENTWISE_MAP.get(fn, None)
+
+
+def _elementwise_code(c, graph, arrays):
+    """Generate a numpy expression that maps graph over arrays.
+
+    Return None if the graph calls a primitive that has no elementwise
+    equivalent in ELEMENTWISE_MAP, or if it uses free variables.
+    """
+    code = {p: c.ref(a) for p, a in zip(graph.parameters, arrays)}
+    for node in toposort(graph.output, NodeVisitor(), in_graph(graph)):
+        if node.is_constant():
+            code[node] = str(c.make_const(node.value, node.abstract))
+        elif node.is_apply():
+            fn, *inputs = node.inputs
+            if node.is_apply(P.scalar_cast):
+                inputs = inputs[:1]
+            if not fn.is_constant(Primitive) or any(
+                i not in code for i in inputs
+            ):
+                # Free variables are not in code
+                return None
+            if fn.value is P.scalar_cast:
+                dtype = type_to_np_dtype(node.inputs[2].value.xtype())
+                code[node] = f"np.asarray({code[inputs[0]]}, dtype='{dtype}')"
+            else:
+                template = _elementwise_template(
+                    fn.value, node.abstract.xtype()
+                )
+                if template is None:
+                    return None
+                code[node] = template % tuple(code[i] for i in inputs)
+    return code.get(graph.output, None)
 
 
 def python_array_map(c, fn, *arrays):
-    """Implementation for primitive array_map."""
-    assert fn.is_constant(Primitive)
+    """Implementation for primitive array_map.
+
+    An array_map on a primitive, or on a scalar graph such as the ones
+    built by the fuse_array_map optimization, becomes a numpy expression.
+    Other functions are called on each element with np.vectorize.
+    """
+    code = None
+    if fn.is_constant_graph():
+        code = _elementwise_code(c, fn.value, arrays)
+    else:
+        assert fn.is_constant(Primitive)
+        # The primitive is applied on the element type of the arrays, and
+        # ELEMENTWISE_MAP only needs that type to check scalar_div.
+        template = _elementwise_template(
+            fn.value, arrays[0].abstract.element.xtype()
+        )
+        if template is not None:
+            code = template % tuple(c.ref(a) for a in arrays)
+    if code is not None:
+        return f"np.asarray({code})"
     return f"np.vectorize({c.ref(fn)})({', '.join(c.ref(a) for a in arrays)})"
 
 
+def _reduce_primitive(fn):
+    """Return the primitive that fn reduces with, or None.
+
+    fn may be a primitive, or a graph that applies a primitive to its two
+    parameters. All the reductions in REDUCE_MAP are commutative, so the
+    order of the parameters does not matter. Copied from pytorch backend.
+    """
+    if fn.is_constant(Primitive):
+        return fn.value
+    elif fn.is_constant_graph():
+        g = fn.value
+        out = g.output
+        if (
+            len(g.parameters) == 2
+            and out.is_apply()
+            and out.inputs[0].is_constant(Primitive)
+            and len(out.inputs) == 3
+            and set(out.inputs[1:]) == set(g.parameters)
+        ):
+            return out.inputs[0].value
+    return None
+
+
+def python_array_reduce(c, fn, array, shp):
+    """Implementation for primitive array_reduce.
+
+    Reductions on the primitives of REDUCE_MAP use the reduce method of
+    the corresponding numpy ufunc. Other functions are reduced with a
+    ufunc built by np.frompyfunc, which calls them on each element.
+    """
+    array = c.ref(array)
+    shp = c.ref(shp)
+    ufunc = REDUCE_MAP.get(_reduce_primitive(fn), None)
+    if ufunc is not None:
+        return f"IMPL.array_reduce_ufunc({ufunc}, {array}, {shp})"
+    return f"IMPL.array_reduce({c.ref(fn)}, {array}, {shp})"
+
+
 def python_scalar_to_array(c, x, t):
     """Implementation for primitive scalar_to_array."""
     assert t.is_constant(AbstractArray)
@@ -197,12 +302,12 @@ def python_universe_getitem(c, universe, handle):
 SIMPLE_MAP = {
     P.argmax: f"IMPL.argmax(%s, %s)",
     P.array_max: "np.array(np.max(%s, %s))",
-    P.array_reduce: "IMPL.array_reduce(%s, %s, %s)",
     P.array_to_scalar: "%s.item()",
     P.bool_and: "%s and %s",
     P.bool_eq: "%s == %s",
     P.bool_not: "not %s",
     P.bool_or: "%s or %s",
+    P.broadcast_shape: "IMPL.broadcast_shape(%s, %s)",
     P.casttag: "%s.cast(%s)",
     P.concat: "np.concatenate(%s, axis=%s)",
     P.conv2d: "IMPL.conv2d(%s, %s, %s, %s, %s, %s)",
@@ -245,15 +350,66 @@ SIMPLE_MAP = {
     P.scalar_uadd: "%s",
     P.scalar_usub: "-%s",
     P.scatter: "IMPL.scatter(%s, %s, %s, %s)",
+    P.shape: "%s.shape",
     P.scatter_add: f"IMPL.scatter_add(%s, %s, %s, %s)",
     P.take: "np.take(%s, %s, axis=0)",
     P.transpose: "np.transpose(%s, %s)",
     P.tuple_getitem: "%s[%s]",
 }
+# Elementwise numpy versions of the scalar primitives, used to compile
+# array_map on a scalar graph.
+ELEMENTWISE_MAP = {
+    P.bool_and: "np.logical_and(%s, %s)",
+    P.bool_eq: "np.equal(%s, %s)",
+    P.bool_not: "np.logical_not(%s)",
+    P.bool_or: "np.logical_or(%s, %s)",
+    P.scalar_abs: "np.abs(%s)",
+    P.scalar_add: "np.add(%s, %s)",
+    P.scalar_bit_and: "np.bitwise_and(%s, %s)",
+    P.scalar_bit_lshift: "np.left_shift(%s, %s)",
+    P.scalar_bit_not: "np.invert(%s)",
+    P.scalar_bit_or: "np.bitwise_or(%s, %s)",
+    P.scalar_bit_rshift: "np.right_shift(%s, %s)",
+    P.scalar_bit_xor: "np.bitwise_xor(%s, %s)",
+    P.scalar_cos: "np.cos(%s)",
+    P.scalar_div: "np.true_divide(%s, %s)",
+    P.scalar_eq: "np.equal(%s, %s)",
+    P.scalar_exp: "np.exp(%s)",
+    P.scalar_floor: "np.floor(%s)",
+    P.scalar_ge: "np.greater_equal(%s, %s)",
+    P.scalar_gt: "np.greater(%s, %s)",
+    P.scalar_le: "np.less_equal(%s, %s)",
+    P.scalar_log: "np.log(%s)",
+    P.scalar_lt: "np.less(%s, %s)",
+    P.scalar_max: "np.maximum(%s, %s)",
+    P.scalar_mod: "np.mod(%s, %s)",
+    P.scalar_mul: "np.multiply(%s, %s)",
+    P.scalar_ne: "np.not_equal(%s, %s)",
+    P.scalar_pow: "np.power(%s, %s)",
+    P.scalar_sign: "np.sign(%s)",
+    P.scalar_sin: "np.sin(%s)",
+    P.scalar_sub: "np.subtract(%s, %s)",
+    P.scalar_tan: "np.tan(%s)",
+    P.scalar_tanh: "np.tanh(%s)",
+    P.scalar_trunc: "np.trunc(%s)",
+    P.scalar_uadd: "np.positive(%s)",
+    P.scalar_usub: "np.negative(%s)",
+    P.switch: "np.where(%s, %s, %s)",
+}
+# Numpy ufuncs that reduce with the scalar primitives, used to compile
+# array_reduce.
+REDUCE_MAP = {
+    P.bool_and: "np.logical_and",
+    P.bool_or: "np.logical_or",
+    P.scalar_add: "np.add",
+    P.scalar_max: "np.maximum",
+    P.scalar_mul: "np.multiply",
+}
 COMPLEX_MAP = {
     P.array_cast: python_array_cast,
     P.array_getitem: python_array_getitem,
     P.array_map: python_array_map,
+    P.array_reduce: python_array_reduce,
     P.array_setitem: python_array_setitem,
     P.env_setitem: python_env_setitem,
     P.gather: python_gather,
@@ -416,6 +572,12 @@ class PythonOutputConverter(_PythonConverter):
 class PythonConstantConverter(_PythonConverter):
     """Convert constant values to printable values."""
 
+    def convert_array(self, v, t):
+        return (
+            f"np.frombuffer({v.tobytes()!r}, dtype='{v.dtype}')"
+            f".reshape({v.shape!r})"
+        )
+
     def convert_scalar(self, v, t):
         numpy_typename = type_to_np_dtype(t)
         # For type names below, we return raw value.
@@ -791,8 +953,15 @@ class PythonCompiler(_Compiler):
             else:
                 self.graph_to_name[g] = self.get_label(g)
         # Graph name to function code
-        for g, g_name in self.graph_to_name.items():
-            self.fn_name_to_code[g_name] = self.convert_func(g)
+        try:
+            for g, g_name in self.graph_to_name.items():
+                self.fn_name_to_code[g_name] = self.convert_func(g)
+        except Exception:
+            # Forget the graphs of this run, so that they are not converted
+            # again by the next calls.
+            for g in mng.graphs:
+                self.fn_name_to_code.pop(self.graph_to_name.pop(g), None)
+            raise
         # Compilation.
         pre_code = [
             "import math",
@@ -857,6 +1026,20 @@ class PythonCompiler(_Compiler):
         return FunctionCompiler(graph, self).compile()
 
 
+def _identity(v):
+    return v
+
+
+def _is_plain_value_type(t):
+    """Check if values of type t are the same in and out of the backend."""
+    if isinstance(t, (AbstractArray, AbstractTuple)):
+        return True
+    elif isinstance(t, AbstractScalar):
+        return issubclass(t.xtype(), (Number, Bool, Nil))
+    else:
+        return False
+
+
 class PythonBackend(Backend):
     """Python backend."""
 
@@ -891,6 +1074,18 @@ class PythonBackend(Backend):
         # Then compile the graph.
         return self.compiler.run(graph, self)
 
+    def from_backend_converter(self, t):
+        """Return a function that converts backend values of type t."""
+        if _is_plain_value_type(t):
+            return _identity
+        return super().from_backend_converter(t)
+
+    def to_backend_converter(self, t):
+        """Return a function that converts intermediate values of type t."""
+        if _is_plain_value_type(t):
+            return _identity
+        return super().to_backend_converter(t)
+
     def supports_prim_group(self, prim_group):
         return all(MAP.has(prim) for prim in prim_group.primitives)
 
@@ -0,0 +1,88 @@
+"""Test array_map and array_reduce on primitives and scalar graphs."""
+
+import io
+
+import numpy as np
+
+from myia import myia
+from myia.operations import (
+    array_map,
+    array_reduce,
+    scalar_add,
+    scalar_exp,
+    scalar_max,
+    scalar_mul,
+    switch,
+)
+
+
+def _compile(fn):
+    output = io.StringIO()
+    return (
+        myia(fn, backend="python", backend_options={"debug": output}),
+        output,
+    )
+
+
+def test_array_map_primitive():
+    def f(xs, ys):
+        return array_map(scalar_mul, array_map(scalar_exp, xs), ys)
+
+    f, output = _compile(f)
+    xs = np.arange(6.0).reshape((2, 3))
+    assert np.allclose(f(xs, xs), np.exp(xs) * xs)
+    code = output.getvalue()
+    assert "np.vectorize" not in code
+    assert "np.exp(" in code
+
+
+def test_array_map_graph():
+    def fn(x):
+        return switch(x > 0.0, x, 0.0) * 2.0
+
+    def f(xs):
+        return array_map(fn, xs)
+
+    f, output = _compile(f)
+    xs = np.arange(-3.0, 3.0).reshape((2, 3))
+    res = f(xs)
+    assert res.dtype == xs.dtype
+    assert np.all(res == np.maximum(xs, 0.0) * 2.0)
+    assert "np.vectorize" not in output.getvalue()
+
+
+def test_array_map_closure():
+    def f(xs, y):
+        def fn(x):
+            return x * y + 1.0
+
+        return array_map(fn, xs)
+
+    f, _ = _compile(f)
+    xs = np.arange(6.0).reshape((2, 3))
+    assert np.all(f(xs, 3.0) == xs * 3.0 + 1.0)
+
+
+def test_array_reduce_primitive():
+    def f(xs):
+        return array_reduce(scalar_max, xs, (1, 3))
+
+    f, output = _compile(f)
+    xs = np.arange(6.0).reshape((2, 3))
+    assert np.all(f(xs) == np.max(xs, axis=0, keepdims=True))
+    assert "IMPL.array_reduce_ufunc(np.maximum" in output.getvalue()
+
+
+def test_array_reduce_graph():
+    def add(a, b):
+        return scalar_add(b, a)
+
+    def f(xs):
+        return array_reduce(add, xs, ())
+
+    f, output = _compile(f)
+    xs = np.arange(24).reshape((2, 3, 4))
+    res = f(xs)
+    assert res == 276
+    assert res.dtype == xs.dtype
+    assert "IMPL.array_reduce_ufunc(np.add" in output.getvalue()
@@ -0,0 +1,110 @@
+"""Test the convolution kernels of the Python backend."""
+
+import numpy as np
+import pytest
+
+from myia_backend_python import implementations as IMPL
+
+
+def conv2d_reference(x, w, strides, padding, dilation, groups):
+    """Compute conv2d one output pixel at a time."""
+    x = np.pad(x, ((0, 0), (0, 0)) + tuple((p, p) for p in padding))
+    b, c, h, wd = x.shape
+    out_c, in_cg, kh, kw = w.shape
+    out_cg = out_c // groups
+    out_h = (h - dilation[0] * (kh - 1) - 1) // strides[0] + 1
+    out_w = (wd - dilation[1] * (kw - 1) - 1) // strides[1] + 1
+    out = np.zeros((b, out_c, out_h, out_w), dtype=x.dtype)
+    for o in range(out_c):
+        g = o // out_cg
+        for y in range(out_h):
+            for z in range(out_w):
+                y0 = y * strides[0]
+                z0 = z * strides[1]
+                window = x[
+                    :,
+                    g * in_cg : (g + 1) * in_cg,
+                    y0 : y0 + dilation[0] * (kh - 1) + 1 : dilation[0],
+                    z0 : z0 + dilation[1] * (kw - 1) + 1 : dilation[1],
+                ]
+                out[:, o, y, z] = np.sum(window * w[o], axis=(1, 2, 3))
+    return out
+
+
+# (input shape, weight shape, strides, padding, dilation, groups)
+conv_params = [
+    ((1, 1, 3, 3), (1, 1, 2, 2), (1, 1), (0, 0), (1, 1), 1),
+    ((2, 6, 4, 5), (3, 2, 3, 3), (2, 3), (3, 2), (3, 4), 3),
+    ((2, 3, 4, 5), (3, 1, 3, 3), (2, 3), (3, 2), (3, 4), 3),
+    ((2, 1, 4, 5), (3, 1, 3, 3), (2, 3), (3, 2), (3, 4), 1),
+    ((5, 2, 7, 6), (4, 2, 4, 3), (1, 2), (0, 1), (1, 1), 1),
+]
+
+
+@pytest.mark.parametrize(
+    "ishape,wshape,strides,padding,dilation,groups", conv_params
+)
+def test_conv2d(ishape, wshape, strides, padding, dilation, groups):
+    x = np.random.randn(*ishape)
+    w = np.random.randn(*wshape)
+    out = IMPL.conv2d(x, w, strides, padding, dilation, groups)
+    ref = conv2d_reference(x, w, strides, padding, dilation, groups)
+    assert out.shape == ref.shape
+    assert np.allclose(out, ref)
+
+
+@pytest.mark.parametrize(
+    "ishape,wshape,strides,padding,dilation,groups", conv_params
+)
+def test_conv2d_weight_grad(ishape, wshape, strides, padding, dilation, groups):
+    x = np.random.randn(*ishape)
+    w = np.random.randn(*wshape)
+    out = IMPL.conv2d(x, w, strides, padding, dilation, groups)
+    gout = np.random.randn(*out.shape)
+    gw = IMPL.conv2d_weight_grad(
+        x, wshape, gout, strides, padding, dilation, groups
+    )
+    assert gw.shape == wshape
+    # conv2d is linear in w, so the gradient is the response to each weight
+    for idx in np.ndindex(*wshape):
+        e = np.zeros(wshape)
+        e[idx] = 1
+        ref = conv2d_reference(x, e, strides, padding, dilation, groups)
+        assert np.isclose(gw[idx], np.sum(ref * gout))
+
+
+@pytest.mark.parametrize(
+    "ishape,wshape,strides,padding,dilation,groups", conv_params
+)
+def test_conv_transpose2d(ishape, wshape, strides, padding, dilation, groups):
+    x = np.random.randn(*ishape)
+    w = np.random.randn(*wshape)
+    out = IMPL.conv2d(x, w, strides, padding, dilation, groups)
+    gout = np.random.randn(*out.shape)
+    # The output padding recovers the rows and columns of the input that
+    # the strided windows skip.
+    output_padding = tuple(
+        ishape[i + 2]
+        + 2 * padding[i]
+        - dilation[i] * (wshape[i + 2] - 1)
+        - 1
+        - (out.shape[i + 2] - 1) * strides[i]
+        for i in range(2)
+    )
+    gx = IMPL.conv_transpose2d(
+        gout, w, strides, padding, output_padding, groups, dilation
+    )
+    assert gx.shape == ishape
+    # conv_transpose2d is the adjoint of conv2d with respect to the input
+    y = np.random.randn(*ishape)
+    ref = conv2d_reference(y, w, strides, padding, dilation, groups)
+    assert np.isclose(np.sum(ref * gout), np.sum(y * gx))
+
+
+def test_conv2d_float32():
+    x = np.random.randn(2, 3, 5, 5).astype("float32")
+    w = np.random.randn(4, 3, 2, 2).astype("float32")
+    out = IMPL.conv2d(x, w, (1, 1), (1, 1), (1, 1), 1)
+    assert out.dtype == np.float32
+    ref = conv2d_reference(x, w, (1, 1), (1, 1), (1, 1), 1)
+    assert np.allclose(out, ref, atol=1e-5)
@@ -0,0 +1,68 @@
+"""Test the max_pool2d kernels of the Python backend."""
+
+import numpy as np
+import pytest
+
+from myia.operations.prim_max_pool2d import max_pool2d_out_size
+from myia_backend_python import implementations as IMPL
+
+
+def max_pool2d_reference(x, ws, stride, pad, ceil_mode):
+    """Compute max_pool2d and its argmax one window at a time."""
+    h, w = x.shape[-2:]
+    out_h = max_pool2d_out_size(h, ws[0], stride[0], pad[0], 1, ceil_mode)
+    out_w = max_pool2d_out_size(w, ws[1], stride[1], pad[1], 1, ceil_mode)
+    out = np.zeros(x.shape[:-2] + (out_h, out_w), dtype=x.dtype)
+    grad = np.zeros_like(x)
+    for k in np.ndindex(*x.shape[:-2]):
+        for i in range(out_h):
+            for j in range(out_w):
+                r0 = max(i * stride[0] - pad[0], 0)
+                r1 = min(i * stride[0] - pad[0] + ws[0], h)
+                c0 = max(j * stride[1] - pad[1], 0)
+                c1 = min(j * stride[1] - pad[1] + ws[1], w)
+                window = x[k][r0:r1, c0:c1]
+                out[k + (i, j)] = window.max()
+                r, c = np.unravel_index(np.argmax(window), window.shape)
+                grad[k + (r0 + r, c0 + c)] += 1
+    return out, grad
+
+
+# (input shape, window, stride, padding, ceil_mode)
+pool_params = [
+    ((2, 4, 3, 5), (2, 2), (1, 1), (0, 0), False),
+    ((1, 1, 4, 4), (2, 2), (1, 3), (1, 1), False),
+    ((3, 2, 7, 6), (3, 2), (2, 2), (1, 0), False),
+    ((2, 4, 5, 7), (2, 3), (2, 2), (1, 1), True),
+    ((3, 2, 7, 6), (3, 3), (2, 3), (0, 0), True),
+]
+
+
+@pytest.mark.parametrize("shape,ws,stride,pad,ceil_mode", pool_params)
+def test_max_pool2d(shape, ws, stride, pad, ceil_mode):
+    x = np.random.randn(*shape)
+    out = IMPL.max_pool2d(x, ws, stride, pad, ceil_mode)
+    ref, _ = max_pool2d_reference(x, ws, stride, pad, ceil_mode)
+    assert out.shape == ref.shape
+    assert np.all(out == ref)
+
+
+@pytest.mark.parametrize("shape,ws,stride,pad,ceil_mode", pool_params)
+def test_max_pool2d_grad(shape, ws, stride, pad, ceil_mode):
+    x = np.random.randn(*shape)
+    _, ref = max_pool2d_reference(x, ws, stride, pad, ceil_mode)
+    out = IMPL.max_pool2d(x, ws, stride, pad, ceil_mode)
+    gz = np.ones_like(out)
+    gx = IMPL.max_pool2d_grad(x, ws, stride, pad, ceil_mode, gz)
+    assert gx.shape == x.shape
+    assert np.all(gx == ref)
+
+
+def test_max_pool2d_grad_modified_input():
+    x = np.random.randn(2, 3, 4, 4)
+    out = IMPL.max_pool2d(x, (2, 2), (2, 2), (0, 0), False)
+    x[...] = np.random.randn(*x.shape)
+    _, ref = max_pool2d_reference(x, (2, 2), (2, 2), (0, 0), False)
+    gz = np.ones_like(out)
+    gx = IMPL.max_pool2d_grad(x, (2, 2), (2, 2), (0, 0), False, gz)
+    assert np.all(gx == ref)
@@ -0,0 +1,66 @@
+"""Test the scatter and take_grad_inp kernels of the Python backend."""
+
+import numpy as np
+import pytest
+
+from myia_backend_python import implementations as IMPL
+
+
+def scatter_reference(x, axis, indices, src, add):
+    """Scatter src into a copy of x one element at a time."""
+    output = x.copy()
+    for index in np.ndindex(*indices.shape):
+        new_index = list(index)
+        new_index[axis] = indices[index]
+        if add:
+            output[tuple(new_index)] += src[index]
+        else:
+            output[tuple(new_index)] = src[index]
+    return output
+
+
+# (x shape, axis, indices shape, src shape)
+scatter_params = [
+    ((5,), 0, (3,), (3,)),
+    ((3, 5), 1, (3, 2), (3, 2)),
+    ((3, 5), 0, (2, 5), (3, 5)),
+    ((4, 3, 5), -1, (2, 3, 4), (2, 3, 5)),
+    ((4, 3, 5), 1, (4, 2, 5), (4, 3, 5)),
+]
+
+
+@pytest.mark.parametrize("xshape,axis,ishape,sshape", scatter_params)
+def test_scatter(xshape, axis, ishape, sshape):
+    x = np.random.randn(*xshape)
+    src = np.random.randn(*sshape)
+    # scatter leaves the result unspecified for repeated indices, so each
+    # index appears at most once along the axis.
+    axis = axis % len(xshape)
+    shape = list(ishape)
+    shape[axis] = xshape[axis]
+    indices = np.argsort(np.random.rand(*shape), axis=axis)
+    indices = np.take(indices, range(ishape[axis]), axis=axis)
+    ref = scatter_reference(x, axis, indices, src, False)
+    assert np.all(IMPL.scatter(x, axis - len(xshape), indices, src) == ref)
+
+
+@pytest.mark.parametrize("xshape,axis,ishape,sshape", scatter_params)
+def test_scatter_add(xshape, axis, ishape, sshape):
+    x = np.random.randn(*xshape)
+    src = np.random.randn(*sshape)
+    indices = np.random.randint(xshape[axis], size=ishape)
+    ref = scatter_reference(x, axis % len(xshape), indices, src, True)
+    res = IMPL.scatter_add(x, axis, indices, src)
+    assert res.shape == x.shape
+    assert np.allclose(res, ref)
+
+
+def test_take_grad_inp():
+    indices = np.array([[0, 2, 2], [4, 0, 2]])
+    values = np.random.randn(2, 3, 4)
+    res = IMPL.take_grad_inp(6, indices, values)
+    assert res.shape == (6, 4)
+    assert np.allclose(res[0], values[0, 0] + values[1, 1])
+    assert np.allclose(res[2], values[0, 1] + values[0, 2] + values[1, 2])
+    assert np.allclose(res[4], values[1, 0])
+    assert np.all(res[[1, 3, 5]] == 0)
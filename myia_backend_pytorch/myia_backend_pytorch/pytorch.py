@@ -1,5 +1,7 @@
 """Linear implementation using pytorch."""
 
+from collections import defaultdict
+
 import numpy as np
 import torch
 
@@ -7,7 +9,7 @@ from myia import abstract, xtype
 from myia.compile.backends import Backend
 from myia.compile.cconv import closure_convert
 from myia.compile.transform import CompileGraphs, nonlinear_ops
-from myia.ir import manage
+from myia.ir import manage, toposort
 from myia.operations import Primitive, primitives as P
 from myia.utils import RandomStateWrapper, TaggedValue, untested
 from myia.utils.universe import HandleInstance
@@ -38,16 +40,28 @@ def pytorch_array_to_scalar(v):
 
 
 def pytorch_take_grad_inp(nb_indices, indices, values):
+    """Implementation of take_grad_inp for pytorch."""
     row_size = values.shape[-1]
-    broadcastable_indices = indices.reshape(tuple(indices.shape) + (1,))
-    output = torch.zeros((nb_indices, row_size), dtype=values.dtype)
-    for i in range(nb_indices):
-        output[i] = (
-            ((broadcastable_indices == i).to(values.dtype) * values)
-            .reshape((-1, row_size))
-            .sum(dim=(0,))
-        )
-    return output
+    output = torch.zeros(
+        (nb_indices, row_size), dtype=values.dtype, device=values.device
+    )
+    # index_add_ only accepts int64 indices
+    return output.index_add_(
+        0, indices.reshape(-1).long(), values.reshape((-1, row_size))
+    )
+
+
+def _pytorch_shape(shp):
+    """Represent a shape as a tuple of u64 scalars."""
+    return tuple(np.asarray(d, dtype="uint64") for d in shp)
+
+
+def pytorch_broadcast_shape(shpx, shpy):
+    """Implementation of broadcast_shape for pytorch."""
+    shpx = tuple(int(d) for d in shpx)
+    shpy = tuple(int(d) for d in shpy)
+    impl = P.broadcast_shape.defaults()["python_implementation"]
+    return _pytorch_shape(impl(shpx, shpy))
 
 
 def pytorch_random_initialize(seed):
@@ -71,6 +85,7 @@ simple_mapping = {
     P.scalar_abs: np.absolute,
     P.scalar_add: lambda a, b: a + b,
     P.scalar_sub: lambda a, b: a - b,
+    P.scalar_max: np.maximum,
     P.scalar_mul: lambda a, b: a * b,
     P.scalar_div: lambda a, b: (a / b).astype(a.dtype),
     P.scalar_mod: lambda a, b: a % b,
@@ -105,6 +120,8 @@ simple_mapping = {
     P.distribute: lambda a, shp: a.expand(*shp) if shp != () else a,
     P.transpose: lambda a, perm: a.permute(*perm),
     P.reshape: lambda a, shp: a.reshape(shp),
+    P.shape: lambda a: _pytorch_shape(a.shape),
+    P.broadcast_shape: pytorch_broadcast_shape,
     P.dot: torch.mm,
     P.take: lambda w, i: torch.nn.functional.embedding(i, w),
     P.take_grad_inp: pytorch_take_grad_inp,
@@ -177,9 +194,71 @@ def pytorch_array_cast(op):
     return _impl, op.inputs[1:2]
 
 
+def _pytorch_cast_to(dt):
+    def _impl(x):
+        return x.to(dtype=dt)
+
+    return _impl
+
+
+def _pytorch_scalar_graph(g, cache=None):
+    """Translate the scalar graph g to a function on tensors.
+
+    The primitives called by g are mapped to the torch functions in
+    scalar_mapping, and the graphs it calls are translated recursively, so
+    that the resulting function maps g elementwise over tensors without
+    going through the VM.
+    """
+    if cache is None:
+        cache = {}
+    if g in cache:
+        if cache[g] is None:
+            raise NotImplementedError(f"array_map of recursive graph {g}")
+        return cache[g]
+    cache[g] = None
+
+    values = {}
+    ops = []
+    for node in toposort(g.output):
+        if node.is_constant((bool, int, float, np.number, np.bool_)):
+            dt = _type_map[node.abstract.xtype()]
+            values[node] = torch.tensor(node.value, dtype=dt)
+        elif node.is_apply():
+            fn, *inputs = node.inputs
+            if fn.is_constant_graph():
+                impl = _pytorch_scalar_graph(fn.value, cache)
+            elif fn.is_constant(Primitive) and fn.value is P.scalar_cast:
+                dt = _type_map[inputs[1].value.xtype()]
+                impl = _pytorch_cast_to(dt)
+                inputs = inputs[:1]
+            elif fn.is_constant(Primitive) and fn.value in scalar_mapping:
+                impl = scalar_mapping[fn.value]
+            else:
+                raise NotImplementedError(f"array_map of {fn}")
+            ops.append((node, impl, inputs))
+
+    def _impl(*args):
+        env = dict(values)
+        env.update(zip(g.parameters, args))
+        for node, impl, inputs in ops:
+            env[node] = impl(*[env[i] for i in inputs])
+        return env[g.output]
+
+    cache[g] = _impl
+    return _impl
+
+
 def pytorch_array_map(op):
     """Implementation of array_map for pytorch."""
     fn = op.inputs[1]
+    if fn.is_constant_graph():
+        impl = _pytorch_scalar_graph(fn.value)
+
+        def _impl(*args):
+            return (impl(*args),)
+
+        return _impl, op.inputs[2:]
+
     assert fn.is_constant(Primitive)
     fn = fn.value
     if fn in scalar_mapping:
@@ -214,40 +293,103 @@ def _pytorch_array_reduce_add(tshp):
     return _impl
 
 
-def _pytorch_array_reduce_mul(tshp):
-    """Generate implementation for product reduction based on given axes."""
+def _pytorch_array_reduce_dims(reduce):
+    """Generate implementations for a reduction along the reduced axes.
 
-    def _impl(array):
-        ashp = array.shape
+    reduce(array, dim) must reduce the array along dim, keeping the
+    dimension.
+    """
 
-        if len(tshp) in (0, len(ashp)):
-            res = torch.prod(array)
-        else:
-            raise NotImplementedError(
-                "We currently only support full product on an array."
-            )
-        return (res,)
+    def gen_impl(tshp):
+        def _impl(array):
+            ashp = array.shape
 
-    return _impl
+            if len(tshp) < len(ashp):
+                ts = (1,) * (len(ashp) - len(tshp)) + tshp
+            else:
+                ts = tshp
+            res = array
+            for dim, (t, a) in enumerate(zip(ts, ashp)):
+                if t == 1 and a != 1:
+                    res = reduce(res, dim)
+            if len(tshp) < len(ashp):
+                res = torch.reshape(res, shape=tshp)
+            return (res,)
+
+        return _impl
+
+    return gen_impl
+
+
+_reduce_mapping = {
+    P.scalar_add: _pytorch_array_reduce_add,
+    P.scalar_mul: _pytorch_array_reduce_dims(
+        lambda a, dim: torch.prod(a, dim, keepdim=True)
+    ),
+    P.scalar_max: _pytorch_array_reduce_dims(
+        lambda a, dim: torch.max(a, dim, keepdim=True)[0]
+    ),
+    P.bool_and: _pytorch_array_reduce_dims(
+        lambda a, dim: torch.all(a, dim, keepdim=True)
+    ),
+    P.bool_or: _pytorch_array_reduce_dims(
+        lambda a, dim: torch.any(a, dim, keepdim=True)
+    ),
+}
+
+
+def _pytorch_fold_dim(fn):
+    """Reduce along one dimension by folding the binary function fn.
+
+    fn is applied elementwise to slices of the array along dim, so this
+    works for any scalar graph that _pytorch_scalar_graph can translate.
+    """
+
+    def _reduce(a, dim):
+        res = a.narrow(dim, 0, 1)
+        for i in range(1, a.shape[dim]):
+            res = fn(res, a.narrow(dim, i, 1))
+        return res
+
+    return _reduce
+
+
+def _reduce_primitive(fn):
+    """Return the primitive that fn reduces with, or None.
+
+    fn may be a primitive, or a graph that applies a primitive to its two
+    parameters. All the reductions in _reduce_mapping are commutative, so
+    the order of the parameters does not matter.
+    """
+    if fn.is_constant(Primitive):
+        return fn.value
+    elif fn.is_constant_graph():
+        g = fn.value
+        out = g.output
+        if (
+            len(g.parameters) == 2
+            and out.is_apply()
+            and out.inputs[0].is_constant(Primitive)
+            and len(out.inputs) == 3
+            and set(out.inputs[1:]) == set(g.parameters)
+        ):
+            return out.inputs[0].value
+    return None
 
 
 def pytorch_array_reduce(op):
     """Implementation of array_reduce for pytorch."""
     fn = op.inputs[1]
     shape = op.inputs[3]
-    assert fn.is_constant(Primitive)
     assert shape.is_constant(tuple)
-    fn = fn.value
-    tshp = shape.value
-
-    if fn == P.scalar_add:
-        gen_impl = _pytorch_array_reduce_add
-    elif fn == P.scalar_mul:
-        gen_impl = _pytorch_array_reduce_mul
-    else:
-        raise NotImplementedError(f"reduce with {fn}")
+    gen_impl = _reduce_mapping.get(_reduce_primitive(fn), None)
+    if gen_impl is None:
+        if not fn.is_constant_graph():
+            raise NotImplementedError(f"reduce with {fn}")
+        impl = _pytorch_scalar_graph(fn.value)
+        gen_impl = _pytorch_array_reduce_dims(_pytorch_fold_dim(impl))
 
-    return gen_impl(tshp), (op.inputs[2],)
+    return gen_impl(shape.value), (op.inputs[2],)
 
 
 def pytorch_array_getitem(op):
@@ -331,7 +473,7 @@ def pytorch_scatter(op):
 
     def _impl(x, dim, index, src):
         dim = dim.item()
-        return (torch.scatter(x, dim, index, src),)
+        return (torch.scatter(x, dim, index.long(), src),)
 
     return _impl, op.inputs[1:]
 
@@ -341,7 +483,7 @@ def pytorch_scatter_add(op):
 
     def _impl(x, dim, index, src):
         dim = dim.item()
-        return (torch.scatter_add(x, dim, index, src),)
+        return (torch.scatter_add(x, dim, index.long(), src),)
 
     return _impl, op.inputs[1:]
 
@@ -389,15 +531,17 @@ def pytorch_conv_transpose2d(op):
         output_padding = tuple(_x.item() for _x in output_padding)
         dilation = tuple(_x.item() for _x in dilation)
         groups = groups.item()
-        return torch.conv_transpose2d(
-            input,
-            weight,
-            None,
-            stride,
-            padding,
-            output_padding,
-            groups,
-            dilation,
+        return (
+            torch.conv_transpose2d(
+                input,
+                weight,
+                None,
+                stride,
+                padding,
+                output_padding,
+                groups,
+                dilation,
+            ),
         )
 
     return _impl, op.inputs[1:]
@@ -493,24 +637,72 @@ for k, v in simple_mapping.items():
     _mapping[k] = lambda op, v=v: (lambda *args: (v(*args),), op.inputs[1:])
 
 
-def pytorch_convert(lst, backend):
-    """Convert myia op to pytorch op."""
-    assert len(lst) == 1
-    op = lst[0]
-
+def _pytorch_op(op, backend):
+    """Return the implementation of a myia op and the inputs it takes."""
     assert op.is_apply()
     assert op.inputs[0].is_constant(Primitive)
 
     fn = op.inputs[0].value
     if fn == P.scalar_to_array:
         # Hack because we need the runtime context here.
-        return lambda v: (backend.from_numpy(v),), [op.inputs[1]], [op]
+        return lambda v: (backend.from_numpy(v),), [op.inputs[1]]
 
     mapper = _mapping.get(fn, None)
     if mapper is None:
         raise NotImplementedError(fn)
-    impl, inputs = mapper(op)
-    return impl, inputs, [op]
+    return mapper(op)
+
+
+def pytorch_convert(lst, backend):
+    """Convert a linear segment of myia ops to a pytorch function.
+
+    A single op is mapped to its implementation. Longer segments are
+    compiled into one function that runs the implementations of the ops
+    in order, so that the VM makes a single call for the whole segment and
+    only sees the values that are used outside of it.
+    """
+    if len(lst) == 1:
+        impl, inputs = _pytorch_op(lst[0], backend)
+        return impl, inputs, lst
+
+    ops = [(op, *_pytorch_op(op, backend)) for op in lst]
+    segment = set(lst)
+    uses = lst[0].graph.manager.uses
+
+    inputs = []
+    last_use = {}
+    for idx, (_, _, op_inputs) in enumerate(ops):
+        for i in op_inputs:
+            if i not in segment and i not in inputs:
+                inputs.append(i)
+            last_use[i] = idx
+    outputs = [
+        op for op in lst if any(user not in segment for user, _ in uses[op])
+    ]
+
+    slots = {node: idx for idx, node in enumerate(inputs + lst)}
+    # Intermediate values are dropped after their last use in the segment
+    drops = defaultdict(list)
+    for node in segment - set(outputs):
+        drops[last_use[node]].append(slots[node])
+    steps = [
+        (impl, [slots[i] for i in op_inputs], slots[op], drops[idx])
+        for idx, (op, impl, op_inputs) in enumerate(ops)
+    ]
+    out_slots = [slots[o] for o in outputs]
+    padding = [None] * len(lst)
+
+    def _impl(*args):
+        env = [*args, *padding]
+        for impl, args_slots, out_slot, drop in steps:
+            out = impl(*[env[i] for i in args_slots])
+            # Like FinalVM.inst_external, accept a bare value
+            env[out_slot] = out[0] if isinstance(out, tuple) else out
+            for i in drop:
+                env[i] = None
+        return tuple(env[i] for i in out_slots)
+
+    return _impl, inputs, outputs
 
 
 class PyTorchBackend(Backend):
@@ -519,14 +711,16 @@ class PyTorchBackend(Backend):
     Backend options:
 
         :device: the target device for data storage ('cpu', 'cuda', 'cuda:X')
+        :fuse: whether to compile each linear segment of a graph into a
+            single function rather than one function per operation
 
     """
 
-    def __init__(self, device):
+    def __init__(self, device, fuse=True):
         """Create a PyTorch backend on the given device."""
         self.device = torch.device(device)
         self.compiler = CompileGraphs(
-            lambda lst: pytorch_convert(lst, self), nonlinear_ops, self
+            lambda lst: pytorch_convert(lst, self), nonlinear_ops, self, fuse
         )
 
     def compile(self, graph, *others):
@@ -630,17 +824,48 @@ class PyTorchBackend(Backend):
         else:
             raise NotImplementedError(f"to_backend_value for {t}")
 
+    def from_backend_converter(self, t):
+        """Return a function that converts backend values of type t."""
+        if isinstance(t, abstract.AbstractScalar):
+            return self.to_scalar
+        elif isinstance(t, abstract.AbstractArray):
+            array_type = t.element.xtype()
+            if array_type and array_type not in _type_map:
+                dtype = type_to_np_dtype(array_type)
+                return lambda v: self.to_numpy(v).astype(dtype)
+            return self.to_numpy
+        elif isinstance(t, abstract.AbstractTuple):
+            convs = [self.from_backend_converter(e) for e in t.elements]
+            return lambda v: tuple([conv(x) for conv, x in zip(convs, v)])
+        else:
+            return super().from_backend_converter(t)
+
+    def to_backend_converter(self, t):
+        """Return a function that converts intermediate values of type t."""
+        if isinstance(t, abstract.AbstractArray):
+            return self.from_numpy
+        elif isinstance(t, abstract.AbstractScalar) and issubclass(
+            t.xtype(), (xtype.Number, xtype.Bool)
+        ):
+            dtype = type_to_np_dtype(t.xtype())
+            return lambda v: None if v is None else np.asarray(v, dtype=dtype)
+        elif isinstance(t, abstract.AbstractTuple):
+            convs = [self.to_backend_converter(e) for e in t.elements]
+            return lambda v: tuple([conv(x) for conv, x in zip(convs, v)])
+        else:
+            return super().to_backend_converter(t)
+
     def supports_prim_group(self, prim_group):
         return all(prim in _mapping for prim in prim_group.primitives)
 
 
-def load_options(device="cpu:0"):
+def load_options(device="cpu:0", fuse=True):
     """Format options for pytorch."""
     if device == "cuda":
         device = "cuda:0"
     if device == "cpu":
         device = "cpu:0"
-    return {"device": device}
+    return {"device": device, "fuse": fuse}
 
 
 def load_backend(options):
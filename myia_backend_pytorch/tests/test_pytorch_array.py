@@ -0,0 +1,59 @@
+"""Test array_map and array_reduce on scalar graphs for Pytorch backend."""
+
+import numpy as np
+
+from myia import myia
+from myia.operations import array_map, array_reduce, scalar_max, switch
+
+backend = "pytorch"
+
+
+def test_array_map_graph():
+    def relu(x):
+        return switch(x > 0.0, x, 0.0)
+
+    def square(x):
+        return x * x
+
+    def fn(x):
+        return relu(square(x) - 1.0)
+
+    @myia(backend=backend)
+    def f(xs):
+        return array_map(fn, xs)
+
+    xs = np.arange(-3.0, 3.0).reshape((2, 3))
+    assert np.all(f(xs) == np.maximum(xs * xs - 1.0, 0.0))
+
+
+def test_array_reduce_max():
+    @myia(backend=backend)
+    def f(xs):
+        return array_reduce(scalar_max, xs, (1, 3))
+
+    xs = np.arange(6.0).reshape((2, 3))
+    assert np.all(f(xs) == np.max(xs, axis=0, keepdims=True))
+
+
+def test_array_reduce_graph():
+    def mx(a, b):
+        return scalar_max(b, a)
+
+    @myia(backend=backend)
+    def f(xs):
+        return array_reduce(mx, xs, ())
+
+    xs = np.arange(6.0).reshape((2, 3))
+    assert f(xs) == 5.0
+
+
+def test_array_reduce_graph_fold():
+    def absmax(a, b):
+        return switch(a * a > b * b, a, b)
+
+    @myia(backend=backend)
+    def f(xs):
+        return array_reduce(absmax, xs, (2, 1))
+
+    xs = np.asarray([[1.0, -4.0, 2.0], [-3.0, 0.5, 2.5]])
+    assert np.all(f(xs) == np.asarray([[-4.0], [-3.0]]))
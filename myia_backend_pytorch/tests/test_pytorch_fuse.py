@@ -0,0 +1,98 @@
+"""Test the compilation of linear segments for Pytorch backend."""
+
+import numpy as np
+import pytest
+
+from myia import myia, value_and_grad
+from myia.operations import conv2d, primitives as P
+from myia_backend_pytorch import pytorch
+
+
+def cost(layers, x, target):
+    for w, b in layers:
+        x = np.tanh(x @ w + b)
+    diff = target - x
+    return np.sum(diff * diff)
+
+
+def mlp_step(layers, x, target):
+    return value_and_grad(cost, "layers", "x")(layers, x, target)
+
+
+def _record_segments(monkeypatch):
+    """Record the segments given to pytorch_convert."""
+    segments = []
+    convert = pytorch.pytorch_convert
+
+    def _convert(lst, backend):
+        segments.append(lst)
+        return convert(lst, backend)
+
+    monkeypatch.setattr(pytorch, "pytorch_convert", _convert)
+    return segments
+
+
+@pytest.mark.parametrize("fuse", [True, False])
+def test_mlp_segments(fuse, monkeypatch):
+    segments = _record_segments(monkeypatch)
+    f = myia(mlp_step, backend="pytorch", backend_options={"fuse": fuse})
+
+    rng = np.random.RandomState(0)
+    layers = tuple(
+        (rng.randn(4, 4).astype("float32"), rng.randn(1, 4).astype("float32"))
+        for _ in range(3)
+    )
+    x = rng.randn(2, 4).astype("float32")
+    target = rng.randn(2, 4).astype("float32")
+    value, dlayers, dx = f(layers, x, target)
+
+    ref = myia(mlp_step, backend="python")
+    ref_value, ref_dlayers, ref_dx = ref(layers, x, target)
+    assert np.isclose(value, ref_value)
+    assert np.allclose(dx, ref_dx, atol=1e-5)
+    for (dw, db), (ref_dw, ref_db) in zip(dlayers, ref_dlayers):
+        assert np.allclose(dw, ref_dw, atol=1e-5)
+        assert np.allclose(db, ref_db, atol=1e-5)
+
+    sizes = {len(segment) for segment in segments}
+    if fuse:
+        assert max(sizes) > 1
+    else:
+        assert sizes == {1}
+
+
+def conv_cost(x, w):
+    y = conv2d(x * x, w, (1, 1), (1, 1), (1, 1), 1)
+    return np.sum(np.tanh(y))
+
+
+def conv_step(x, w):
+    return value_and_grad(conv_cost, "x", "w")(x, w)
+
+
+@pytest.mark.parametrize("fuse", [True, False])
+def test_conv_segments(fuse, monkeypatch):
+    segments = _record_segments(monkeypatch)
+    f = myia(conv_step, backend="pytorch", backend_options={"fuse": fuse})
+
+    rng = np.random.RandomState(0)
+    x = rng.randn(3, 2, 5, 5).astype("float32")
+    w = rng.randn(4, 2, 3, 3).astype("float32")
+    value, dx, dw = f(x, w)
+
+    ref = myia(conv_step, backend="python")
+    ref_value, ref_dx, ref_dw = ref(x, w)
+    assert np.isclose(value, ref_value, rtol=1e-4)
+    assert dx.shape == x.shape
+    assert np.allclose(dx, ref_dx, atol=1e-4)
+    assert np.allclose(dw, ref_dw, atol=1e-4)
+
+    # The gradient wrt x runs conv_transpose2d
+    transposes = [
+        segment
+        for segment in segments
+        if any(op.is_apply(P.conv_transpose2d) for op in segment)
+    ]
+    assert transposes
+    if fuse:
+        assert max(len(segment) for segment in transposes) > 1
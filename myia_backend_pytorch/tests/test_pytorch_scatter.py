@@ -0,0 +1,26 @@
+"""Test the scatter kernels of the Pytorch backend with int32 indices."""
+
+import numpy as np
+import torch
+
+from myia import myia
+from myia.operations import scatter_add
+from myia_backend_pytorch.pytorch import pytorch_take_grad_inp
+
+
+def test_take_grad_inp_int32():
+    indices = torch.tensor([[0, 2], [2, 1]], dtype=torch.int32)
+    values = torch.ones((2, 2, 3))
+    res = pytorch_take_grad_inp(4, indices, values)
+    assert np.all(res.numpy() == [[1] * 3, [1] * 3, [2] * 3, [0] * 3])
+
+
+def test_scatter_add_int32():
+    @myia(backend="pytorch")
+    def f(x, idx, src):
+        return scatter_add(x, 0, idx, src)
+
+    x = np.zeros((3, 2))
+    idx = np.asarray([[0, 2], [2, 2]], dtype="int32")
+    src = np.ones((2, 2))
+    assert np.all(f(x, idx, src) == [[1, 0], [0, 0], [1, 2]])
@@ -117,14 +117,33 @@ def relay_reshape(c, v, shp):
     return res
 
 
-def relay_array_map(c, fn, *array):
-    """Implementation of array_map for Relay."""
-    assert fn.is_constant(Primitive)
-    fn = fn.value
+def _relay_elementwise(fn):
+    """Return the relay operation that maps the primitive fn elementwise."""
     if fn is P.switch:
-        rfn = relay.where
+        return relay.where
     else:
-        rfn = SIMPLE_MAP[fn]
+        return SIMPLE_MAP[fn]
+
+
+def relay_array_map(c, fn, *array):
+    """Implementation of array_map for Relay.
+
+    An array_map on a scalar graph, such as the ones built by the
+    fuse_array_map optimization, is inlined as a single expression on the
+    arrays, which relay compiles to one fused kernel.
+    """
+    if fn.is_constant_graph():
+        g = fn.value
+        exprs = {p: c.ref(a) for p, a in zip(g.parameters, array)}
+        for node in toposort(g.output, NodeVisitor(), in_graph(g)):
+            if node.is_constant():
+                exprs[node] = c.make_const(node.value, node.abstract)
+            elif node.is_apply():
+                rfn = _relay_elementwise(node.inputs[0].value)
+                exprs[node] = rfn(*[exprs[i] for i in node.inputs[1:]])
+        return exprs[g.output]
+    assert fn.is_constant(Primitive)
+    rfn = _relay_elementwise(fn.value)
     return rfn(*[c.ref(a) for a in array])
 
 
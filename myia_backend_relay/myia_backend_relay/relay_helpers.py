@@ -10,6 +10,7 @@ from tvm.relay import adt
 from tvm.runtime.object import Object
 
 from myia.abstract import (
+    ANYTHING,
     AbstractArray,
     AbstractError,
     AbstractFunctionUnique,
@@ -186,7 +187,8 @@ def to_relay_type(self, a: AbstractTuple):
 @ovld  # noqa: F811
 def to_relay_type(self, a: AbstractArray):
     tp = a.element.xtype()
-    return relay.ty.TensorType(a.xshape(), type_to_np_dtype(tp))
+    shp = tuple(relay.Any() if d is ANYTHING else d for d in a.xshape())
+    return relay.ty.TensorType(shp, type_to_np_dtype(tp))
 
 
 @ovld  # noqa: F811
@@ -0,0 +1,53 @@
+"""Models and helpers shared by the benchmarks."""
+
+import time
+
+import numpy as np
+
+from myia import value_and_grad
+from myia.abstract import from_value
+
+
+def cost(layers, x, target):
+    """Squared error of a tanh MLP."""
+    for w, b in layers:
+        x = np.tanh(x @ w + b)
+    diff = target - x
+    return np.sum(diff * diff)
+
+
+def mlp_step(layers, x, target):
+    """Return the cost of a tanh MLP and its gradient."""
+    return value_and_grad(cost)(layers, x, target)
+
+
+def mlp_args(depth, size=10, batch=3, dtype="float64"):
+    """Return arguments for mlp_step, filled with ones."""
+    layers = tuple(
+        (np.ones((size, size), dtype), np.ones((1, size), dtype))
+        for _ in range(depth)
+    )
+    x = np.ones((batch, size), dtype)
+    return layers, x, x
+
+
+def argspec_of(args):
+    """Return the broadened abstract types of args, for the pipeline."""
+    return tuple(from_value(arg, broaden=True) for arg in args)
+
+
+def time_calls(fn, *args, n=3, warmup=False):
+    """Call fn(*args) n times.
+
+    Returns:
+        The result of the last call and the average time per call, in
+        seconds. If warmup is set, fn is called once more beforehand, and
+        that call is not timed.
+
+    """
+    if warmup:
+        fn(*args)
+    start = time.perf_counter()
+    for _ in range(n):
+        res = fn(*args)
+    return res, (time.perf_counter() - start) / n
@@ -0,0 +1,92 @@
+"""Benchmark the convolution kernels of the Python backend.
+
+The kernels are compared to a loop over batch, groups, output and input
+channels that correlates one 2D slice at a time, as the backend used to.
+
+Run with ``pytest --bench -s tests/bench/test_conv.py`` to see the results.
+"""
+
+import numpy as np
+import pytest
+
+from myia_backend_python import implementations as IMPL
+
+from .common import time_calls
+
+
+def _correlate(img, kern, strides, dilation):
+    """Correlate a 2D image with a 2D kernel."""
+    kh, kw = kern.shape
+    out_h = (img.shape[0] - dilation[0] * (kh - 1) - 1) // strides[0] + 1
+    out_w = (img.shape[1] - dilation[1] * (kw - 1) - 1) // strides[1] + 1
+    out = np.zeros((out_h, out_w), dtype=img.dtype)
+    for i in range(kh):
+        for j in range(kw):
+            y = i * dilation[0]
+            x = j * dilation[1]
+            out += (
+                kern[i, j]
+                * img[
+                    y : y + (out_h - 1) * strides[0] + 1 : strides[0],
+                    x : x + (out_w - 1) * strides[1] + 1 : strides[1],
+                ]
+            )
+    return out
+
+
+def _loop_conv2d(inp, weight, strides, padding, dilation, groups):
+    inp = np.pad(inp, ((0, 0), (0, 0)) + tuple((p, p) for p in padding))
+    out_c, in_cg = weight.shape[:2]
+    out_cg = out_c // groups
+    out = None
+    for b in range(inp.shape[0]):
+        for g in range(groups):
+            for n in range(out_cg):
+                o = g * out_cg + n
+                for c in range(in_cg):
+                    res = _correlate(
+                        inp[b, g * in_cg + c], weight[o, c], strides, dilation
+                    )
+                    if out is None:
+                        out = np.zeros(
+                            (inp.shape[0], out_c) + res.shape, dtype=inp.dtype
+                        )
+                    out[b, o] += res
+    return out
+
+
+# (name, input shape, weight shape, strides, padding, dilation, groups)
+shapes = [
+    ("tests", (2, 6, 4, 5), (3, 2, 3, 3), (2, 3), (3, 2), (3, 4), 3),
+    ("tests", (5, 2, 5, 6), (2, 2, 4, 4), (1, 1), (0, 0), (1, 1), 1),
+    ("lenet1", (64, 1, 28, 28), (6, 1, 5, 5), (1, 1), (2, 2), (1, 1), 1),
+    ("lenet2", (64, 6, 14, 14), (16, 6, 5, 5), (1, 1), (0, 0), (1, 1), 1),
+]
+
+
+@pytest.mark.bench
+@pytest.mark.parametrize(
+    "name,ishape,wshape,strides,padding,dilation,groups", shapes
+)
+def test_conv_kernels(name, ishape, wshape, strides, padding, dilation, groups):
+    x = np.random.randn(*ishape).astype("float32")
+    w = np.random.randn(*wshape).astype("float32")
+    args = (strides, padding, dilation, groups)
+    timing = {"n": 5, "warmup": True}
+
+    out, t_conv = time_calls(IMPL.conv2d, x, w, *args, **timing)
+    ref, t_loop = time_calls(_loop_conv2d, x, w, *args, **timing)
+    gout = np.random.randn(*out.shape).astype("float32")
+    wgrad_args = (x, wshape, gout, strides, padding, dilation, groups)
+    _, t_wgrad = time_calls(IMPL.conv2d_weight_grad, *wgrad_args, **timing)
+    tr_args = (gout, w, strides, padding, (0, 0), groups, dilation)
+    _, t_tr = time_calls(IMPL.conv_transpose2d, *tr_args, **timing)
+
+    print()
+    print(f"{name}: input {ishape}, weight {wshape}")
+    print(f"    conv2d (loop)       {t_loop * 1000:9.2f} ms")
+    print(f"    conv2d              {t_conv * 1000:9.2f} ms")
+    print(f"    conv2d_weight_grad  {t_wgrad * 1000:9.2f} ms")
+    print(f"    conv_transpose2d    {t_tr * 1000:9.2f} ms")
+    assert np.allclose(out, ref, atol=1e-4)
+    assert t_conv < t_loop
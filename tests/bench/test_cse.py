@@ -0,0 +1,111 @@
+"""Benchmark the time spent in CSE while optimizing a deep-MLP gradient.
+
+Run with ``pytest --bench -s tests/bench/test_cse.py`` to see the timings.
+"""
+
+import time
+from collections import defaultdict
+
+import pytest
+
+from myia.graph_utils import toposort
+from myia.ir import succ_incoming
+from myia.opt import CSE, cse
+from myia.pipeline import standard_pipeline, steps
+from myia.pipeline.pipeline import LoopPipeline
+
+from .common import argspec_of, mlp_args, mlp_step
+
+
+def _rehash_cse(root, manager):
+    """CSE before it was incremental: rehash every node on every pass."""
+    manager.gc()
+    hashes = {}
+    groups = defaultdict(list)
+    manager.add_graph(root)
+    for g in manager.graphs:
+        for node in toposort(g.return_, succ_incoming):
+            if node in hashes:
+                continue
+            if node.is_constant():
+                h = hash((node.value, node.abstract))
+            elif node.is_apply():
+                h = hash(tuple(hashes[inp] for inp in node.inputs))
+            else:
+                h = hash(node)
+            hashes[node] = h
+            groups[h, node.graph].append(node)
+
+    changes = False
+    for _, group in groups.items():
+        main, *others = group
+        for other in others:
+            if main.is_constant() and other.is_constant():
+                repl = (
+                    main.abstract == other.abstract
+                    and main.value == other.value
+                )
+            elif main.is_apply() and other.is_apply():
+                in1 = main.inputs
+                in2 = other.inputs
+                repl = len(in1) == len(in2) and all(
+                    i1 is i2 for i1, i2 in zip(in1, in2)
+                )
+            else:
+                repl = False
+            if repl:
+                changes = True
+                manager.replace(other, main)
+    return changes
+
+
+class _TimedCSE:
+    """Run a CSE function as a pipeline step and record its duration."""
+
+    def __init__(self, fn, times):
+        self.fn = fn
+        self.times = times
+        self.name = "cse"
+
+    def __call__(self, resources, graph):
+        start = time.perf_counter()
+        self.fn(graph, resources.opt_manager)
+        self.times.append(time.perf_counter() - start)
+        return {"changes": False}
+
+
+def _pipeline(fn, times):
+    def swap(step):
+        if isinstance(step, LoopPipeline):
+            return step.with_steps(
+                *[
+                    _TimedCSE(fn, times) if isinstance(s, CSE) else s
+                    for s in step
+                ]
+            )
+        return step
+
+    pip = standard_pipeline
+    pip = pip.with_steps(*pip[: pip.steps.index(steps.step_validate) + 1])
+    return pip.with_steps(*map(swap, pip))
+
+
+@pytest.mark.bench
+@pytest.mark.parametrize("depth", [4, 16])
+def test_cse_time(depth):
+    args = mlp_args(depth)
+    argspec = argspec_of(args)
+
+    results = {}
+    for name, fn in [("incremental", cse), ("rehash", _rehash_cse)]:
+        times = []
+        res = _pipeline(fn, times)(input=mlp_step, argspec=argspec)
+        mng = res["resources"].opt_manager
+        results[name] = (sum(times), len(times), len(mng.all_nodes))
+
+    print()
+    print(f"MLP gradient with {depth} layers, total time in CSE:")
+    for name, (t, n, nodes) in results.items():
+        print(f"    {name:12} {t * 1000:8.2f} ms in {n} passes, {nodes} nodes")
+    assert results["incremental"][2] == results["rehash"][2]
+    assert results["incremental"][0] < results["rehash"][0]
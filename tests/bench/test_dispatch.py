@@ -0,0 +1,55 @@
+"""Benchmark the per-call overhead of MyiaFunction's argument dispatch.
+
+Run with ``pytest --bench -s tests/bench/test_dispatch.py`` to see the
+timings.
+"""
+
+import time
+
+import numpy as np
+import pytest
+
+from myia import myia
+
+
+def _time_per_call(fn, argsets, repeat):
+    for args in argsets:
+        fn(args)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for args in argsets:
+            fn(args)
+    return (time.perf_counter() - start) / (repeat * len(argsets))
+
+
+@pytest.mark.bench
+@pytest.mark.parametrize("nspecs", [1, 10, 100])
+def test_dispatch_overhead(nspecs):
+    @myia(backend="python")
+    def f(x, y):
+        return x
+
+    argsets = [(np.ones((i + 1,)), (i, 2.0)) for i in range(nspecs)]
+    for args in argsets:
+        f(*args)
+    assert len(f._fast) == nspecs
+
+    def fast(args):
+        return f(*args)
+
+    def full(args):
+        # What __call__ did before the fast path: compute the argspec
+        return f.specialize(args)["output"](*args)
+
+    for args in argsets:
+        assert np.all(fast(args) == full(args))
+
+    repeat = max(1, 5000 // nspecs)
+    t_fast = _time_per_call(fast, argsets, repeat)
+    t_full = _time_per_call(full, argsets, repeat)
+
+    print()
+    print(f"{nspecs} specializations, dispatch time per call:")
+    print(f"    fast path:        {t_fast * 1e6:8.1f} us")
+    print(f"    full abstraction: {t_full * 1e6:8.1f} us")
+    assert t_fast < t_full
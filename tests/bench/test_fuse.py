@@ -0,0 +1,66 @@
+"""Benchmark the memory traffic saved by fusing chains of array_map.
+
+Run with ``pytest --bench -s tests/bench/test_fuse.py`` to see the results.
+"""
+
+import time
+
+import numpy as np
+import pytest
+
+from myia.abstract import from_value
+from myia.operations import primitives as P
+from myia.pipeline import standard_pipeline, steps
+from myia.xtype import type_to_np_dtype
+
+
+def _pipeline(fuse):
+    pip = standard_pipeline
+    return pip.with_steps(
+        *[step for step in pip if fuse or step is not steps.step_fuse]
+    )
+
+
+def _traffic(mng):
+    """Count the array_maps, and the bytes they read and write."""
+    maps = [node for node in mng.all_nodes if node.is_apply(P.array_map)]
+    traffic = 0
+    for node in maps:
+        a = node.abstract
+        size = np.prod(a.xshape(), dtype=int)
+        itemsize = np.dtype(type_to_np_dtype(a.element.xtype())).itemsize
+        traffic += len(node.inputs[1:]) * size * itemsize
+    return len(maps), traffic
+
+
+def layer(x, w, b):
+    return np.tanh(x * w + b) * (1.0 - b * b)
+
+
+@pytest.mark.bench
+@pytest.mark.parametrize("size", [100, 1000])
+def test_fuse_traffic(size):
+    args = tuple(np.random.rand(size, size) for _ in range(3))
+    argspec = tuple(from_value(arg, broaden=True) for arg in args)
+
+    results = {}
+    for name, fuse in [("fused", True), ("unfused", False)]:
+        res = _pipeline(fuse)(input=layer, argspec=argspec)
+        maps, traffic = _traffic(res["resources"].opt_manager)
+        fn = res["output"]
+        start = time.perf_counter()
+        for _ in range(10):
+            out = fn(*args)
+        t = (time.perf_counter() - start) / 10
+        results[name] = (maps, traffic, t, out)
+
+    print()
+    print(f"{size}x{size} arrays, elementwise layer:")
+    for name, (maps, traffic, t, _) in results.items():
+        print(
+            f"    {name:8} {maps} array_maps, {traffic // 1024}KB moved,"
+            f" {t * 1000:8.2f} ms per call"
+        )
+    assert results["fused"][0] == 1
+    assert results["fused"][1] < results["unfused"][1]
+    assert np.allclose(results["fused"][3], results["unfused"][3])
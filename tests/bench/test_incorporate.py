@@ -0,0 +1,59 @@
+"""Benchmark the incorporate_* optimizations enabled by opt_level.
+
+Run with ``pytest --bench -s tests/bench/test_incorporate.py`` to see the
+results.
+"""
+
+import numpy as np
+import pytest
+
+from myia import value_and_grad
+from myia.pipeline import standard_pipeline
+
+from .common import argspec_of, mlp_args, time_calls
+
+
+# The MLP of common.cost, with each layer in a helper that returns a tuple,
+# which the incorporate_* optimizations can simplify.
+def linear(layer, x):
+    return x @ layer[0] + layer[1], layer[0]
+
+
+def cost(layers, x, target):
+    for layer in layers:
+        x, _ = linear(layer, x)
+        x = np.tanh(x)
+    diff = target - x
+    return np.sum(diff * diff)
+
+
+def step(layers, x, target):
+    return value_and_grad(cost)(layers, x, target)
+
+
+@pytest.mark.bench
+@pytest.mark.parametrize("depth", [4, 16])
+def test_incorporate_levels(depth):
+    args = mlp_args(depth)
+    argspec = argspec_of(args)
+
+    results = {}
+    for opt_level in [1, 2, 3]:
+        pip = standard_pipeline.configure(opt_level=opt_level)
+        res, compile_t = time_calls(
+            lambda: pip(input=step, argspec=argspec), n=1
+        )
+        nodes = len(res["resources"].opt_manager.all_nodes)
+        out, run_t = time_calls(res["output"], *args, n=10)
+        results[opt_level] = (compile_t, run_t, nodes, out)
+
+    print()
+    print(f"MLP gradient with {depth} layers, by opt_level:")
+    for opt_level, (compile_t, run_t, nodes, _) in results.items():
+        print(
+            f"    opt_level={opt_level} {compile_t * 1000:9.2f} ms to compile,"
+            f" {run_t * 1000:8.2f} ms per call, {nodes} nodes"
+        )
+    assert results[2][2] <= results[1][2]
+    assert np.allclose(results[1][3][0], results[2][3][0])
+    assert np.allclose(results[1][3][0], results[3][3][0])
@@ -0,0 +1,60 @@
+"""Benchmark GraphManager.gc while compiling a deep-MLP gradient.
+
+Run with ``pytest --bench -s tests/bench/test_manager.py`` to see the timings.
+"""
+
+import time
+
+import pytest
+
+from myia.ir import GraphManager
+from myia.pipeline import standard_pipeline, steps
+
+from .common import argspec_of, mlp_args, mlp_step
+
+
+def _reset_gc(self):
+    """GraphManager.gc before it was incremental: reset the manager."""
+    reach = set(self.roots)
+    for root in self.roots:
+        reach.update(self.graphs_reachable[root])
+    if reach != set(self.graphs):
+        self.reset()
+
+
+def _timed(gc, times):
+    def timed_gc(self):
+        start = time.perf_counter()
+        gc(self)
+        times.append(time.perf_counter() - start)
+
+    return timed_gc
+
+
+@pytest.mark.bench
+@pytest.mark.parametrize("depth", [4, 16])
+def test_gc_time(depth, monkeypatch):
+    args = mlp_args(depth)
+    argspec = argspec_of(args)
+    pip = standard_pipeline
+    pip = pip.with_steps(*pip[: pip.steps.index(steps.step_validate) + 1])
+
+    results = {}
+    for name, gc in [("incremental", GraphManager.gc), ("reset", _reset_gc)]:
+        times = []
+        monkeypatch.setattr(GraphManager, "gc", _timed(gc, times))
+        start = time.perf_counter()
+        res = pip(input=mlp_step, argspec=argspec)
+        total = time.perf_counter() - start
+        mng = res["resources"].opt_manager
+        results[name] = (sum(times), len(times), total, len(mng.all_nodes))
+
+    print()
+    print(f"MLP gradient with {depth} layers, time in GraphManager.gc:")
+    for name, (t, n, total, nodes) in results.items():
+        print(
+            f"    {name:12} {t * 1000:8.2f} ms in {n} calls,"
+            f" {total * 1000:8.2f} ms total, {nodes} nodes"
+        )
+    assert results["incremental"][3] == results["reset"][3]
+    assert results["incremental"][2] < results["reset"][2]
@@ -0,0 +1,92 @@
+"""Benchmark the memory used by IR nodes and by the compilation of models.
+
+Run with ``pytest --bench -s tests/bench/test_memory.py`` to see the results.
+"""
+
+import gc
+import importlib.util
+import os
+import tracemalloc
+
+import pytest
+
+from myia.abstract import from_value
+from myia.info import About, NamedDebugInfo
+from myia.ir import Apply, Constant, Graph
+from myia.operations import primitives as P
+from myia.pipeline import standard_pipeline, steps
+
+_examples = os.path.join(os.path.dirname(__file__), "..", "..", "examples")
+
+
+def _load_example(name):
+    spec = importlib.util.spec_from_file_location(
+        f"_example_{name}", os.path.join(_examples, f"{name}.py")
+    )
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    return mod
+
+
+def _measure(fn):
+    """Return the result of fn, and the memory it kept and its peak."""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        start, _ = tracemalloc.get_traced_memory()
+        res = fn()
+        gc.collect()
+        end, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return res, end - start, peak - start
+
+
+@pytest.mark.bench
+def test_node_size():
+    n = 10000
+    g = Graph()
+    g.debug.name = "g"
+    x = Constant(1)
+    f = Constant(P.scalar_add)
+
+    def make():
+        with About(g.debug, "bench"):
+            return [Apply([f, x, x], g) for _ in range(n)]
+
+    nodes, kept, _ = _measure(make)
+    _, kept_debug, _ = _measure(lambda: [node.debug for node in nodes])
+
+    print()
+    print(f"{kept / n:.1f} bytes per Apply node")
+    print(f"{kept_debug / n:.1f} more bytes per node once debug info is used")
+    assert all(isinstance(node.debug, NamedDebugInfo) for node in nodes)
+    assert nodes[0].debug.about.debug is g.debug
+
+
+def _mlp_inputs(mlp):
+    layers = []
+    for W, b in mlp.mlp_parameters(10, 50, 50, 1):
+        layers.append(mlp.Linear(W, b))
+        layers.append(mlp.Tanh())
+    model = mlp.Sequential(tuple(layers))
+    ((x, y),) = mlp.generate_data(1, 5, 10, 1)
+    return mlp.step.fn, (model, x, y, mlp.lr)
+
+
+@pytest.mark.bench
+@pytest.mark.parametrize("example,inputs", [("mlp", _mlp_inputs)])
+def test_compile_memory(example, inputs):
+    fn, args = inputs(_load_example(example))
+    argspec = tuple(from_value(arg, broaden=True) for arg in args)
+    pip = standard_pipeline
+    pip = pip.with_steps(*pip[: pip.steps.index(steps.step_validate) + 1])
+
+    res, kept, peak = _measure(lambda: pip(input=fn, argspec=argspec))
+    nodes = len(res["resources"].opt_manager.all_nodes)
+
+    print()
+    print(
+        f"{example}: peak {peak // 1024}KB, kept {kept // 1024}KB,"
+        f" {nodes} nodes in the final graph"
+    )
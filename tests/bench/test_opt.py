@@ -0,0 +1,118 @@
+"""Benchmark LocalPassOptimizer on a deep-MLP gradient.
+
+This measures the nodes visited by incremental passes, and the unifications
+saved by indexing the patterns in a DiscriminationTree.
+
+Run with ``pytest --bench -s tests/bench/test_opt.py`` to see the results.
+"""
+
+import copy
+import time
+
+import pytest
+
+from myia.opt import LocalPassOptimizer, PatternSubstitutionOptimization
+from myia.pipeline import standard_pipeline, steps
+from myia.pipeline.pipeline import LoopPipeline
+from myia.profile import CompileProfiler
+from myia.utils import TraceListener
+
+from .common import argspec_of, mlp_args, mlp_step
+
+
+def _full(opt):
+    opt = copy.copy(opt)
+    opt.incremental = False
+    return opt
+
+
+def _unindexed(opt):
+    opt = copy.copy(opt)
+    opt.node_map = copy.copy(opt.node_map)
+    opt.node_map.index = None
+    opt.node_map._indexed = set()
+    return opt
+
+
+def _pipeline(transform=None):
+    def swap(step):
+        if isinstance(step, LoopPipeline) and transform is not None:
+            return step.with_steps(
+                *[
+                    transform(s) if isinstance(s, LocalPassOptimizer) else s
+                    for s in step
+                ]
+            )
+        return step
+
+    pip = standard_pipeline
+    pip = pip.with_steps(*pip[: pip.steps.index(steps.step_validate) + 1])
+    return pip.with_steps(*map(swap, pip))
+
+
+@pytest.mark.bench
+@pytest.mark.parametrize("depth", [4, 16])
+def test_opt_visits(depth):
+    args = mlp_args(depth)
+    argspec = argspec_of(args)
+
+    results = {}
+    for name, transform in [("incremental", None), ("full", _full)]:
+        prof = CompileProfiler(memory=False)
+        with prof:
+            start = time.perf_counter()
+            res = _pipeline(transform)(input=mlp_step, argspec=argspec)
+            t = time.perf_counter() - start
+        (report,) = prof.reports
+        visits = sum(v["visits"] for v in report.visits.values())
+        nodes = sum(v["nodes"] for v in report.visits.values())
+        mng = res["resources"].opt_manager
+        results[name] = (t, visits, visits / nodes, len(mng.all_nodes))
+
+    print()
+    print(f"MLP gradient with {depth} layers, LocalPassOptimizer visits:")
+    for name, (t, visits, ratio, nodes) in results.items():
+        print(
+            f"    {name:12} {t * 1000:8.2f} ms, {visits} visits,"
+            f" {ratio:.2f} per node and pass, {nodes} nodes"
+        )
+    assert results["incremental"][3] == results["full"][3]
+    assert results["incremental"][1] < results["full"][1]
+
+
+class _Unifications(TraceListener):
+    """Count the calls to PatternSubstitutionOptimizations."""
+
+    def __init__(self):
+        super().__init__("opt")
+        self.count = 0
+
+    def on_enter(self, opt=None, **kwargs):
+        if isinstance(opt, PatternSubstitutionOptimization):
+            self.count += 1
+
+
+@pytest.mark.bench
+@pytest.mark.parametrize("depth", [4, 16])
+def test_pattern_index(depth):
+    args = mlp_args(depth)
+    argspec = argspec_of(args)
+
+    results = {}
+    for name, transform in [("indexed", None), ("unindexed", _unindexed)]:
+        with _Unifications() as counter:
+            start = time.perf_counter()
+            res = _pipeline(transform)(input=mlp_step, argspec=argspec)
+            t = time.perf_counter() - start
+        mng = res["resources"].opt_manager
+        results[name] = (t, counter.count, len(mng.all_nodes))
+
+    print()
+    print(f"MLP gradient with {depth} layers, pattern unifications:")
+    for name, (t, n, nodes) in results.items():
+        print(
+            f"    {name:12} {t * 1000:8.2f} ms, {n} unifications,"
+            f" {nodes} nodes"
+        )
+    assert results["indexed"][2] == results["unindexed"][2]
+    assert results["indexed"][1] < results["unindexed"][1]
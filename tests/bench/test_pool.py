@@ -0,0 +1,84 @@
+"""Benchmark the max_pool2d kernels of the Python backend.
+
+The kernels are compared to loops over the pooling regions of each image,
+as the backend used to do.
+
+Run with ``pytest --bench -s tests/bench/test_pool.py`` to see the results.
+"""
+
+import itertools
+
+import numpy as np
+import pytest
+
+from myia_backend_python import implementations as IMPL
+
+from .common import time_calls
+
+
+def _regions(x, ws, stride, pad):
+    h, w = x.shape[-2:]
+    out_h = (h + 2 * pad[0] - ws[0]) // stride[0] + 1
+    out_w = (w + 2 * pad[1] - ws[1]) // stride[1] + 1
+    for i, j in np.ndindex(out_h, out_w):
+        r0 = i * stride[0] - pad[0]
+        c0 = j * stride[1] - pad[1]
+        yield (i, j), (
+            slice(max(r0, 0), min(r0 + ws[0], h)),
+            slice(max(c0, 0), min(c0 + ws[1], w)),
+        )
+
+
+def _loop_max_pool2d(x, ws, stride, pad):
+    regions = list(_regions(x, ws, stride, pad))
+    out_h, out_w = regions[-1][0]
+    out = np.empty(x.shape[:-2] + (out_h + 1, out_w + 1), dtype=x.dtype)
+    for k in np.ndindex(*x.shape[:-2]):
+        for r, region in regions:
+            out[k + r] = np.max(x[k][region])
+    return out
+
+
+def _loop_max_pool2d_grad(x, ws, stride, pad, gz):
+    maxout = _loop_max_pool2d(x, ws, stride, pad)
+    gx = np.zeros_like(x)
+    regions = list(_regions(x, ws, stride, pad))
+    for k in np.ndindex(*x.shape[:-2]):
+        for r, (rows, cols) in regions:
+            for c in itertools.product(
+                range(rows.start, rows.stop), range(cols.start, cols.stop)
+            ):
+                if maxout[k + r] == x[k + c]:
+                    gx[k + c] += gz[k + r]
+    return gx
+
+
+# (name, input shape, window, stride, padding)
+shapes = [
+    ("lenet", (16, 6, 28, 28), (2, 2), (2, 2), (0, 0)),
+    ("resnet", (4, 64, 56, 56), (3, 3), (2, 2), (1, 1)),
+]
+
+
+@pytest.mark.bench
+@pytest.mark.parametrize("name,shape,ws,stride,pad", shapes)
+def test_max_pool2d_kernels(name, shape, ws, stride, pad):
+    x = np.random.randn(*shape).astype("float32")
+
+    def step():
+        out = IMPL.max_pool2d(x, ws, stride, pad, False)
+        return IMPL.max_pool2d_grad(x, ws, stride, pad, False, out)
+
+    def loop_step():
+        out = _loop_max_pool2d(x, ws, stride, pad)
+        return _loop_max_pool2d_grad(x, ws, stride, pad, out)
+
+    gx, t = time_calls(step)
+    ref, t_loop = time_calls(loop_step, n=1)
+
+    print()
+    print(f"{name}: max_pool2d and its gradient on {shape}")
+    print(f"    loops          {t_loop * 1000:10.2f} ms")
+    print(f"    windows        {t * 1000:10.2f} ms")
+    assert np.allclose(gx, ref)
+    assert t < t_loop
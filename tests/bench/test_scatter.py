@@ -0,0 +1,72 @@
+"""Benchmark the embedding gradient kernels of the CPU backends.
+
+``take_grad_inp`` sums the rows of an embedding-bag style gradient into
+the rows of the embedding table. The kernels are compared to a loop over
+the rows of the table, as the backends used to do.
+
+Run with ``pytest --bench -s tests/bench/test_scatter.py`` to see the results.
+"""
+
+import numpy as np
+import pytest
+
+from myia_backend_python import implementations as IMPL
+
+from .common import time_calls
+
+vocab = 50_000
+dim = 256
+bags = 32
+bag_size = 16
+
+
+def _loop_take_grad_inp(nb_indices, indices, values):
+    row_size = values.shape[-1]
+    broadcastable_indices = indices.reshape(tuple(indices.shape) + (1,))
+    output = np.zeros((nb_indices, row_size), dtype=values.dtype)
+    for i in range(nb_indices):
+        output[i] = (
+            ((broadcastable_indices == i) * values)
+            .reshape((-1, row_size))
+            .sum(axis=0)
+        )
+    return output
+
+
+def _inputs():
+    indices = np.random.randint(vocab, size=(bags, bag_size))
+    values = np.random.randn(bags, bag_size, dim).astype("float32")
+    return indices, values
+
+
+@pytest.mark.bench
+def test_take_grad_inp_python():
+    indices, values = _inputs()
+    res, t = time_calls(IMPL.take_grad_inp, vocab, indices, values)
+    ref, t_loop = time_calls(_loop_take_grad_inp, vocab, indices, values, n=1)
+
+    print()
+    print(f"take_grad_inp: {bags}x{bag_size} rows of a {vocab}x{dim} table")
+    print(f"    loop           {t_loop * 1000:10.2f} ms")
+    print(f"    np.add.at      {t * 1000:10.2f} ms")
+    assert np.allclose(res, ref, atol=1e-5)
+    assert t < t_loop
+
+
+@pytest.mark.bench
+def test_take_grad_inp_pytorch():
+    torch = pytest.importorskip("torch")
+    from myia_backend_pytorch.pytorch import pytorch_take_grad_inp
+
+    indices, values = _inputs()
+    indices_t = torch.from_numpy(indices)
+    values_t = torch.from_numpy(values)
+    res, t = time_calls(pytorch_take_grad_inp, vocab, indices_t, values_t)
+    ref, t_loop = time_calls(_loop_take_grad_inp, vocab, indices, values, n=1)
+
+    print()
+    print(f"take_grad_inp: {bags}x{bag_size} rows of a {vocab}x{dim} table")
+    print(f"    loop (numpy)   {t_loop * 1000:10.2f} ms")
+    print(f"    index_add_     {t * 1000:10.2f} ms")
+    assert np.allclose(res.numpy(), ref, atol=1e-5)
+    assert t < t_loop
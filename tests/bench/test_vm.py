@@ -0,0 +1,139 @@
+"""Benchmark FinalVM, which runs the pytorch backend.
+
+Run with ``pytest --bench -s tests/bench/test_vm.py`` to see the results.
+"""
+
+import pytest
+
+from myia import myia
+from myia.compile.transform import CompileGraph
+from myia.compile.vm import FinalVM, VMFrame, struct_partial
+
+from .common import mlp_args, mlp_step, time_calls
+
+pytest.importorskip("myia_backend_pytorch")
+
+
+def _getattr_eval(self, args):
+    """Main loop of FinalVM before instructions were pre-decoded."""
+    frame = VMFrame(self.backend, args)
+    while frame.pc >= 0:
+        instr = self.code[frame.pc]
+        impl = getattr(frame, f"inst_{instr[0]}", None)
+        if impl is None:
+            raise AssertionError(f"Unknown instruction {instr[0]}")
+        frame.pc += 1
+        impl(*instr[1:])
+    assert frame.sp == 1, frame.sp
+    return frame.stack[0]
+
+
+def fib(n):
+    if n < 2:
+        return n
+    else:
+        return fib(n - 1) + fib(n - 2)
+
+
+def count_loop(n):
+    total = 0
+    i = 0
+    while i < n:
+        if i % 3 == 0:
+            total = total + i
+        i = i + 1
+    return total
+
+
+@pytest.mark.bench
+@pytest.mark.parametrize(
+    "fn,args,expected",
+    [(fib, (15,), 610), (count_loop, (1000,), 166833)],
+    ids=["recursive", "loop"],
+)
+def test_vm_loop(fn, args, expected, monkeypatch):
+    f = myia(fn, backend="pytorch")
+    assert f(*args) == expected
+
+    _, t_threaded = time_calls(f, *args, n=5, warmup=True)
+    with monkeypatch.context() as m:
+        m.setattr(FinalVM, "eval", _getattr_eval)
+        assert f(*args) == expected
+        _, t_getattr = time_calls(f, *args, n=5, warmup=True)
+
+    print()
+    print(f"{fn.__name__}{args}, time per call:")
+    print(f"    pre-decoded:       {t_threaded * 1e3:8.2f} ms")
+    print(f"    getattr dispatch:  {t_getattr * 1e3:8.2f} ms")
+
+
+def _value_bytes(v, seen):
+    if id(v) in seen:
+        return 0
+    seen.add(id(v))
+    if isinstance(v, tuple):
+        return sum(_value_bytes(x, seen) for x in v)
+    elif isinstance(v, struct_partial):
+        return _value_bytes(v.args, seen)
+    elif hasattr(v, "element_size"):
+        return v.element_size() * v.nelement()
+    else:
+        return 0
+
+
+def _peak_eval(peaks):
+    """Main loop of FinalVM that records the peak size of its stack."""
+
+    def eval(self, args):
+        frame = VMFrame(self.backend, args)
+        threaded = self.threaded
+        peak = 0
+        while frame.pc >= 0:
+            impl, instr_args = threaded[frame.pc]
+            frame.pc += 1
+            impl(frame, *instr_args)
+            peak = max(peak, _value_bytes(frame.stack, set()))
+        peaks.append(peak)
+        assert frame.sp == 1, frame.sp
+        return frame.stack[0]
+
+    return eval
+
+
+@pytest.mark.bench
+@pytest.mark.parametrize("depth", [4, 16])
+def test_vm_peak_memory(depth, monkeypatch):
+    args = mlp_args(depth, size=256, batch=64, dtype="float32")
+
+    results = {}
+    for release in (True, False):
+        peaks = []
+        with monkeypatch.context() as m:
+            m.setattr(CompileGraph, "release_values", release)
+            m.setattr(FinalVM, "eval", _peak_eval(peaks))
+            f = myia(mlp_step, backend="pytorch")
+            f(*args)
+        results[release] = max(peaks)
+
+    print()
+    print(f"MLP training step with {depth} layers, peak VM stack size:")
+    print(f"    released after last use: {results[True] // 1024:8} KB")
+    print(f"    kept until return:       {results[False] // 1024:8} KB")
+    assert results[True] < results[False]
+
+
+@pytest.mark.bench
+@pytest.mark.parametrize("depth", [4, 16])
+def test_vm_fused_segments(depth):
+    args = mlp_args(depth, size=16, batch=4, dtype="float32")
+
+    results = {}
+    for fuse in (True, False):
+        f = myia(mlp_step, backend="pytorch", backend_options={"fuse": fuse})
+        _, results[fuse] = time_calls(f, *args, n=20, warmup=True)
+
+    print()
+    print(f"MLP training step with {depth} small layers, time per call:")
+    print(f"    one call per segment:    {results[True] * 1e3:8.2f} ms")
+    print(f"    one call per operation:  {results[False] * 1e3:8.2f} ms")
+    assert results[True] < results[False]
@@ -0,0 +1,147 @@
+import operator
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from myia.compile.transform import CompileGraph, nonlinear_ops
+from myia.compile.vm import FinalVM, VMFrame
+from myia.ir import Graph
+from myia.operations import primitives as P
+
+
+class _ScalarBackend:
+    def to_scalar(self, v):
+        return v
+
+    def to_backend_value(self, v, t):
+        return v
+
+    def from_scalar(self, v, t):
+        return v
+
+
+def _sub_code():
+    """Code for main(a, b) = sub(a, b), where sub is a separate function."""
+    return [
+        ("pad_stack", 3),
+        ("push", 6),
+        ("dup", -3),
+        ("dup", -3),
+        ("call", -3),
+        ("return", -1, 4),
+        # sub(x, y) = x - y
+        ("pad_stack", 1),
+        ("external", operator.sub, [-1, -2]),
+        ("return", -1, 3),
+    ]
+
+
+def test_vm_fused_dups_call():
+    vm = FinalVM(_sub_code(), _ScalarBackend())
+    assert vm.threaded[2][0] is VMFrame._fused_dups_call
+    assert vm(10, 3) == 7
+    assert vm(1, 5) == -4
+
+
+def test_vm_fused_dups():
+    code = [
+        ("pad_stack", 3),
+        ("dup", -1),
+        ("dup", -3),
+        ("tuple", -1, -2),
+        ("return", -1, 5),
+    ]
+    vm = FinalVM(code, _ScalarBackend())
+    assert vm.threaded[1][0] is VMFrame._fused_dups
+    assert vm(1, 2) == (2, 1)
+
+
+def test_vm_unknown_instruction():
+    vm = FinalVM([("pad_stack", 1), ("frobnicate",)], _ScalarBackend())
+    with pytest.raises(AssertionError, match="Unknown instruction"):
+        vm()
+
+
+def test_vm_reentrant():
+    # The external function calls the VM again, while it is running
+    def external(x, y):
+        return vm(x - 1, y) + 1 if x > 0 else y
+
+    code = [
+        ("pad_stack", 1),
+        ("external", external, [-1, -2]),
+        ("return", -1, 3),
+    ]
+    vm = FinalVM(code, _ScalarBackend())
+    assert vm(5, 10) == 15
+
+
+def test_vm_threads():
+    def sub(x, y):
+        # Give other threads a chance to run in the middle of the program
+        time.sleep(0)
+        return x - y
+
+    code = _sub_code()
+    code[7] = ("external", sub, [-1, -2])
+    vm = FinalVM(code, _ScalarBackend())
+    args = [(i, 2 * i) for i in range(1000)]
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        results = list(pool.map(lambda a: vm(*a), args))
+    assert results == [a - b for a, b in args]
+
+
+_scalar_impls = {P.scalar_mul: operator.mul, P.scalar_add: operator.add}
+
+
+def _lin_convert(split):
+    (node,) = split
+    return _scalar_impls[node.inputs[0].value], node.inputs[1:], [node]
+
+
+def _mul_add_graph():
+    """Graph for f(x, y) = x * y + x."""
+    g = Graph()
+    x = g.add_parameter()
+    y = g.add_parameter()
+    g.output = g.apply(P.scalar_add, g.apply(P.scalar_mul, x, y), x)
+    return g
+
+
+def test_compile_graph_release(monkeypatch):
+    backend = _ScalarBackend()
+    cg = CompileGraph(_lin_convert, nonlinear_ops, backend)
+    code = cg.run(_mul_add_graph())
+    # y is dropped after x * y, x and x * y after the addition
+    assert [instr for instr in code if instr[0] == "clear"] == [
+        ("clear", -3),
+        ("clear", -3, -2),
+    ]
+    assert FinalVM(code, backend)(2, 3) == 8
+
+    monkeypatch.setattr(CompileGraph, "release_values", False)
+    code = cg.run(_mul_add_graph())
+    assert not [instr for instr in code if instr[0] == "clear"]
+    assert FinalVM(code, backend)(2, 3) == 8
+
+
+def test_compile_graph_fuse():
+    backend = _ScalarBackend()
+    g = _mul_add_graph()
+    add = g.output
+    mul = add.inputs[1]
+
+    cg = CompileGraph(_lin_convert, nonlinear_ops, backend)
+    assert cg.split(g)[:2] == [[mul], [add]]
+
+    def _fused_lin_convert(split):
+        assert split == [mul, add]
+        x, y = mul.inputs[1:]
+        return (lambda x, y: x * y + x), [x, y], [add]
+
+    cg = CompileGraph(_fused_lin_convert, nonlinear_ops, backend, fuse=True)
+    assert cg.split(g)[:2] == [[mul, add], g.return_]
+    code = cg.run(g)
+    assert len([instr for instr in code if instr[0] == "external"]) == 1
+    assert FinalVM(code, backend)(2, 3) == 8
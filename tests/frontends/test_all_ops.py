@@ -730,6 +730,11 @@ def test_torch_max_pool2d_pad1_big_stride(x, ri):
     return torch.nn.functional.max_pool2d(x, (2, 2), (1, 3), 1, 1, False, ri)
 
 
+@fwd_and_bwd(nn.Parameter(torch.randn(2, 4, 5, 7)))
+def test_torch_max_pool2d_ceil_mode(x):
+    return torch.nn.functional.max_pool2d(x, (2, 3), (2, 2), 1, 1, True)
+
+
 @fwd_and_bwd(nn.Parameter(torch.Tensor(MA(2, 3))))
 def test_torch_mean(x):
     return torch.mean(x)
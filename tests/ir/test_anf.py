@@ -1,6 +1,7 @@
 import pytest
 
 from myia.abstract import AbstractFunctionUnique
+from myia.info import About, DebugInherit, NamedDebugInfo
 from myia.ir.anf import PARAMETER, Apply, Constant, Graph, Parameter
 from myia.operations import primitives as primops
 
@@ -76,6 +77,35 @@ def test_graph_output():
     assert g.return_.inputs[1] is two
 
 
+def test_slots():
+    node = Apply([Constant(0)], Graph())
+    assert not hasattr(node, "__dict__")
+    with pytest.raises(AttributeError):
+        node.foo = 1
+
+
+def test_lazy_debug():
+    g = Graph()
+    with About(g.debug, "copy"):
+        node = Apply([], g)
+    dbg = node.debug
+    assert isinstance(dbg, NamedDebugInfo)
+    assert dbg.obj is node
+    assert dbg.about.debug is g.debug
+    assert dbg.about.relation == "copy"
+    assert node.debug is dbg
+
+    node2 = Constant(0)
+    assert node2.debug.about is None
+
+    with DebugInherit(save_trace=True):
+        node3 = Parameter(g)
+    assert node3.debug.trace is not None
+
+    node.debug = NamedDebugInfo(node, name="new")
+    assert node.debug.name == "new"
+
+
 def test_str_coverage():
     """Just a coverage test for __str__ and __repr__
 
@@ -84,7 +114,7 @@ def test_str_coverage():
     """
     g = Graph()
     p = Parameter(g)
-    p.name = "param"
+    p.debug.name = "param"
     objects = [g, Apply([], g), p, Parameter(g), Constant(0), Constant(g)]
     for o in objects:
         str(o)
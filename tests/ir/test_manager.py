@@ -825,6 +825,48 @@ def test_keep_roots_recursion():
     assert len(mng.graphs) == 1
 
 
+def test_gc_recursion():
+    def nonrec():
+        return 123
+
+    def rec1(x):
+        def inner():
+            return rec2(x)
+
+        return inner()
+
+    def rec2(x):
+        return rec1(x)
+
+    @clone
+    @parse
+    def f(x, y):
+        return rec1(x) + nonrec()
+
+    mng = manage(f)
+    events = mng.events
+    assert len(mng.graphs) == 5
+
+    mng.replace(f.output, f.parameters[0])
+    assert len(mng.graphs) == 4
+
+    mng.gc()
+    # The manager is not reset
+    assert mng.events is events
+    assert mng.graphs == OrderedSet([f])
+    assert set(mng.nodes) == {None, f}
+    assert all(node.graph in (None, f) for node in mng.all_nodes)
+    assert all(
+        not ct.is_constant_graph() for ct in mng.all_nodes if ct.is_constant()
+    )
+    _check_uses(mng)
+    assert not mng.free_variables_total[f]
+    assert not mng.graphs_used[f]
+
+    fresh = GraphManager(f, manage=False)
+    assert mng.all_nodes == fresh.all_nodes
+
+
 def test_add_parameter():
     @parse
     def f(x, y):
@@ -1,5 +1,8 @@
+from types import SimpleNamespace
+
 import pytest
 
+from myia.ir import manage
 from myia.operations import (
     array_map,
     array_reduce,
@@ -21,11 +24,11 @@ from myia.operations import (
     transpose,
     tuple_setitem,
 )
-from myia.opt import lib
+from myia.opt import LocalPassOptimizer, lib
 from myia.testing.common import af64_of, f64, i64, to_abstract_test
 from myia.utils import newenv
 
-from .test_opt import _check_opt
+from .test_opt import _check_opt, specialize
 
 #######################
 # Tuple optimizations #
@@ -434,6 +437,46 @@ def test_unfuse_composite_constant():
     _check_opt(before, after, lib.unfuse_composite)
 
 
+def test_fuse_array_map():
+    def before(xs, ys, zs):
+        return array_map(scalar_add, array_map(scalar_mul, xs, ys), zs)
+
+    def after(xs, ys, zs):
+        def f(x, y, z):
+            return scalar_add(scalar_mul(x, y), z)
+
+        return array_map(f, xs, ys, zs)
+
+    arr_t = af64_of(3, 5)
+    _check_opt(before, after, lib.fuse_array_map, argspec=[arr_t, arr_t, arr_t])
+
+
+def test_fuse_array_map_chain():
+    def before(xs, ys):
+        a = array_map(scalar_mul, xs, ys)
+        b = array_map(scalar_usub, a)
+        return array_map(scalar_add, b, a)
+
+    def after(xs, ys):
+        def f(x, y):
+            a = scalar_mul(x, y)
+            return scalar_add(scalar_usub(a), a)
+
+        return array_map(f, xs, ys)
+
+    arr_t = af64_of(3, 5)
+    _check_opt(before, after, lib.fuse_array_map, argspec=[arr_t, arr_t])
+
+
+def test_fuse_array_map_shared():
+    def before(xs, ys):
+        a = array_map(scalar_mul, xs, ys)
+        return array_map(scalar_add, a, ys), a
+
+    arr_t = af64_of(3, 5)
+    _check_opt(before, before, lib.fuse_array_map, argspec=[arr_t, arr_t])
+
+
 ######################
 # Branch elimination #
 ######################
@@ -909,6 +952,33 @@ def test_incorporate_getitem():
     )
 
 
+def test_incorporate_getitem_budget():
+    def before(x, y):
+        def b_help(x, y):
+            return x * y, x + y
+
+        return b_help(x, y)[0]
+
+    argspec = [to_abstract_test(f64), to_abstract_test(f64)]
+    opt = LocalPassOptimizer(lib.incorporate_getitem, opt_level=2)
+
+    def changes(opt_level, budget):
+        g = specialize(input=before, argspec=argspec)["graph"]
+        resources = SimpleNamespace(
+            opt_manager=manage(g),
+            opt_level=opt_level,
+            live_inferrer=None,
+            incorporation_budget=budget,
+        )
+        return opt(graph=g, resources=resources)["changes"]
+
+    assert not changes(1, lib.IncorporationBudget())
+    assert changes(2, lib.IncorporationBudget())
+    assert not changes(2, lib.IncorporationBudget(max_graph_size=3))
+    assert not changes(2, lib.IncorporationBudget(max_growth=0))
+    assert changes(3, lib.IncorporationBudget(max_graph_size=3))
+
+
 def test_incorporate_getitem_2():
     def before(x, y):
         def b_help(x, y):
@@ -1097,6 +1167,40 @@ def test_incorporate_call_through_switch():
     )
 
 
+def test_incorporate_call_through_switch_budget():
+    def before(x, y, z):
+        def f1(y):
+            def g1(z):
+                return y * z
+
+            return g1
+
+        def f2(y):
+            def g2(z):
+                return y + z
+
+            return g2
+
+        return switch(x < 0, f1, f2)(y)(z)
+
+    argspec = [to_abstract_test(f64)] * 3
+    opt = LocalPassOptimizer(lib.incorporate_call_through_switch)
+
+    def changes(opt_level):
+        g = specialize(input=before, argspec=argspec)["graph"]
+        resources = SimpleNamespace(
+            opt_manager=manage(g),
+            opt_level=opt_level,
+            live_inferrer=None,
+            incorporation_budget=lib.IncorporationBudget(max_growth=0),
+        )
+        return opt(graph=g, resources=resources)["changes"]
+
+    # Not budgeted, so level 2 does at least what level 1 does
+    assert changes(1)
+    assert changes(2)
+
+
 ########
 # Misc #
 ########
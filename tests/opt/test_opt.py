@@ -1,17 +1,30 @@
+import gc
+import weakref
+
 import pytest
 
 from myia import operations
-from myia.ir import Constant, GraphCloner, isomorphic, sexp_to_graph
+from myia.ir import (
+    Constant,
+    Graph,
+    GraphCloner,
+    isomorphic,
+    manage,
+    sexp_to_graph,
+    sexp_to_node,
+)
 from myia.operations import Primitive, primitives as prim
 from myia.opt import (
+    DiscriminationTree,
     LocalPassOptimizer,
+    NodeMap,
     PatternSubstitutionOptimization as psub,
     cse,
     pattern_replacer,
 )
 from myia.pipeline import scalar_pipeline, steps
 from myia.testing.common import i64, to_abstract_test
-from myia.utils import InferenceError, Merge
+from myia.utils import InferenceError, Merge, TraceListener
 from myia.utils.unify import Var, var
 from myia.validate import ValidationError
 
@@ -125,6 +138,102 @@ def test_elim():
     _check_opt(before, after, elim_R)
 
 
+def test_discrimination_tree():
+    opts = [idempotent_P, elim_R, Q0_to_R, opt_ok1, opt_ok2]
+    tree = DiscriminationTree()
+    for opt in opts:
+        tree.add(opt)
+
+    def match(sexp):
+        return tree.match(sexp_to_node(sexp, Graph()))
+
+    assert match((P, (P, 1))) == {idempotent_P}
+    assert match((P, 1)) == set()
+    assert match((P, (P, 1, 2))) == set()
+    assert match((R, (P, 1))) == {elim_R}
+    assert match((Q, 0)) == {Q0_to_R}
+    assert match((Q, 1)) == set()
+    assert match((prim.scalar_add, (P, 1), 2)) == {opt_ok1}
+    assert match(prim.scalar_usub) == {opt_ok2}
+    assert match(prim.scalar_uadd) == set()
+
+    node = sexp_to_node((P, (P, 1)), Graph())
+    nmap = NodeMap()
+    full = NodeMap(index=False)
+    for opt in opts:
+        nmap.register(opt.interest, opt)
+        full.register(opt.interest, opt)
+    assert nmap.get(node) == [idempotent_P]
+    assert full.get(node) == [opt_ok2, idempotent_P]
+
+
+class _Visits(TraceListener):
+    def __init__(self):
+        super().__init__()
+        self.passes = []
+
+    def on_visits(self, incremental=None, visits=None, nodes=None, **kwargs):
+        self.passes.append((incremental, visits, nodes))
+
+
+def test_incremental_pass():
+    def before(x, y):
+        a = x * y
+        b = a * x
+        return b * R(y)
+
+    def after(x, y):
+        a = x * y
+        b = a * x
+        return b * y
+
+    g = parse(before)
+    mng = manage(g)
+    opt = LocalPassOptimizer(elim_R)
+    with _Visits() as v:
+        assert opt(g)["changes"]
+        assert not opt(g)["changes"]
+    assert [incr for incr, _, _ in v.passes] == [False, True]
+    assert isomorphic(g, parse(after))
+
+    # Only the new node and its users are visited
+    mng.set_edge(g.return_, 1, g.apply(R, g.output))
+    with _Visits() as v:
+        assert opt(g)["changes"]
+    ((incr, visits, nodes),) = v.passes
+    assert incr
+    assert visits < nodes
+    assert isomorphic(g, parse(after))
+
+    # Non-incremental optimizers always do a full pass
+    opt = LocalPassOptimizer(elim_R, incremental=False)
+    with _Visits() as v:
+        assert not opt(g)["changes"]
+        assert not opt(g)["changes"]
+    assert [incr for incr, _, _ in v.passes] == [False, False]
+
+    # A reset invalidates the region
+    opt = LocalPassOptimizer(elim_R)
+    opt(g)
+    mng.reset()
+    with _Visits() as v:
+        assert not opt(g)["changes"]
+    assert [incr for incr, _, _ in v.passes] == [False]
+
+
+def test_incremental_pass_releases_manager():
+    def f(x):
+        return R(x)
+
+    g = parse(f)
+    ref = weakref.ref(manage(g))
+    opt = LocalPassOptimizer(elim_R)
+    assert opt(g)["changes"]
+    del g
+    gc.collect()
+    assert ref() is None
+
+
 def _idempotent_after(x):
     return P(x)
 
@@ -299,6 +408,18 @@ def test_cse():
     helper(f2, 12, 8)
 
 
+def test_cse_releases_manager():
+    def f(x, y):
+        return (x + y) * (x + y)
+
+    g = parse(f)
+    ref = weakref.ref(g.manager)
+    cse(g, g.manager)
+    del g
+    gc.collect()
+    assert ref() is None
+
+
 opt_ok1 = psub((prim.scalar_add, X, Y), (prim.scalar_mul, X, Y), name="opt_ok1")
 
 
@@ -38,6 +38,7 @@ from myia.abstract import (
     amerge,
     annotation_merge,
     broaden,
+    broaden_dims,
     build_value,
     empty,
     find_coherent_result_sync,
@@ -55,6 +56,7 @@ from myia.testing.common import (
     Ty,
     U,
     af32_of,
+    af64_of,
     f32,
     i16,
     i32,
@@ -356,6 +358,19 @@ def test_broaden_recursive():
     assert broaden(tb) is tb
 
 
+def test_broaden_dims():
+    a = af64_of(2, 3, 4)
+    assert broaden_dims(a, dims={0}) == af64_of(ANYTHING, 3, 4)
+    assert broaden_dims(a, dims={-1}) == af64_of(2, 3, ANYTHING)
+    assert broaden_dims(a, dims={0, 2}) == af64_of(ANYTHING, 3, ANYTHING)
+    assert broaden_dims(a, dims={5}) == a
+
+    t = T([a, f32, af32_of(7)])
+    assert broaden_dims(t, dims={0}) == T(
+        [af64_of(ANYTHING, 3, 4), f32, af32_of(ANYTHING)]
+    )
+
+
 def test_find_coherent_result_sync():
     def fn(x):
         if x == 0:
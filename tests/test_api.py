@@ -1,6 +1,9 @@
+from concurrent.futures import ThreadPoolExecutor
+
 import numpy as np
 import pytest
 
+from myia.abstract import ndarray_aliasable
 from myia.abstract.data import AbstractRandomState
 from myia.api import myia, to_device
 from myia.compile import closure_convert
@@ -10,7 +13,12 @@ from myia.pipeline import (
     scalar_debug_compile as compile,
     scalar_parse as parse,
 )
-from myia.simplify_types import from_canonical, to_canonical
+from myia.simplify_types import (
+    from_canonical,
+    make_from_canonical,
+    make_to_canonical,
+    to_canonical,
+)
 from myia.testing.common import (
     D,
     Point,
@@ -24,7 +32,14 @@ from myia.testing.common import (
     to_abstract_test,
 )
 from myia.testing.multitest import bt
-from myia.utils import DoTrace, HandleInstance, InferenceError, TaggedValue
+from myia.utils import (
+    DoTrace,
+    HandleInstance,
+    InferenceError,
+    MyiaInputTypeError,
+    MyiaShapeError,
+    TaggedValue,
+)
 from myia.utils.misc import RandomStateWrapper
 from myia.xtype import Bool
 
@@ -67,6 +82,270 @@ def test_myia_specialize_values(backend):
     assert ft is not ff
 
 
+@bt()
+def test_myia_fast_dispatch(backend):
+    @myia(backend=backend)
+    def f(x, y):
+        return x + y
+
+    assert f(1, 2) == 3
+    assert f(3, 4) == 7
+    assert f(1.5, 2.0) == 3.5
+    assert (f(np.ones((2,)), np.ones((2,))) == 2).all()
+    assert (f(np.ones((3,)), np.ones((3,))) == 2).all()
+    assert f((1, 2), (3,)) == (1, 2, 3)
+    assert f(Point(1, 2), Point(3, 4)) == Point(4, 6)
+    assert len(f._fast) == 6
+    assert len(f._cache) == 6
+
+    # Same types as before do not add new entries
+    assert f(10, 20) == 30
+    assert (f(np.zeros((3,)), np.ones((3,))) == 1).all()
+    assert len(f._fast) == 6
+
+    assert f._dispatch_key((1,)) is None
+    assert f._dispatch_key((1, object())) is None
+
+
+@bt()
+def test_myia_fast_dispatch_aliasing(backend):
+    @myia(backend=backend, alias_tracker=ndarray_aliasable)
+    def f(x, y):
+        return x + y
+
+    a = np.ones((2,))
+    b = np.ones((2,))
+    assert f._dispatch_key((a, a)) != f._dispatch_key((a, b))
+    assert f._dispatch_key((a, b)) == f._dispatch_key((b, a))
+    assert (f(a, a) == 2).all()
+    assert (f(a, b) == 2).all()
+    assert len(f._cache) == 2
+
+
+@bt()
+def test_myia_fast_dispatch_specialize_values(backend):
+    @myia(backend=backend, specialize_values=["c"])
+    def f(c, x):
+        return x if c else -x
+
+    assert f._dispatch_key((True, 1)) != f._dispatch_key((False, 1))
+    assert f._dispatch_key(((1,), 1)) is None
+    assert f(True, 3) == 3
+    assert f(False, 3) == -3
+    assert f(True, 4) == 4
+    assert len(f._cache) == 2
+
+
+@bt()
+def test_myia_dynamic_dims(backend):
+    @myia(backend=backend, dynamic_dims={"x": [0]})
+    def f(x, y):
+        return x * y
+
+    for n in (1, 5, 5, 3):
+        assert (f(np.ones((n, 2)), np.ones((2,))) == 1).all()
+    assert len(f._cache) == 1
+    assert f.stats["misses"] == 1
+    assert f.stats["recompilations_avoided"] == 2
+
+    # y is not dynamic, so a different shape for y is a new specialization
+    assert (f(np.ones((2, 3)), np.ones((3,))) == 1).all()
+    assert f.stats["misses"] == 2
+
+    with pytest.raises(MyiaInputTypeError):
+        f.latest(np.ones((4, 3)), np.ones((2,)))
+
+
+def test_myia_dynamic_dims_unknown():
+    def f(x, y):
+        return x * y
+
+    with pytest.raises(RuntimeError):
+        myia(f, dynamic_dims={"z": [0]})
+
+
+@bt()
+def test_myia_batched(backend):
+    @myia(backend=backend, batched=["x"])
+    def f(W, x, b):
+        y = x @ W + b
+        return y, np.sum(y * y)
+
+    W = np.random.randn(3, 4)
+    b = np.random.randn(4)
+    xs = np.random.randn(5, 2, 3)
+    ys, sums = f(W, xs, b)
+    assert ys.shape == (5, 2, 4)
+    assert sums.shape == (5,)
+    for x, y, s in zip(xs, ys, sums):
+        expected = x @ W + b
+        assert np.allclose(y, expected)
+        assert np.allclose(s, np.sum(expected * expected))
+    assert f.stats["misses"] == 1
+
+    # Both operands of the product are batched
+    @myia(backend=backend, batched=["x", "W"])
+    def g(W, x):
+        return x @ W
+
+    Ws = np.random.randn(5, 3, 4)
+    assert np.allclose(g(Ws, xs), np.stack([x @ W for x, W in zip(xs, Ws)]))
+
+    with pytest.raises(MyiaShapeError, match="same leading dimension"):
+        g(Ws, np.random.randn(6, 2, 3))
+
+
+def test_myia_batched_unknown_argument():
+    def f(W, x):
+        return x @ W
+
+    with pytest.raises(RuntimeError, match="'X'"):
+        myia(f, batched=["x", "X"])
+
+    def g(*xs):
+        return xs
+
+    with pytest.raises(RuntimeError, match="'xs'"):
+        myia(g, batched=["xs"])
+
+
+@bt()
+@pytest.mark.parametrize("opt_level", [1, 2, 3])
+def test_myia_opt_level(backend, opt_level):
+    def helper(x, y):
+        return x * y, x + y
+
+    @myia(backend=backend, opt_level=opt_level)
+    def f(x, y):
+        a, b = helper(x, y)
+        return a - b
+
+    assert f(3.0, 4.0) == 5.0
+
+
+@bt()
+def test_myia_specialization_lru(backend):
+    @myia(backend=backend, max_specializations=2)
+    def f(x):
+        return x
+
+    assert f(1) == 1
+    assert f(1.5) == 1.5
+    assert f(2) == 2
+    assert f((1,)) == (1,)
+    assert len(f._cache) == 2
+    assert len(f._fast) == 2
+    info = f.cache_info()
+    assert info["entries"] == 2
+    assert info["bytes"] > 0
+    assert info["hits"] == 1
+    assert info["misses"] == 3
+    assert info["evictions"] == 1
+
+    # The float specialization was the least recently used
+    assert f(2.5) == 2.5
+    assert f.cache_info()["misses"] == 4
+    assert f(3) == 3
+    assert f.cache_info()["misses"] == 5
+
+
+@bt()
+def test_myia_specialization_max_bytes(backend):
+    @myia(backend=backend, max_specialization_bytes=1, keep_resources=False)
+    def f(x):
+        return x
+
+    assert f(1) == 1
+    assert f(1.5) == 1.5
+    assert f.cache_info()["entries"] == 1
+    assert f.cache_info()["evictions"] == 1
+    (results,) = f._cache.values()
+    assert list(results) == ["output"]
+
+
+@bt()
+def test_myia_specialization_bytes_stripped(backend):
+    def f(x, y):
+        return x * y + x
+
+    def nbytes(keep_resources):
+        g = myia(f, backend=backend, keep_resources=keep_resources)
+        g(1, 2)
+        return g.cache_info()["bytes"]
+
+    assert 0 < nbytes(False) < nbytes(True)
+
+
+@bt()
+def test_myia_precompile(backend):
+    @myia(backend=backend)
+    def f(x, y):
+        return x + y
+
+    a = np.ones((2,))
+    fns = f.precompile([(1, 2), (1.0, 2.0), (a, a), (3, 4)], workers=2)
+    assert len(f._cache) == 3
+    assert f.stats["misses"] == 3
+    assert fns[0] is fns[3]
+    assert fns[0](1, 2) == 3
+    assert (fns[2](a, a) == 2).all()
+    assert f(1.5, 2.5) == 4.0
+    assert f.stats["misses"] == 3
+
+    with pytest.raises(InferenceError):
+        f.precompile([(1, 2), ((1,), 2), (2.0, 2.0)], workers=2)
+
+
+def test_myia_precompile_evicted():
+    @myia(backend="python", max_specializations=2)
+    def f(x, y):
+        return x + y
+
+    a = np.ones((2,))
+    fns = f.precompile([(1, 2), (1.0, 2.0), (a, a)], workers=2)
+    # The first specialization is evicted, but not compiled again
+    assert f.stats["misses"] == 3
+    assert len(f._cache) == 2
+    assert fns[0](1, 2) == 3
+    assert fns[1](1.0, 2.0) == 3.0
+
+
+def test_myia_precompile_threads():
+    @myia(backend="python")
+    def f(x, y):
+        return x + y
+
+    @myia(backend="python")
+    def g(x, y):
+        return x * y
+
+    def precompile(fn):
+        return fn.precompile([(1, 2), (1.0, 2.0), (3, 4)], workers=2)
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        ffns, gfns = pool.map(precompile, [f, g])
+    assert ffns[1](1.0, 2.0) == 3.0
+    assert gfns[1](1.0, 2.0) == 2.0
+
+
+@bt()
+def test_myia_threads(backend):
+    @myia(backend=backend)
+    def f(x, n):
+        while n > 0:
+            x = x * 2 + 1
+            n = n - 1
+        return x
+
+    args = [(np.full((3,), float(i)), i % 7) for i in range(200)]
+    expected = [x * 2 ** n + (2 ** n - 1) for x, n in args]
+    f(*args[0])
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        results = list(pool.map(lambda a: f(*a), args))
+    for res, exp in zip(results, expected):
+        assert (res == exp).all()
+
+
 @bt()
 def test_myia_struct_arg(backend):
     @myia(backend=backend)
@@ -105,7 +384,12 @@ def test_random_state_to_canonical():
         to_canonical(None, ars)
 
 
-def test_to_canonical():
+@pytest.mark.parametrize(
+    "to_canonical",
+    [to_canonical, lambda data, typ: make_to_canonical(typ)(data)],
+    ids=["dispatch", "specialized"],
+)
+def test_to_canonical(to_canonical):
     def _convert(data, typ):
         return to_canonical(data, to_abstract_test(typ))
 
@@ -196,7 +480,12 @@ def test_to_canonical():
         _convert(v, f64)
 
 
-def test_from_canonical():
+@pytest.mark.parametrize(
+    "from_canonical",
+    [from_canonical, lambda data, typ: make_from_canonical(typ)(data)],
+    ids=["dispatch", "specialized"],
+)
+def test_from_canonical(from_canonical):
     def _convert(data, typ):
         return from_canonical(data, to_abstract_test(typ))
 
@@ -216,6 +505,12 @@ def test_from_canonical():
         pt,
     )
 
+    # Dict and list conversion
+
+    assert _convert((1, 2.0), D(x=i64, y=f64)) == {"x": 1, "y": 2.0}
+    li = to_canonical([1, 2], to_abstract_test([i64]))
+    assert _convert(li, [i64]) == [1, 2]
+
 
 @pytest.mark.xfail(reason="Cannot pass a function as an argument.")
 @bt()
@@ -401,6 +696,22 @@ def test_return_backend(backend):
     f(33)
 
 
+@bt()
+def test_backend_value_in_tuple(backend):
+    @myia(backend=backend, return_backend=True)
+    def f(a):
+        return a * 2
+
+    @myia(backend=backend)
+    def g(pair):
+        x, y = pair
+        return x + y
+
+    bv = f(np.ones((2, 3)))
+    assert np.all(g((bv, np.ones((2, 3)))) == 3)
+    assert np.all(g((np.ones((2, 3)), bv)) == 3)
+
+
 _flag1 = [False]
 _flag2 = [False]
 
@@ -0,0 +1,219 @@
+import importlib.util
+import json
+import os
+from multiprocessing import Pool
+
+import numpy as np
+
+from myia.api import myia
+from myia.pipeline import CompilationCache, fingerprint
+from myia.testing.common import Point
+from myia.testing.multitest import bt
+
+
+def _f(x, y):
+    return x * y + x
+
+
+def _g(x, y):
+    return x * y - x
+
+
+def test_fingerprint():
+    def f(x):
+        return x + 1
+
+    f1 = f
+
+    def f(x):  # noqa: F811
+        return x + 2
+
+    assert fingerprint(f1) == fingerprint(f1)
+    assert fingerprint(f1) != fingerprint(f)
+    assert fingerprint(_f) != fingerprint(_g)
+
+
+def test_fingerprint_closure():
+    def make(n):
+        def f(x):
+            return x + n
+
+        return f
+
+    assert fingerprint(make(1)) == fingerprint(make(1))
+    assert fingerprint(make(1)) != fingerprint(make(2))
+
+
+class _Scale:
+    def __init__(self, factor):
+        self.factor = factor
+
+
+def test_fingerprint_unidentifiable():
+    def make(scale):
+        def f(x):
+            return x * scale.factor
+
+        return f
+
+    # Two different instances could only be told apart by their address
+    assert fingerprint(make(_Scale(2))) is None
+    assert fingerprint(make(_Scale(2).__init__)) is None
+
+
+class _Config:
+    def __init__(self, factor):
+        self.factor = factor
+
+    def __repr__(self):
+        return "_Config()"
+
+
+def test_fingerprint_custom_repr():
+    def make(config):
+        def f(x):
+            return x * config.factor
+
+        return f
+
+    # The repr does not show factor, so it cannot identify the instance
+    assert fingerprint(make(_Config(2))) is None
+    assert fingerprint(make(np.float32(2))) is not None
+
+
+def test_fingerprint_set():
+    def make(values):
+        def f(x):
+            return x * len(values)
+
+        return f
+
+    # 1 and 9 collide, so the iteration order depends on the insertion order
+    a, b = frozenset([1, 9]), frozenset([9, 1])
+    assert list(a) != list(b)
+    assert fingerprint(make(a)) == fingerprint(make(b))
+    assert fingerprint(make(a)) != fingerprint(make(frozenset([1, 8])))
+
+
+def test_fingerprint_module(tmp_path):
+    path = tmp_path / "_fingerprinted.py"
+
+    def load(source):
+        path.write_text(source)
+        spec = importlib.util.spec_from_file_location("_fingerprinted", path)
+        mod = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(mod)
+
+        def f(x):
+            return mod.scale(x)
+
+        return fingerprint(f)
+
+    fp = load("def scale(x):\n    return x * 2\n")
+    assert fp is not None
+    assert load("def scale(x):\n    return x * 2\n") == fp
+    assert load("def scale(x):\n    return x * 3\n") != fp
+
+
+def test_cache_key_unidentifiable(tmp_path):
+    def f(x):
+        return x * scale.factor
+
+    scale = _Scale(2)
+    cache = CompilationCache(tmp_path)
+    assert cache.key(_f, (), {}) is not None
+    assert cache.key(f, (), {}) is None
+
+
+@bt()
+def test_cache_hit(tmp_path, backend):
+    cache = CompilationCache(tmp_path)
+
+    f1 = myia(_f, backend=backend, cache=cache)
+    assert f1(3, 4) == 15
+    assert cache.stats["misses"] == 1
+    assert cache.stats["stores"] == 1
+
+    # A different MyiaFunction for the same function hits the cache
+    f2 = myia(_f, backend=backend, cache=str(tmp_path))
+    assert f2(5, 6) == 35
+    assert f2.cache.stats["hits"] == 1
+
+    # A different function or argspec misses
+    g = myia(_g, backend=backend, cache=cache)
+    assert g(3, 4) == 9
+    assert f1(3.0, 4.0) == 15.0
+    assert cache.stats["misses"] == 3
+    assert len(cache.entries()) == 3
+
+
+@bt()
+def test_cache_structures(tmp_path, backend):
+    def f(pt, xs):
+        return pt.x * xs[0] + pt.y * xs[1]
+
+    for _ in range(2):
+        cache = CompilationCache(tmp_path)
+        fn = myia(f, backend=backend, cache=cache)
+        res = fn(Point(np.ones((2, 2)), np.ones((2, 2))), (2.0, 3.0))
+        assert (res == np.full((2, 2), 5.0)).all()
+    assert cache.stats["hits"] == 1
+
+
+def test_cache_eviction(tmp_path):
+    cache = CompilationCache(tmp_path, max_entries=2)
+    f = myia(_f, backend="python", cache=cache)
+    f(1, 2)
+    f(1.0, 2.0)
+    f(np.int32(1), np.int32(2))
+    assert cache.stats["evictions"] == 1
+    assert len(cache.entries()) == 2
+    assert len([p for p in os.listdir(tmp_path) if p.endswith(".pkl")]) == 2
+
+    cache.clear()
+    assert cache.entries() == {}
+
+
+def _store_entries(args):
+    path, start = args
+    cache = CompilationCache(path)
+    for i in range(start, start + 10):
+        cache.store(f"key{i}", {"argspec": (i,)})
+
+
+def test_cache_concurrent_stores(tmp_path):
+    with Pool(4) as pool:
+        pool.map(_store_entries, [(str(tmp_path), i * 10) for i in range(4)])
+    cache = CompilationCache(tmp_path)
+    assert len(cache.entries()) == 40
+    assert len([p for p in os.listdir(tmp_path) if p.endswith(".pkl")]) == 40
+
+
+def test_cache_version(tmp_path):
+    cache = CompilationCache(tmp_path)
+    f = myia(_f, backend="python", cache=cache)
+    f(1, 2)
+    assert len(cache.entries()) == 1
+
+    index_path = tmp_path / CompilationCache.index_name
+    index = json.loads(index_path.read_text())
+    index["version"] = "outdated"
+    index_path.write_text(json.dumps(index))
+
+    assert cache.entries() == {}
+    assert not [p for p in os.listdir(tmp_path) if p.endswith(".pkl")]
+
+
+def test_cache_batched(tmp_path):
+    def f(x, y):
+        return x * y
+
+    cache = CompilationCache(tmp_path)
+    xs = np.ones((5, 3))
+    ys = np.full((5, 3), 2.0)
+
+    f1 = myia(f, backend="python", batched=["x"], cache=cache)
+    assert f1(xs, ys).shape == (5, 5, 3)
+    f2 = myia(f, backend="python", batched=["x", "y"], cache=cache)
+    assert f2(xs, ys).shape == (5, 3)
+    assert cache.stats["misses"] == 2
@@ -1,3 +1,5 @@
+import numpy as np
+
 from myia.abstract import from_value
 from myia.operations import (
     array_getitem,
@@ -193,3 +195,46 @@ def test_array_getitem(x):
 @run(MA(4, 5), MB(2, 2))
 def test_array_setitem(x, v):
     return array_setitem(x, (0, 1), (3, 5), (2, 3), v)
+
+
+@run(MA(4, 5), MB(4, 5))
+def test_fused_array_map(x, y):
+    return (x * y + x) * 2.0 - y
+
+
+_W = np.ones((4, 5))
+
+
+@run(MA(4, 5))
+def test_folded_constants(x):
+    return x * (_W * 2.0 + 1.0)
+
+
+def test_fold_constants_count():
+    def f(x):
+        return x * (_W * 2.0 + 1.0)
+
+    pip = standard_pipeline.with_steps(
+        *standard_pipeline[: standard_pipeline.steps.index(steps.step_fold) + 1]
+    )
+
+    def fold(max_size):
+        res = pip.configure({"constant_folder.max_size": max_size})(
+            input=f, argspec=(from_value(MA(4, 5), broaden=True),)
+        )
+        mng = res["resources"].opt_manager
+        cts = [
+            node.value
+            for node in mng.all_nodes
+            if node.is_constant(np.ndarray) and node.value.shape == (4, 5)
+        ]
+        return res["folded"], cts
+
+    folded, (ct,) = fold(10000)
+    assert folded >= 2
+    assert np.all(ct == 3.0)
+
+    # The small constants are folded, but not the 4x5 arrays
+    folded, (ct,) = fold(10)
+    assert folded > 0
+    assert np.all(ct == 1.0)
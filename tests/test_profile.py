@@ -0,0 +1,60 @@
+import json
+
+from myia.api import MyiaFunction, myia
+from myia.profile import CompileProfiler
+from myia.testing.multitest import bt
+
+
+def _f(x, y):
+    return x * y
+
+
+@bt()
+def test_compile_profiler(backend, tmp_path):
+    prof = CompileProfiler(directory=str(tmp_path))
+    f = MyiaFunction(_f, backend=backend, tracer=prof)
+    assert f(2, 3) == 6
+    assert f(4, 5) == 20
+    assert f(2.0, 3.0) == 6.0
+    assert len(prof.reports) == 2
+
+    report = prof.reports[0]
+    assert report.name == "_f"
+    paths = [block["path"] for block in report.blocks]
+    assert "compile/step_parse" in paths
+    assert "compile/step_opt/lap1" in paths
+    assert all(block["time"] >= 0 for block in report.blocks)
+    (parse,) = [b for b in report.blocks if b["path"] == "compile/step_parse"]
+    assert parse["graphs"] >= 1
+    assert parse["nodes"] > 0
+    assert parse["memory"] is not None
+    assert any(rule.startswith("main/") for rule in report.rules)
+    assert report.visits["main"]["passes"] >= 1
+    assert report.visits["main"]["visits"] > 0
+
+    text = report.format()
+    assert "step_opt" in text
+    assert next(iter(report.rules)) in text
+
+    files = sorted(tmp_path.iterdir())
+    assert len(files) == 2
+    data = json.loads(files[0].read_text())
+    assert data["name"] == "_f"
+    assert data["blocks"] == report.blocks
+
+
+@bt()
+def test_compile_profiler_no_memory(backend):
+    prof = CompileProfiler(memory=False)
+    f = MyiaFunction(_f, backend=backend, tracer=prof)
+    assert f(2, 3) == 6
+    (report,) = prof.reports
+    assert all(block["memory"] is None for block in report.blocks)
+
+
+def test_myia_profile(capsys):
+    f = myia(_f, profile=True)
+    assert f(2, 3) == 6
+    assert isinstance(f.tracer, CompileProfiler)
+    assert len(f.tracer.reports) == 1
+    assert "step_parse" in capsys.readouterr().out